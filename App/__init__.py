@@ -1,8 +1,9 @@
-from flask import Flask
-from App.routes import main 
-from flask_cors import CORS
-
 def create_app():
+    # Imported here so `import App.<module>` (workers, pool children, scripts) stays cheap
+    from flask import Flask
+    from flask_cors import CORS
+    from App.routes import main
+
     app = Flask(__name__)
     app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20MB
 
@@ -1,60 +1,233 @@
 
+import asyncio
+import functools
 import hashlib
+import inspect
 import json
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from App.cache_backends import create_backend
+
+# Documents are hashed in blocks so large texts are never encoded in one piece
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def document_hash(text):
+    """SHA-256 of the whole document, streamed in HASH_BLOCK_SIZE blocks."""
+    hasher = hashlib.sha256()
+    for start in range(0, len(text), HASH_BLOCK_SIZE):
+        hasher.update(text[start:start + HASH_BLOCK_SIZE].encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def make_cache_key(text, options=None):
+    """Cache key covering the full document and the options it was processed with."""
+    doc_hash = document_hash(text)
+    if not options:
+        return doc_hash
+    options_blob = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{doc_hash}:{options_blob}".encode("utf-8")).hexdigest()
+
+
+def stage_key(stage, version, text):
+    """Key for one stage's output: document hash + stage name + model/prompt version."""
+    return make_cache_key(text, {"stage": stage, "version": version})
+
+
+class MemoryLRU:
+    """In-process LRU tier bounded by the approximate JSON size of its entries."""
+
+    def __init__(self, max_bytes, ttl_hours=24):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = timedelta(hours=ttl_hours).total_seconds()
+        self._entries = OrderedDict()  # key -> (value, size, created)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[2] > self.ttl_seconds:
+                if entry is not None:
+                    self._remove(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key, value, size, created=None):
+        # Entries larger than the whole tier would only flush everything else out
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, created or time.time())
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
 
 class SimpleCache:
-    def __init__(self, cache_dir="./cache", ttl_hours=24):
-        self.cache_dir = cache_dir
+    """Two-tier cache: an in-process LRU in front of a shared backend (see App.cache_backends)."""
+
+    def __init__(self, backend, ttl_hours=24, memory_bytes=64 * 1024 * 1024):
+        self.backend = backend
         self.ttl_hours = ttl_hours
-        os.makedirs(cache_dir, exist_ok=True)
-    
-    def _get_cache_path(self, key):
-        # Generate a cache filename from the key
-        hashed_key = hashlib.md5(key.encode()).hexdigest()
-        return os.path.join(self.cache_dir, f"{hashed_key}.json")
-    
-    def get(self, text):
-        # Generate a key from the text
-        key = text[:1000]  # Use first 1000 chars as cache key
-        cache_path = self._get_cache_path(key)
-        
-        if not os.path.exists(cache_path):
-            return None
-        
-        # Check if cache entry is still valid
-        file_modified_time = datetime.fromtimestamp(os.path.getmtime(cache_path))
-        if datetime.now() - file_modified_time > timedelta(hours=self.ttl_hours):
-            os.remove(cache_path)  # Remove expired cache
-            return None
-        
-        try:
-            with open(cache_path, 'r') as f:
-                return json.load(f)
-        except Exception:
+        self.memory = MemoryLRU(memory_bytes, ttl_hours)
+
+    def get_key(self, key):
+        # Cached objects are shared between callers; treat them as read-only
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+
+        found = self.backend.get(key)
+        if found is None:
             return None
-    
-    def set(self, text, data):
-        key = text[:1000]
-        cache_path = self._get_cache_path(key)
-        
+        return self._promote(key, *found)
+
+    def get_many_keys(self, keys):
+        """Looks up several keys, fetching all memory misses from the backend in one call."""
+        results, missing = {}, []
+        for key in keys:
+            data = self.memory.get(key)
+            if data is not None:
+                results[key] = data
+            else:
+                missing.append(key)
+
+        if missing:
+            for key, (payload, created) in self.backend.get_many(missing).items():
+                data = self._promote(key, payload, created)
+                if data is not None:
+                    results[key] = data
+        return results
+
+    def set_key(self, key, data):
         try:
-            with open(cache_path, 'w') as f:
-                json.dump(data, f)
-            return True
-        except Exception:
+            payload = json.dumps(data)
+        except (TypeError, ValueError):
+            return False
+
+        if not self.backend.set(key, payload):
             return False
+        self.memory.set(key, data, len(payload))
+        return True
+
+    def _promote(self, key, payload, created):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        self.memory.set(key, data, len(payload), created)  # promote into the memory tier
+        return data
 
-# Create a global cache instance
-document_cache = SimpleCache()
+    def get(self, text, options=None):
+        return self.get_key(make_cache_key(text, options))
 
-def cache_summary(text, data=None):
+    def set(self, text, data, options=None):
+        return self.set_key(make_cache_key(text, options), data)
+
+    def acquire_lock(self, name, token, ttl_seconds):
+        """Cross-worker lock held in the shared backend (see CacheBackend.acquire_lock)."""
+        return self.backend.acquire_lock(name, token, ttl_seconds)
+
+    def release_lock(self, name, token):
+        self.backend.release_lock(name, token)
+
+    def stats(self):
+        """Hit/miss/eviction counters and sizes for both tiers."""
+        return {"memory": self.memory.snapshot(), "backend": self.backend.stats()}
+
+# Create a global cache instance; CACHE_BACKEND picks the shared tier
+document_cache = SimpleCache(
+    create_backend(),
+    ttl_hours=int(os.getenv("CACHE_TTL_HOURS", "24")),
+    memory_bytes=int(os.getenv("CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+)
+
+def cache_summary(text, data=None, **options):
     """
     If data is None, try to get from cache.
     If data is provided, save to cache.
+    Keyword options (flashcards flag, mode, model names...) become part of the key,
+    so the same document processed differently is cached separately.
     """
     if data is None:
-        return document_cache.get(text)
+        return document_cache.get(text, options)
     else:
-        return document_cache.set(text, data)
+        return document_cache.set(text, data, options)
+
+
+def memoize_stage(stage, version, key_func=None, should_cache=bool):
+    """
+    Caches a stage function's result in document_cache, keyed by stage_key.
+    Works on both plain and async functions.
+
+    `key_func` maps the first argument to the text that identifies the input (defaults to
+    the argument itself); `should_cache` filters out failed or empty results. Bump `version`
+    whenever the model or prompt changes so stale results are not reused.
+    The undecorated function stays reachable as `.uncached`.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(source, *args, **kwargs):
+                key_text = key_func(source) if key_func else source
+                if not key_text:
+                    return await func(source, *args, **kwargs)
+
+                # Backend lookups may touch disk or the network; keep them off the event loop
+                key = stage_key(stage, version, key_text)
+                cached = await asyncio.to_thread(document_cache.get_key, key)
+                if cached is not None:
+                    return cached
+
+                result = await func(source, *args, **kwargs)
+                if should_cache(result):
+                    await asyncio.to_thread(document_cache.set_key, key, result)
+                return result
+
+            async_wrapper.uncached = func
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(source, *args, **kwargs):
+            key_text = key_func(source) if key_func else source
+            if not key_text:
+                return func(source, *args, **kwargs)
+
+            key = stage_key(stage, version, key_text)
+            cached = document_cache.get_key(key)
+            if cached is not None:
+                return cached
+
+            result = func(source, *args, **kwargs)
+            if should_cache(result):
+                document_cache.set_key(key, result)
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
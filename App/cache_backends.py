@@ -0,0 +1,565 @@
+"""
+Shared storage tiers for App.cache.
+
+Every backend stores already-serialized JSON payloads under opaque string keys and
+expires them after the configured TTL. The filesystem backend is per machine; the
+SQLite backend can be shared by every worker on one box; the Redis backend is shared
+across boxes.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """Interface implemented by every shared cache tier."""
+
+    name = "base"
+
+    def get(self, key):
+        """Returns (payload, created) or None."""
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        """Returns {key: (payload, created)} for the keys that are present."""
+        found = {}
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None:
+                found[key] = entry
+        return found
+
+    def set(self, key, payload):
+        """Stores a JSON payload and returns True on success."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Removes expired entries; returns how many were removed."""
+        return 0
+
+    def stats(self):
+        return {"backend": self.name}
+
+    def acquire_lock(self, name, token, ttl_seconds):
+        """
+        Takes the named lock for `token` if nobody holds it; returns True on success.
+        Locks expire after `ttl_seconds` so a crashed holder cannot block others forever.
+        """
+        raise NotImplementedError
+
+    def release_lock(self, name, token):
+        """Releases the lock if `token` still holds it."""
+        raise NotImplementedError
+
+    def _start_sweeper(self, interval):
+        if not interval:
+            return
+        sweeper = threading.Thread(target=self._sweep_forever, args=(interval,), daemon=True)
+        sweeper.start()
+
+    def _sweep_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Cache sweeper removed {removed} expired entries from {self.name}")
+            except Exception as e:
+                logger.error(f"Cache sweep failed: {str(e)}")
+
+
+class FilesystemBackend(CacheBackend):
+    """
+    JSON-file tier with a total size cap. When the cap is exceeded, entries are evicted
+    by least-recent ("lru") or least-frequent ("lfu") use. A background thread sweeps
+    expired files so they don't pile up when their key is never read again.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, cache_dir="./cache", ttl_hours=24, max_bytes=1024 * 1024 * 1024,
+                 eviction="lru", sweep_interval=600):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError("eviction must be 'lru' or 'lfu'")
+        self.cache_dir = cache_dir
+        self.ttl_seconds = timedelta(hours=ttl_hours).total_seconds()
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_dir = os.path.join(cache_dir, "locks")
+        os.makedirs(self._lock_dir, exist_ok=True)
+
+        # key -> {"path", "created", "size", "last_access", "hits"}; lets get() skip stat calls
+        self._index = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._load_index()
+        self._start_sweeper(sweep_interval)
+
+    def _get_cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Builds the side index with one directory scan at startup."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                key = entry.name[:-len(".json")]
+                stat = entry.stat()
+                self._index[key] = {
+                    "path": entry.path,
+                    "created": stat.st_mtime,
+                    "size": stat.st_size,
+                    "last_access": stat.st_mtime,
+                    "hits": 0,
+                }
+                self._size += stat.st_size
+
+    def _adopt(self, key):
+        """
+        Indexes an entry written by another process (another worker or a process-pool child).
+        Only reached on index misses, so hits still never stat the file. Caller holds the lock.
+        """
+        path = self._get_cache_path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        meta = {"path": path, "created": stat.st_mtime, "size": stat.st_size,
+                "last_access": stat.st_mtime, "hits": 0}
+        self._index[key] = meta
+        self._size += stat.st_size
+        return meta
+
+    def _is_expired(self, meta, now=None):
+        return (now or time.time()) - meta["created"] > self.ttl_seconds
+
+    def _discard(self, key):
+        """Removes an entry from the index and disk. Caller holds the lock."""
+        meta = self._index.pop(key, None)
+        if meta:
+            self._size -= meta["size"]
+            try:
+                os.remove(meta["path"])
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                meta = self._adopt(key)
+            if meta is None:
+                self.counters["misses"] += 1
+                return None
+
+            # Check if cache entry is still valid
+            if self._is_expired(meta):
+                self._discard(key)  # Remove expired cache
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+
+            meta["last_access"] = time.time()
+            meta["hits"] += 1
+
+        try:
+            with open(meta["path"], 'r') as f:
+                payload = f.read()
+        except OSError:
+            with self._lock:
+                if self._index.get(key) is meta:
+                    self._index.pop(key)
+                    self._size -= meta["size"]
+                self.counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self.counters["hits"] += 1
+        return payload, meta["created"]
+
+    def set(self, key, payload):
+        cache_path = self._get_cache_path(key)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        now = time.time()
+        size = len(payload)
+        with self._lock:
+            old = self._index.get(key)
+            if old:
+                self._size -= old["size"]
+            self._index[key] = {"path": cache_path, "created": now, "size": size, "last_access": now, "hits": 0}
+            self._size += size
+            self._evict_to_fit()
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _evict_to_fit(self):
+        """Evicts entries until the tier fits its size cap. Caller holds the lock."""
+        if self._size <= self.max_bytes:
+            return
+        if self.eviction == "lfu":
+            rank = lambda item: (item[1]["hits"], item[1]["last_access"])
+        else:
+            rank = lambda item: item[1]["last_access"]
+        for key, _ in sorted(self._index.items(), key=rank):
+            if self._size <= self.max_bytes:
+                break
+            self._discard(key)
+            self.counters["evictions"] += 1
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, meta in self._index.items() if self._is_expired(meta, now)]
+            for key in expired:
+                self._discard(key)
+            self.counters["expired"] += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, **self.counters, "entries": len(self._index),
+                    "bytes": self._size, "max_bytes": self.max_bytes, "eviction": self.eviction}
+
+    def _lock_path(self, name):
+        return os.path.join(self._lock_dir, f"{name}.lock")
+
+    def acquire_lock(self, name, token, ttl_seconds):
+        # O_EXCL makes creation atomic across processes; the file holds "<token> <expires>"
+        path = self._lock_path(name)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                holder = self._read_lock(path)
+                if holder is not None and time.time() <= holder[1]:
+                    return False
+                try:
+                    os.remove(path)  # stale: the holder died or overran its ttl
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{token} {time.time() + ttl_seconds}")
+            return True
+        return False
+
+    def _read_lock(self, path):
+        try:
+            with open(path) as f:
+                token, expires = f.read().split()
+            return token, float(expires)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Being written right now; treat it as held
+            return "", time.time() + 1
+
+    def release_lock(self, name, token):
+        path = self._lock_path(name)
+        holder = self._read_lock(path)
+        if holder is not None and holder[0] == token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Single-file SQLite tier that every worker on a machine can share. Each thread keeps
+    its own connection; WAL mode lets readers proceed while another worker writes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path="./cache/cache.db", ttl_hours=24, max_bytes=1024 * 1024 * 1024,
+                 eviction="lru", sweep_interval=600):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError("eviction must be 'lru' or 'lfu'")
+        self.path = path
+        self.ttl_seconds = timedelta(hours=ttl_hours).total_seconds()
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+        self._start_sweeper(sweep_interval)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        conn = self._connect()
+        placeholders = ",".join("?" * len(keys))
+        with conn:
+            rows = conn.execute(
+                f"SELECT key, payload, created FROM cache WHERE key IN ({placeholders}) AND created >= ?",
+                (*keys, cutoff),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE cache SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                    [(now, row[0]) for row in rows],
+                )
+        self._count("hits", len(rows))
+        self._count("misses", len(keys) - len(rows))
+        return {key: (payload, created) for key, payload, created in rows}
+
+    def set(self, key, payload):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, payload, size, created, last_access, hits)"
+                    " VALUES (?, ?, ?, ?, ?, 0)",
+                    (key, payload, len(payload), now, now),
+                )
+                self._evict_to_fit(conn)
+        except sqlite3.Error as e:
+            logger.error(f"SQLite cache write failed: {str(e)}")
+            return False
+        return True
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict_to_fit(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        order = "hits, last_access" if self.eviction == "lfu" else "last_access"
+        evicted = 0
+        for key, size in conn.execute(f"SELECT key, size FROM cache ORDER BY {order}").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def sweep(self):
+        conn = self._connect()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+        self._count("expired", removed)
+        return removed
+
+    def stats(self):
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        with self._lock:
+            return {"backend": self.name, **self.counters, "entries": entries, "bytes": size,
+                    "max_bytes": self.max_bytes, "eviction": self.eviction}
+
+    def acquire_lock(self, name, token, ttl_seconds):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND expires < ?", (name, now))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO locks (name, token, expires) VALUES (?, ?, ?)",
+                (name, token, now + ttl_seconds),
+            ).rowcount
+        return inserted == 1
+
+    def release_lock(self, name, token):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis-protocol tier shared by every worker. Expiry is delegated to Redis TTLs and
+    size-bounded eviction to the server's maxmemory policy. Pass `client` to use an
+    existing connection (e.g. fakeredis); a "fakeredis://" URL builds an in-process one.
+    An unreachable or slow server is logged and read as a miss, so the cache degrades to
+    recomputing instead of failing requests.
+    """
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", ttl_hours=24, prefix="studyme:cache:",
+                 max_connections=20, client=None):
+        self.ttl_seconds = int(timedelta(hours=ttl_hours).total_seconds())
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "errors": 0}
+
+        import redis  # fakeredis raises the same exception types
+        self._unavailable = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+        if client is not None:
+            self.client = client
+        elif url.startswith("fakeredis://"):
+            import fakeredis
+            self.client = fakeredis.FakeRedis()
+        else:
+            pool = redis.ConnectionPool.from_url(url, max_connections=max_connections)
+            self.client = redis.Redis(connection_pool=pool)
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _failed(self, operation, error):
+        logger.warning(f"Redis cache {operation} failed: {str(error)}")
+        with self._lock:
+            self.counters["errors"] += 1
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        # One round trip: value and remaining TTL for every key
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(self._key(key))
+            pipe.ttl(self._key(key))
+        try:
+            replies = pipe.execute()
+        except self._unavailable as e:
+            self._failed("read", e)
+            with self._lock:
+                self.counters["misses"] += len(keys)
+            return {}
+
+        now = time.time()
+        found = {}
+        for i, key in enumerate(keys):
+            payload, remaining = replies[2 * i], replies[2 * i + 1]
+            if payload is None:
+                continue
+            if isinstance(payload, bytes):
+                payload = payload.decode("utf-8")
+            created = now - (self.ttl_seconds - remaining) if remaining and remaining > 0 else now
+            found[key] = (payload, created)
+
+        with self._lock:
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def set(self, key, payload):
+        try:
+            self.client.set(self._key(key), payload, ex=self.ttl_seconds)
+        except self._unavailable as e:
+            self._failed("write", e)
+            return False
+        except Exception as e:
+            logger.error(f"Redis cache write failed: {str(e)}")
+            return False
+        return True
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except self._unavailable as e:
+            self._failed("delete", e)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, **self.counters}
+
+    def acquire_lock(self, name, token, ttl_seconds):
+        return bool(self.client.set(self._key(f"lock:{name}"), token, nx=True, px=int(ttl_seconds * 1000)))
+
+    def release_lock(self, name, token):
+        # Compare-and-delete in a WATCH transaction so we never drop a lock someone else took over
+        key = self._key(f"lock:{name}")
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                holder = pipe.get(key)
+                if holder is not None and holder.decode("utf-8") == token:
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+            except Exception as e:
+                # Lost a race (WatchError) or Redis is down; the ttl releases it anyway
+                logger.warning(f"Redis lock release failed: {str(e)}")
+
+
+def create_backend(name=None):
+    """Builds the backend selected by CACHE_BACKEND (filesystem, sqlite or redis)."""
+    name = (name or os.getenv("CACHE_BACKEND", "filesystem")).strip().lower()
+    ttl_hours = int(os.getenv("CACHE_TTL_HOURS", "24"))
+    max_bytes = int(os.getenv("CACHE_DISK_MB", "1024")) * 1024 * 1024
+    eviction = os.getenv("CACHE_EVICTION", "lru")
+    sweep_interval = int(os.getenv("CACHE_SWEEP_SECONDS", "600"))
+    cache_dir = os.getenv("CACHE_DIR", "./cache")
+
+    if name == "filesystem":
+        return FilesystemBackend(cache_dir, ttl_hours, max_bytes, eviction, sweep_interval)
+    if name == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH", os.path.join(cache_dir, "cache.db"))
+        return SQLiteBackend(path, ttl_hours, max_bytes, eviction, sweep_interval)
+    if name == "redis":
+        return RedisBackend(
+            os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+            ttl_hours,
+            max_connections=int(os.getenv("CACHE_REDIS_MAX_CONNECTIONS", "20")),
+        )
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
@@ -0,0 +1,129 @@
+"""
+Token-aware chunking for the summarization model.
+
+Chunk sizes are measured in real tokenizer tokens for the DistilBART model, and
+every piece of text is tokenized once, so chunking stays linear in the input.
+"""
+import re
+
+from App.registry import registry
+
+TOKENIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+
+# Leave room for the <s> / </s> special tokens in the model's 1024 positions
+DEFAULT_CHUNK_TOKENS = 1000
+
+# Once a chunk is this full, prefer to close it at the next paragraph end
+PARAGRAPH_FLUSH_RATIO = 0.75
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+@registry.resource("tokenizer")
+def load_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(TOKENIZER_MODEL)
+
+
+def get_tokenizer():
+    """Loads the summarization tokenizer on first use."""
+    return registry.get("tokenizer")
+
+
+def count_tokens(text):
+    """Number of model tokens in `text`, without special tokens."""
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def iter_sentences(source):
+    """
+    Yields (sentence, paragraph_end) pairs from a string or an iterable of strings
+    (e.g. pages coming out of extraction). Each string is treated as its own paragraph block.
+    """
+    if isinstance(source, str):
+        source = [source]
+
+    for block in source:
+        for paragraph in _PARAGRAPH_SPLIT.split(block):
+            sentences = [" ".join(s.split()) for s in _SENTENCE_SPLIT.split(paragraph)]
+            sentences = [s for s in sentences if s]
+            for i, sentence in enumerate(sentences):
+                yield sentence, i == len(sentences) - 1
+
+
+def _split_long_sentence(sentence, chunk_size, count):
+    """Splits a sentence that alone exceeds chunk_size into word runs that fit."""
+    piece, piece_tokens = [], 0
+    for word in sentence.split():
+        word_tokens = count(" " + word)
+        if piece and piece_tokens + word_tokens > chunk_size:
+            yield " ".join(piece), piece_tokens
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield " ".join(piece), piece_tokens
+
+
+def iter_chunks(source, chunk_size=DEFAULT_CHUNK_TOKENS, overlap=0, count=count_tokens):
+    """
+    Streams chunks of at most `chunk_size` tokens from a string or an iterable of strings.
+
+    Chunks end on sentence boundaries, and on a paragraph boundary once they are mostly full.
+    `overlap` carries up to that many tokens of trailing sentences into the next chunk.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
+    current = []  # (sentence, tokens, paragraph_end)
+    current_tokens = 0
+    fresh = False  # whether current holds anything beyond carried-over overlap
+
+    def render(parts):
+        out = []
+        for i, (sentence, _, paragraph_end) in enumerate(parts):
+            out.append(sentence)
+            if i < len(parts) - 1:
+                out.append("\n\n" if paragraph_end else " ")
+        return "".join(out)
+
+    def carry_over(parts):
+        kept, kept_tokens = [], 0
+        for part in reversed(parts):
+            if kept_tokens + part[1] > overlap:
+                break
+            kept.insert(0, part)
+            kept_tokens += part[1]
+        return kept, kept_tokens
+
+    for sentence, paragraph_end in iter_sentences(source):
+        tokens = count(" " + sentence)
+
+        if tokens > chunk_size:
+            pieces = [(p, t, False) for p, t in _split_long_sentence(sentence, chunk_size, count)]
+            pieces[-1] = (pieces[-1][0], pieces[-1][1], paragraph_end)
+        else:
+            pieces = [(sentence, tokens, paragraph_end)]
+
+        for piece in pieces:
+            if current_tokens + piece[1] > chunk_size:
+                if fresh:
+                    yield render(current)
+                    current, current_tokens = carry_over(current) if overlap else ([], 0)
+                    fresh = False
+                # Overlap must never push a chunk past the limit on its own
+                while current and current_tokens + piece[1] > chunk_size:
+                    current_tokens -= current.pop(0)[1]
+
+            current.append(piece)
+            current_tokens += piece[1]
+            fresh = True
+
+            if piece[2] and current_tokens >= chunk_size * PARAGRAPH_FLUSH_RATIO:
+                yield render(current)
+                current, current_tokens = carry_over(current) if overlap else ([], 0)
+                fresh = False
+
+    if fresh:
+        yield render(current)
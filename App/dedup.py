@@ -0,0 +1,118 @@
+"""
+Upload deduplication by content hash.
+
+Maps the SHA-256 of an uploaded file's raw bytes to its extracted document (pages, blocks
+and tables in App.document's compact form), so a byte-identical re-upload skips
+PyPDF2/OCR entirely. Downstream results (summary, explanation, flashcards, full pipeline
+output) are keyed on the document's flat text, so they are found in the cache too.
+"""
+import asyncio
+import hashlib
+import time
+
+from App.cache import document_cache, stage_key
+from App.executors import run_cpu
+from App.metrics import metrics
+from App.document import Document
+from App.reader import docx_document, pdf_document, pptx_document
+
+# Bump when extraction output changes so old entries stop matching
+EXTRACTION_VERSION = "extract-v3"
+
+# Builders of an App.document.Document per supported file type
+EXTRACTORS = {
+    "pdf": pdf_document,
+    "docx": docx_document,
+    "pptx": pptx_document,
+}
+
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """SHA-256 of a file's bytes, read in blocks."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _upload_key(sha256, file_type):
+    return stage_key(f"upload-{file_type}", EXTRACTION_VERSION, sha256)
+
+
+def _extractor(file_type):
+    if file_type not in EXTRACTORS:
+        raise ValueError("Unsupported file type!")
+    return EXTRACTORS[file_type]
+
+
+def lookup_extraction(sha256, file_type):
+    """Returns the cached Document for these bytes, or None. Hits count the extraction time they saved."""
+    entry = document_cache.get_key(_upload_key(sha256, file_type))
+    if entry is None:
+        metrics.incr("dedup.misses")
+        return None
+    metrics.incr("dedup.hits")
+    metrics.incr("dedup.extract_seconds_saved", entry.get("extract_seconds", 0.0))
+    return Document.from_compact(entry["document"])
+
+
+def store_extraction(sha256, file_type, document, seconds):
+    # Empty extractions may come from transient OCR failures; don't pin them
+    if document.text.strip():
+        document_cache.set_key(
+            _upload_key(sha256, file_type),
+            {"document": document.to_compact(), "extract_seconds": seconds},
+        )
+
+
+def extract_document(path, file_type, sha256=None):
+    """Extracts a file on disk into a Document, skipping extraction for bytes seen before."""
+    extractor = _extractor(file_type)
+    sha256 = sha256 or file_sha256(path)
+
+    document = lookup_extraction(sha256, file_type)
+    if document is not None:
+        return document
+
+    start = time.perf_counter()
+    document = extractor(path)
+    store_extraction(sha256, file_type, document, time.perf_counter() - start)
+    return document
+
+
+def extract_file(path, file_type, sha256=None):
+    """Extracts text from a file on disk, skipping extraction for bytes seen before."""
+    return extract_document(path, file_type, sha256).text
+
+
+async def extract_upload_document(upload, file_type):
+    """Route version of extract_document for an IngestedUpload; extraction runs in the process pool."""
+    extractor = _extractor(file_type)
+
+    document = await asyncio.to_thread(lookup_extraction, upload.sha256, file_type)
+    if document is not None:
+        return document
+
+    start = time.perf_counter()
+    document = await run_cpu(extractor, upload.path)
+    await asyncio.to_thread(store_extraction, upload.sha256, file_type, document, time.perf_counter() - start)
+    return document
+
+
+async def extract_upload(upload, file_type):
+    return (await extract_upload_document(upload, file_type)).text
+
+
+def dedup_stats():
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("dedup.hits", 0)
+    misses = counters.get("dedup.misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "extract_seconds_saved": round(counters.get("dedup.extract_seconds_saved", 0.0), 3),
+    }
@@ -0,0 +1,161 @@
+"""
+Structured extraction output: a document is a list of pages (PDF pages, slides, or one
+section for a DOCX), each holding text, table and speaker-notes blocks.
+
+Every page and block knows its [start, end) character offsets in `Document.text`, the flat
+string the extract_* functions have always returned, so a chunk or search hit can be
+mapped back to its page without re-parsing. Pages can be produced lazily: the reader's
+iter_*_pages generators yield one Page at a time, and Document.from_pages only computes
+offsets as it consumes them.
+
+to_compact()/from_compact() turn a document into nested lists of plain values (offsets
+are recomputed on load, not stored), which is what the upload dedup cache keeps.
+"""
+from bisect import bisect_right
+
+TEXT, TABLE, NOTES = "text", "table", "notes"
+
+# How blocks are joined inside a page, per page kind; pages are always joined by PAGE_SEPARATOR
+BLOCK_SEPARATORS = {"page": "\n\n", "section": "\n\n", "slide": "\n"}
+PAGE_SEPARATOR = "\n\n"
+NOTES_LABEL = "\n📝 Speaker Notes:\n"
+
+COMPACT_VERSION = 1
+
+
+class Block:
+    __slots__ = ("kind", "text", "rows", "start", "end")
+
+    def __init__(self, kind, text, rows=None):
+        self.kind = kind
+        self.text = text
+        self.rows = rows  # table cells, row by row; None for other blocks
+        self.start = self.end = None
+
+    def render(self):
+        return NOTES_LABEL + self.text if self.kind == NOTES else self.text
+
+    def __repr__(self):
+        return f"Block({self.kind!r}, {self.text[:30]!r}, start={self.start})"
+
+
+def table_block(rows):
+    """A table block from rows of cell strings; empty cells are dropped as in the flat text."""
+    rows = [[cell for cell in row if cell] for row in rows]
+    rows = [row for row in rows if row]
+    if not rows:
+        return None
+    return Block(TABLE, "\n".join(" | ".join(row) for row in rows), rows)
+
+
+class Page:
+    __slots__ = ("number", "kind", "method", "blocks", "start", "end")
+
+    def __init__(self, number, kind, blocks, method="text"):
+        self.number = number
+        self.kind = kind  # "page", "slide" or "section"
+        self.method = method  # for PDFs: "text", "ocr" or "empty"
+        self.blocks = [block for block in blocks if block is not None and block.text]
+        self.start = self.end = None
+
+    @property
+    def empty(self):
+        return not self.blocks
+
+    def render(self):
+        return BLOCK_SEPARATORS[self.kind].join(block.render() for block in self.blocks)
+
+    def __repr__(self):
+        return f"Page({self.number}, {self.kind!r}, blocks={len(self.blocks)}, start={self.start})"
+
+
+class Document:
+    """Pages plus the flat text view; built by Document.from_pages."""
+
+    __slots__ = ("source_type", "pages", "text", "_starts")
+
+    def __init__(self, source_type, pages, text):
+        self.source_type = source_type
+        self.pages = pages
+        self.text = text
+        self._starts = [page.start for page in pages if not page.empty]
+
+    @classmethod
+    def from_pages(cls, source_type, pages):
+        """Consumes an iterable of Pages, assigning offsets into the flat text as it goes."""
+        parts = []
+        position = 0
+        kept = []
+        for page in pages:
+            kept.append(page)
+            if page.empty:
+                page.start = page.end = position
+                continue
+            if parts:
+                parts.append(PAGE_SEPARATOR)
+                position += len(PAGE_SEPARATOR)
+            page.start = position
+            separator = BLOCK_SEPARATORS[page.kind]
+            for i, block in enumerate(page.blocks):
+                if i:
+                    parts.append(separator)
+                    position += len(separator)
+                rendered = block.render()
+                # The offsets cover the block's own text, not the notes label in front of it
+                block.start = position + len(rendered) - len(block.text)
+                block.end = position + len(rendered)
+                parts.append(rendered)
+                position += len(rendered)
+            page.end = position
+        return cls(source_type, kept, "".join(parts))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def iter_blocks(self, kind=None):
+        """Yields (page, block) in document order, optionally only blocks of one kind."""
+        for page in self.pages:
+            for block in page.blocks:
+                if kind is None or block.kind == kind:
+                    yield page, block
+
+    def page_texts(self):
+        """Each non-empty page's text; chunk_text accepts this directly and keeps page breaks."""
+        return [self.text[page.start:page.end] for page in self.pages if not page.empty]
+
+    def tables(self):
+        return [block for _, block in self.iter_blocks(TABLE)]
+
+    def page_at(self, offset):
+        """The page containing character `offset` of the flat text (or the one before a gap)."""
+        pages = [page for page in self.pages if not page.empty]
+        index = bisect_right(self._starts, offset) - 1
+        return pages[max(0, index)] if pages else None
+
+    def to_compact(self):
+        """Plain nested lists: [version, type, [[number, kind, method, [[kind, text, rows], ...]], ...]]."""
+        return [
+            COMPACT_VERSION,
+            self.source_type,
+            [
+                [page.number, page.kind, page.method,
+                 [[block.kind, block.text] + ([block.rows] if block.rows is not None else []) for block in page.blocks]]
+                for page in self.pages
+            ],
+        ]
+
+    @classmethod
+    def from_compact(cls, data):
+        version, source_type, pages = data
+        if version != COMPACT_VERSION:
+            raise ValueError(f"Unsupported document format version: {version}")
+        return cls.from_pages(source_type, (
+            Page(number, kind, [Block(*block) for block in blocks], method)
+            for number, kind, method, blocks in pages
+        ))
+
+    def __repr__(self):
+        return f"Document({self.source_type!r}, pages={len(self.pages)}, chars={len(self.text)})"
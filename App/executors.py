@@ -0,0 +1,94 @@
+"""
+Execution pools that keep blocking work off the event loop.
+
+- run_io: a bounded thread pool for blocking network/SDK calls (SerpAPI, cache backends).
+- run_cpu: a process pool for PyPDF2/OCR/docx/pptx parsing and DistilBART inference, so
+  CPU-bound work neither holds the GIL nor stalls other requests on the same worker.
+- get_fanout_pool: a process pool one call can split its own work across (PDF text layers,
+  OCR windows). It runs inside run_cpu workers, so it is sized to their share of the cores.
+"""
+import asyncio
+import functools
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from App.metrics import metrics
+
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+# Each CPU worker that summarizes holds its own model copy, so keep this small
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Processes per fan-out pool; every CPU worker may hold one, so the default splits the cores
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", str(max(1, (os.cpu_count() or 1) // max(1, CPU_WORKERS)))))
+
+_io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+_cpu_pool = None
+_cpu_lock = threading.Lock()
+_fanout_pool = None
+
+
+def get_cpu_pool():
+    """Starts the process pool on first use. Uses spawn so children never inherit locks held by threads."""
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _cpu_lock:
+            if _cpu_pool is None:
+                _cpu_pool = ProcessPoolExecutor(
+                    max_workers=CPU_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _cpu_pool
+
+
+def get_fanout_pool():
+    """
+    Process pool for splitting one call's work, started on first use and then reused by
+    later calls in the same process. Spawn, like the CPU pool: this usually runs inside a
+    run_cpu worker, and forking one that has threads running can deadlock the child.
+    """
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _cpu_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ProcessPoolExecutor(
+                    max_workers=FANOUT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                # A pool worker exits through multiprocessing's shutdown, which joins child
+                # processes without running the executor's atexit hook. Stop the pool first,
+                # ahead of the queue finalizers (priority 10) it needs to reach its workers
+                multiprocessing.util.Finalize(None, _fanout_pool.shutdown, exitpriority=100)
+    return _fanout_pool
+
+
+async def run_io(func, *args, **kwargs):
+    """Runs a blocking I/O-bound call on the thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_pool, functools.partial(func, *args, **kwargs))
+
+
+def _call_collecting_metrics(func, args, kwargs):
+    """Runs in the pool worker; ships the metrics the call recorded back with its result."""
+    metrics.drain()  # drop anything left over from work outside a run_cpu call
+    result = func(*args, **kwargs)
+    return result, metrics.drain()
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Runs a CPU-bound call in the process pool. `func` and its arguments must be picklable."""
+    loop = asyncio.get_running_loop()
+    result, recorded = await loop.run_in_executor(get_cpu_pool(), _call_collecting_metrics, func, args, kwargs)
+    metrics.merge(recorded)
+    return result
+
+
+def shutdown_executors():
+    """Stops every pool; called on application shutdown."""
+    global _cpu_pool, _fanout_pool
+    _io_pool.shutdown(wait=False, cancel_futures=True)
+    with _cpu_lock:
+        for pool in (_cpu_pool, _fanout_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = _fanout_pool = None
@@ -1,22 +1,20 @@
+import asyncio
 import json 
 import os 
 from dotenv import load_dotenv
-from openai import OpenAI
 import re
+from App.cache import document_cache, memoize_stage, stage_key
+from App.llm import llm
+from App.jsonstream import aiter_completion_events, iter_completion_events, replay
 
 
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+FLASHCARDS_MODEL = "gpt-4o"
+# Bump when the model or prompt changes
+FLASHCARDS_VERSION = f"{FLASHCARDS_MODEL}:prompt-v1"
 
 
-def flashcards(text):
-    response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """ 
+FLASHCARDS_PROMPT = """ 
                          I want you to go through the whole text and try and 
                          extract the most important things , from concepts to definitionss, examples , facts and details , think like a teacher 
                          and take in consideration mutiple test worthy question from the text and develop a a question with multi -choice and also 
@@ -49,15 +47,25 @@ def flashcards(text):
                                     ]
                          } 
                          """
-                    },
 
-                    {
-                        "role": "user",
-                        "content": text
-                    }
-                ]
-        )
-    answer = response.choices[0].message.content.strip()
+
+def flashcards_messages(text):
+    return [
+        {
+            "role": "system",
+            "content": FLASHCARDS_PROMPT
+        },
+
+        {
+            "role": "user",
+            "content": text
+        }
+    ]
+
+
+def parse_flashcards(answer):
+    """Parses the model's answer into {"Cards": [...], "MCQ": [...]}, empty on bad JSON."""
+    answer = answer.strip()
     try:
         clean_text = answer.replace("```json", "").replace("```", "").strip()
         parsed_response = json.loads(clean_text)
@@ -77,4 +85,70 @@ def flashcards(text):
     except json.JSONDecodeError:
         print("Error: Openapi did not return valid JSON")
         print("Raw Response:", answer)
-        return {"Cards": [], "MCQ": []}
\ No newline at end of file
+        return {"Cards": [], "MCQ": []}
+
+
+def _has_cards(result):
+    return bool(result["Cards"] or result["MCQ"])
+
+
+@memoize_stage("flashcards", FLASHCARDS_VERSION, should_cache=_has_cards)
+def flashcards(text):
+    response = llm.chat(
+                model=FLASHCARDS_MODEL,
+                messages=flashcards_messages(text)
+        )
+    return parse_flashcards(response.choices[0].message.content)
+
+
+@memoize_stage("flashcards", FLASHCARDS_VERSION, should_cache=_has_cards)
+async def flashcards_async(text):
+    """Same as flashcards, using the async client so the event loop is never blocked."""
+    response = await llm.achat(
+                model=FLASHCARDS_MODEL,
+                messages=flashcards_messages(text)
+        )
+    return parse_flashcards(response.choices[0].message.content)
+
+
+def iter_flashcards(text):
+    """
+    Streams flashcards, yielding ("item", "Cards" | "MCQ", card) as each card closes, then
+    ("result", None, {"Cards": [...], "MCQ": [...]}) like flashcards(). Shares its cache.
+    """
+    key = stage_key("flashcards", FLASHCARDS_VERSION, text)
+    cached = document_cache.get_key(key)
+    if cached is not None:
+        yield from replay(cached)
+        yield "result", None, cached
+        return
+
+    parts = []
+    stream = llm.chat_stream(model=FLASHCARDS_MODEL, messages=flashcards_messages(text))
+    yield from iter_completion_events(stream, parts)
+
+    result = parse_flashcards("".join(parts))
+    if _has_cards(result):
+        document_cache.set_key(key, result)
+    yield "result", None, result
+
+
+async def aiter_flashcards(text):
+    """Async version of iter_flashcards."""
+    key = stage_key("flashcards", FLASHCARDS_VERSION, text)
+    cached = await asyncio.to_thread(document_cache.get_key, key)
+    if cached is not None:
+        for event in replay(cached):
+            yield event
+        yield "result", None, cached
+        return
+
+    parts = []
+    stream = llm.achat_stream(model=FLASHCARDS_MODEL, messages=flashcards_messages(text))
+    async for event in aiter_completion_events(stream, parts):
+        yield event
+
+    result = parse_flashcards("".join(parts))
+    if _has_cards(result):
+        await asyncio.to_thread(document_cache.set_key, key, result)
+    yield "result", None, result
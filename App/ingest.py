@@ -0,0 +1,66 @@
+"""
+Streaming upload ingestion.
+
+Uploads are copied to disk in fixed-size chunks while being hashed and size-checked,
+so a request never holds the whole file in memory and oversized uploads are rejected
+as soon as they cross the limit instead of after being read in full.
+"""
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, UploadFile
+
+from App.executors import run_io
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "40"))
+
+
+class IngestedUpload:
+    """An upload that has been written to `path`, with its SHA-256 and size in bytes."""
+
+    def __init__(self, path, sha256, size, filename=None):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.filename = filename
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@asynccontextmanager
+async def ingest_upload(file: UploadFile, suffix, max_size_mb=MAX_UPLOAD_MB):
+    """
+    Streams `file` to a temporary file and yields an IngestedUpload; the file is removed on exit.
+    Raises 413 as soon as the upload exceeds `max_size_mb`.
+    """
+    max_size = max_size_mb * 1024 * 1024
+    hasher = hashlib.sha256()
+    size = 0
+
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    upload = IngestedUpload(tmp.name, None, 0, file.filename)
+    try:
+        with tmp:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {max_size_mb}MB."
+                    )
+                hasher.update(chunk)
+                await run_io(tmp.write, chunk)
+
+        upload.sha256 = hasher.hexdigest()
+        upload.size = size
+        yield upload
+    finally:
+        upload.cleanup()
@@ -0,0 +1,341 @@
+"""
+Background jobs for full document processing.
+
+POST /jobs stores the upload and queues a job; worker threads claim jobs by priority and
+run App.pipelines.process_file outside any HTTP request; clients poll GET /jobs/{id} and
+fetch GET /jobs/{id}/result. Jobs live in SQLite, so they survive restarts.
+
+Run workers as their own process, `python -m App.jobs`, next to the API. A job's
+extraction and summarization run in the worker's own threads, so workers inside the API
+process (JOB_WORKERS > 0) compete with request handling for the same cores; that is only
+meant for local development.
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from App.metrics import metrics
+from App.pipelines import process_file
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./cache/jobs.db")
+JOBS_UPLOAD_DIR = os.getenv("JOBS_UPLOAD_DIR", "./cache/job_uploads")
+# Worker threads started inside the API process; 0 leaves jobs to `python -m App.jobs`
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))
+# Worker threads in a standalone `python -m App.jobs` process
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# A worker refreshes each running job's heartbeat this often; every worker also sweeps for
+# stale jobs at the same interval
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+# A running job whose heartbeat is older than this lost its worker and is handed to another
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobStore:
+    """SQLite-backed job table. Each thread keeps its own connection, as in SQLiteBackend."""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0,"
+                " file_path TEXT NOT NULL, file_type TEXT NOT NULL, filename TEXT,"
+                " generate_flashcards INTEGER NOT NULL DEFAULT 0,"
+                " submitted REAL NOT NULL, started REAL, finished REAL, worker TEXT,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, heartbeat REAL)"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat" not in columns:  # databases created before heartbeats
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, submitted)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, file_path, file_type, generate_flashcards=False, priority=0, filename=None):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, file_path, file_type, filename, generate_flashcards, submitted)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, priority, file_path, file_type, filename, int(generate_flashcards), time.time()),
+            )
+        metrics.incr("jobs.submitted")
+        self.record_depth()
+        return job_id
+
+    def claim(self, worker):
+        """Atomically takes the highest-priority, oldest queued job; returns its row or None."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, heartbeat = ?, worker = ? WHERE id = ("
+                " SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, submitted LIMIT 1"
+                ") AND status = ? RETURNING *",
+                (RUNNING, now, now, worker, QUEUED, QUEUED),
+            ).fetchone()
+        if row is not None:
+            self.record_depth()
+        return row
+
+    def get(self, job_id):
+        return self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def finish(self, job_id, status, result=None, error=None, worker=None):
+        """
+        Records the outcome unless the job was cancelled meanwhile; returns the final status,
+        or None if the job is no longer running on `worker` (e.g. it went stale and was requeued).
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested THEN ? ELSE ? END, finished = ?,"
+                " result = CASE WHEN cancel_requested THEN NULL ELSE ? END,"
+                " error = CASE WHEN cancel_requested THEN NULL ELSE ? END"
+                " WHERE id = ? AND status = ? AND (? IS NULL OR worker = ?) RETURNING status",
+                (CANCELLED, status, time.time(), json.dumps(result) if result is not None else None,
+                 error, job_id, RUNNING, worker, worker),
+            ).fetchone()
+        return row["status"] if row else None
+
+    def heartbeat(self, job_id, worker):
+        """Marks a running job as still alive; returns False once `worker` no longer holds it."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ? AND worker = ?",
+                (time.time(), job_id, RUNNING, worker),
+            ).rowcount > 0
+
+    def cancel(self, job_id):
+        """
+        Queued jobs are cancelled at once. A running job cannot be interrupted mid-stage;
+        it is flagged and its result discarded when the worker finishes. Returns the new status.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ? RETURNING status, file_path",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            ).fetchone()
+            if row is None:
+                row = conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ? RETURNING status",
+                    (job_id, RUNNING),
+                ).fetchone()
+        if row is None:
+            job = self.get(job_id)
+            return job["status"] if job else None
+        if row["status"] == CANCELLED:
+            metrics.incr("jobs.cancelled")
+            remove_upload(row["file_path"])
+            self.record_depth()
+        return row["status"]
+
+    def requeue_stale(self, max_age=JOB_STALE_SECONDS):
+        """
+        Puts back running jobs whose worker died, judged by heartbeat age rather than run time,
+        so long jobs on a live worker are left alone. Dead jobs that were being cancelled are
+        cancelled instead. Returns the number requeued.
+        """
+        now = time.time()
+        cutoff = now - max_age
+        with self._connect() as conn:
+            count = conn.execute(
+                "UPDATE jobs SET status = ?, started = NULL, heartbeat = NULL, worker = NULL"
+                " WHERE status = ? AND COALESCE(heartbeat, started) < ? AND cancel_requested = 0",
+                (QUEUED, RUNNING, cutoff),
+            ).rowcount
+            cancelled = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?"
+                " WHERE status = ? AND COALESCE(heartbeat, started) < ? AND cancel_requested = 1"
+                " RETURNING file_path",
+                (CANCELLED, now, RUNNING, cutoff),
+            ).fetchall()
+        for row in cancelled:
+            metrics.incr("jobs.cancelled")
+            remove_upload(row["file_path"])
+        if count:
+            logger.warning(f"Requeued {count} stale jobs")
+            metrics.incr("jobs.requeued", count)
+        if count or cancelled:
+            self.record_depth()
+        return count
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def record_depth(self):
+        counts = self.counts()
+        metrics.gauge("jobs.queue_depth", counts.get(QUEUED, 0))
+        metrics.gauge("jobs.running", counts.get(RUNNING, 0))
+
+
+def job_view(row):
+    """Public status of a job (without its result)."""
+    now = time.time()
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "cancel_requested": bool(row["cancel_requested"]),
+        "priority": row["priority"],
+        "filename": row["filename"],
+        "file_type": row["file_type"],
+        "submitted": row["submitted"],
+        "queued_seconds": round((row["started"] or row["finished"] or now) - row["submitted"], 3),
+        "run_seconds": round((row["finished"] or now) - row["started"], 3) if row["started"] else None,
+        "error": row["error"],
+    }
+
+
+class JobWorker(threading.Thread):
+    """Claims jobs and runs them one at a time until stopped."""
+
+    def __init__(self, store, name=None):
+        super().__init__(name=name or f"job-worker-{uuid.uuid4().hex[:6]}", daemon=True)
+        self.store = store
+        self._stop_event = threading.Event()
+        self._next_sweep = 0.0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sweep()
+            try:
+                job = self.store.claim(self.name)
+            except sqlite3.Error as e:
+                logger.error(f"Job claim failed: {str(e)}")
+                job = None
+            if job is None:
+                self._stop_event.wait(JOB_POLL_SECONDS)
+                continue
+            self.run_job(job)
+
+    def sweep(self):
+        """Requeues jobs of dead workers, at most once per JOB_HEARTBEAT_SECONDS."""
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + JOB_HEARTBEAT_SECONDS
+        try:
+            self.store.requeue_stale()
+        except sqlite3.Error as e:
+            logger.error(f"Stale job sweep failed: {str(e)}")
+
+    def _beat(self, job_id, done):
+        while not done.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                if not self.store.heartbeat(job_id, self.name):
+                    return  # finished, cancelled or taken over
+            except sqlite3.Error as e:
+                logger.error(f"Heartbeat for job {job_id} failed: {str(e)}")
+
+    def run_job(self, job):
+        metrics.observe("jobs.wait_time", job["started"] - job["submitted"])
+        logger.info(f"Job {job['id']} started on {self.name}")
+        start = time.perf_counter()
+        done = threading.Event()
+        threading.Thread(target=self._beat, args=(job["id"], done), name=f"{self.name}-heartbeat", daemon=True).start()
+        try:
+            result = process_file(job["file_path"], job["file_type"], bool(job["generate_flashcards"]))
+            if isinstance(result, dict) and "error" in result and len(result) == 1:
+                status = self.store.finish(job["id"], FAILED, error=result["error"], worker=self.name)
+            else:
+                status = self.store.finish(job["id"], DONE, result=result, worker=self.name)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            status = self.store.finish(job["id"], FAILED, error=str(e), worker=self.name)
+        finally:
+            done.set()
+
+        metrics.observe("jobs.run_time", time.perf_counter() - start)
+        metrics.observe("jobs.latency", time.time() - job["submitted"])
+        if status is None:
+            # Its heartbeat lapsed (e.g. the database stayed locked) and it was requeued meanwhile;
+            # whichever worker holds it now records the outcome
+            logger.warning(f"Job {job['id']} was taken over before {self.name} finished it")
+            metrics.incr("jobs.superseded")
+            return
+        metrics.incr(f"jobs.{status}")
+        self.store.record_depth()
+        remove_upload(job["file_path"])
+
+
+def store_upload(path, suffix):
+    """Moves an ingested upload into the jobs directory so it outlives the request."""
+    os.makedirs(JOBS_UPLOAD_DIR, exist_ok=True)
+    target = os.path.join(JOBS_UPLOAD_DIR, f"{uuid.uuid4().hex}{suffix}")
+    shutil.move(path, target)
+    return target
+
+
+def remove_upload(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_store = None
+_workers = []
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore()
+    return _store
+
+
+def start_workers(count=JOB_WORKERS):
+    store = get_job_store()
+    # Workers requeue jobs of dead workers themselves (see JobWorker.sweep)
+    for _ in range(count):
+        worker = JobWorker(store)
+        worker.start()
+        _workers.append(worker)
+    if count:
+        logger.info(f"Started {count} job workers")
+
+
+def stop_workers():
+    for worker in _workers:
+        worker.stop()
+    _workers.clear()
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python -m App.jobs [threads]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    start_workers(int(sys.argv[1]) if len(sys.argv) > 1 else JOB_WORKER_THREADS)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        stop_workers()
@@ -0,0 +1,182 @@
+"""
+Incremental parser for the JSON objects our LLM prompts return.
+
+Fed the completion text piece by piece as tokens stream in, it reports each element
+of a top-level array as soon as that element closes, and each top-level field as soon
+as its value is complete, e.g. every flashcard in "Cards" long before the answer ends.
+Text before the first "{" and after the closing "}" (Markdown fences) is ignored.
+"""
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class JSONStreamParser:
+    """
+    feed() returns a list of events:
+      ("item", key, value)   an element of the top-level array `key` has closed
+      ("field", key, value)  the top-level field `key` is complete
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.escape = False
+
+        self.expect = "key"  # top level: key -> colon -> value -> comma -> key ...
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        self.value_kind = None  # "string" | "array" | "object" | "literal"
+        self.elem_start = None
+        self.elem_kind = None
+
+    def feed(self, chunk):
+        events = []
+        self.text += chunk
+        while self.pos < len(self.text) and not self.done:
+            self._step(self.text[self.pos], self.pos, events)
+            self.pos += 1
+        return events
+
+    def _in_array(self):
+        return self.value_kind == "array"
+
+    def _load(self, start, end):
+        try:
+            return True, json.loads(self.text[start:end])
+        except ValueError:
+            return False, None
+
+    def _emit_field(self, end, events):
+        ok, value = self._load(self.value_start, end)
+        if ok:
+            events.append(("field", self.key, value))
+        self.value_start = self.value_kind = None
+        self.expect = "comma"
+
+    def _emit_item(self, end, events):
+        ok, value = self._load(self.elem_start, end)
+        if ok:
+            events.append(("item", self.key, value))
+        self.elem_start = self.elem_kind = None
+
+    def _step(self, ch, i, events):
+        if not self.started:
+            if ch == "{":
+                self.started = True
+                self.depth = 1
+            return
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                self._string_closed(i, events)
+            return
+
+        if ch == '"':
+            self.in_string = True
+            if self.depth == 1 and self.expect == "key":
+                self.key_start = i
+            elif self.depth == 1 and self.expect == "value":
+                self.value_start, self.value_kind = i, "string"
+            elif self.depth == 2 and self._in_array() and self.elem_start is None:
+                self.elem_start, self.elem_kind = i, "string"
+            return
+
+        if ch in "{[":
+            if self.depth == 1 and self.expect == "value":
+                self.value_start, self.value_kind = i, ("array" if ch == "[" else "object")
+            elif self.depth == 2 and self._in_array() and self.elem_start is None:
+                self.elem_start, self.elem_kind = i, "container"
+            self.depth += 1
+            return
+
+        if ch in "}]":
+            if self.depth == 2 and self._in_array() and self.elem_kind == "literal":
+                self._emit_item(i, events)
+            if self.depth == 1 and self.value_kind == "literal":
+                self._emit_field(i, events)
+            self.depth -= 1
+            if self.depth == 0:
+                self.done = True
+            elif self.depth == 1 and self.value_kind in ("array", "object"):
+                self._emit_field(i + 1, events)
+            elif self.depth == 2 and self._in_array() and self.elem_kind == "container":
+                self._emit_item(i + 1, events)
+            return
+
+        if ch == ",":
+            if self.depth == 1:
+                if self.value_kind == "literal":
+                    self._emit_field(i, events)
+                self.expect = "key"
+            elif self.depth == 2 and self._in_array() and self.elem_kind == "literal":
+                self._emit_item(i, events)
+            return
+
+        if ch == ":" and self.depth == 1:
+            self.expect = "value"
+            return
+
+        if ch in _WHITESPACE:
+            return
+
+        # Start of a number / true / false / null
+        if self.depth == 1 and self.expect == "value" and self.value_start is None:
+            self.value_start, self.value_kind = i, "literal"
+        elif self.depth == 2 and self._in_array() and self.elem_start is None:
+            self.elem_start, self.elem_kind = i, "literal"
+
+    def _string_closed(self, i, events):
+        if self.depth == 1 and self.expect == "key":
+            ok, key = self._load(self.key_start, i + 1)
+            self.key = key if ok else None
+            self.expect = "colon"
+        elif self.depth == 1 and self.value_kind == "string":
+            self._emit_field(i + 1, events)
+        elif self.depth == 2 and self._in_array() and self.elem_kind == "string":
+            self._emit_item(i + 1, events)
+
+
+def replay(result):
+    """The events a parser would have produced for an already-complete result (e.g. from cache)."""
+    events = []
+    for key, value in result.items():
+        if isinstance(value, list):
+            events.extend(("item", key, item) for item in value)
+        events.append(("field", key, value))
+    return events
+
+
+def _delta(chunk):
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def iter_completion_events(stream, parts):
+    """Parses a streamed chat completion as it arrives; appends the raw text to `parts`."""
+    parser = JSONStreamParser()
+    for chunk in stream:
+        delta = _delta(chunk)
+        parts.append(delta)
+        yield from parser.feed(delta)
+
+
+async def aiter_completion_events(stream, parts):
+    """Async version of iter_completion_events for AsyncOpenAI streams."""
+    parser = JSONStreamParser()
+    async for chunk in stream:
+        delta = _delta(chunk)
+        parts.append(delta)
+        for event in parser.feed(delta):
+            yield event
@@ -0,0 +1,501 @@
+"""
+Shared gateway for every OpenAI call.
+
+All call sites go through pooled HTTP clients (one for threads, one per event loop), one
+requests/min and tokens/min token bucket, one cap on concurrent calls that threads and
+coroutines draw from together, jittered exponential
+backoff on 429 / 5xx / connection errors, a deadline per call that covers every retry, and
+a circuit breaker that fails fast while the API keeps failing instead of piling up waiters.
+
+Point LLM_BASE_URL at any OpenAI-compatible server (e.g. a local mock) to redirect all calls.
+"""
+import asyncio
+import logging
+import weakref
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from dotenv import load_dotenv
+
+from App.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_REQUESTS_PER_MIN = float(os.getenv("LLM_REQUESTS_PER_MIN", "500"))
+LLM_TOKENS_PER_MIN = float(os.getenv("LLM_TOKENS_PER_MIN", "30000"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Total time a call may take, retries and backoff included
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Completion size assumed when reserving tokens/min before the real usage is known
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "1500"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Base class for failures raised by the gateway itself."""
+
+
+class CircuitOpenError(LLMError):
+    """The breaker is open: recent calls kept failing, so this one was not attempted."""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """The call (including retries) did not finish within its deadline."""
+
+
+class RateBucket:
+    """
+    Token bucket refilled at `per_minute`. reserve() never blocks: it takes the amount,
+    letting the balance go negative, and returns how long the caller must wait for it,
+    so the same bucket serves threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        with self.lock:
+            self._refill()
+            # A single request larger than the bucket still goes through once it is full
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount):
+        """Gives back (positive) or takes more (negative) once the real cost is known."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ConcurrencyLimit:
+    """
+    A semaphore shared by threads and coroutines on any event loop. Waiters are served in
+    arrival order; release() hands the slot straight to the next one, waking a thread
+    through an Event or a coroutine through its loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (loop or None, Future or Event)
+
+    def _take(self):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._take():
+                return
+            waiter = (None, threading.Event())
+            self._waiters.append(waiter)
+        waiter[1].wait()  # release() transferred its slot to us
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take():
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                self.release()  # the slot arrived as we were cancelled; pass it on
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, handle = self._waiters.popleft()
+                if loop is None:
+                    handle.set()
+                    return
+                try:
+                    loop.call_soon_threadsafe(_hand_over, handle)
+                    return
+                except RuntimeError:
+                    continue  # its loop is closed; try the next waiter
+            self.in_use -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+def _hand_over(future):
+    if not future.done():
+        future.set_result(None)
+    # A future cancelled in the meantime is noticed by aacquire, which releases the slot
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; lets one trial call through after `reset` seconds."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset=LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self):
+        """Raises CircuitOpenError unless the call may go ahead; returns True if it is the half-open trial."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+        metrics.incr("llm.breaker_rejected")
+        raise CircuitOpenError("LLM circuit breaker is open after repeated failures")
+
+    def abandon_trial(self):
+        """
+        The trial call ended without an answer from the API (cancelled, deadline, a bug):
+        count it as failed so the breaker stays open for another `reset` seconds instead
+        of waiting forever on a trial that will never report back.
+        """
+        with self.lock:
+            if self.trial_running:
+                self.trial_running = False
+                self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.consecutive >= self.failures:
+                if self.opened_at is None:
+                    logger.warning(f"LLM circuit breaker opened after {self.consecutive} failures")
+                    metrics.incr("llm.breaker_opened")
+                self.opened_at = time.monotonic()
+
+
+def _sdk():
+    # The openai package takes most of a second to import; only pay for it on the first call
+    import openai
+    return openai
+
+
+def is_retryable(error):
+    openai = _sdk()
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def estimate_tokens(kwargs):
+    """Rough prompt + completion size (4 characters per token) for the tokens/min bucket."""
+    chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+    return chars // 4 + (kwargs.get("max_tokens") or LLM_COMPLETION_ESTIMATE)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    chat() / achat() return a completion; chat_stream() / achat_stream() yield chunks.
+    Clients and connection pools are created on first use.
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, api_key=None, max_connections=LLM_MAX_CONNECTIONS,
+                 max_concurrency=LLM_MAX_CONCURRENCY, requests_per_min=LLM_REQUESTS_PER_MIN,
+                 tokens_per_min=LLM_TOKENS_PER_MIN, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.requests = RateBucket(requests_per_min)
+        self.tokens = RateBucket(tokens_per_min)
+        self.breaker = CircuitBreaker()
+        # One cap for threads and coroutines together, so in-flight calls never exceed it
+        self._slots = ConcurrencyLimit(max_concurrency)
+        self._client = None
+        # httpx.AsyncClient pools are tied to the loop that created them
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # === Clients ===
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def _client_kwargs(self):
+        return {
+            "api_key": self.api_key or os.getenv("OPENAI_API_KEY"),
+            "base_url": self.base_url,
+            "max_retries": 0,  # retries are ours, so they respect the deadline and the breaker
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    http = httpx.Client(limits=self._limits(), timeout=httpx.Timeout(self.deadline, connect=LLM_CONNECT_TIMEOUT))
+                    self._client = _sdk().OpenAI(http_client=http, **self._client_kwargs())
+        return self._client
+
+    @property
+    def async_client(self):
+        """The client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            http = httpx.AsyncClient(limits=self._limits(), timeout=httpx.Timeout(self.deadline, connect=LLM_CONNECT_TIMEOUT))
+            client = self._async_clients[loop] = _sdk().AsyncOpenAI(http_client=http, **self._client_kwargs())
+        return client
+
+    # === Shared retry policy ===
+
+    def _admit(self, kwargs):
+        """Breaker check plus rate reservation; returns (seconds to wait, reserved tokens, is trial)."""
+        trial = self.breaker.allow()
+        reserved = estimate_tokens(kwargs)
+        wait = max(self.requests.reserve(1), self.tokens.reserve(reserved))
+        if wait:
+            metrics.observe("llm.rate_limited_wait", wait)
+        return wait, reserved, trial
+
+    def _refund(self, reserved, request=False):
+        """Gives back an attempt's reservation: the tokens of a failed attempt, which the API does
+        not bill, and also the request slot when the attempt was never sent."""
+        self.tokens.adjust(reserved)
+        if request:
+            self.requests.adjust(1)
+
+    def _settle(self, reserved, usage):
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(reserved - usage.total_tokens)
+            metrics.incr("llm.tokens", usage.total_tokens)
+
+    def _backoff(self, error, attempt, deadline_at):
+        """Seconds to sleep before the next attempt, or re-raises when out of retries or time."""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            raise error
+        delay = _retry_after(error)
+        if delay is None:
+            # Full jitter keeps a burst of failed callers from retrying in lockstep
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        if time.monotonic() + delay >= deadline_at:
+            raise LLMDeadlineExceeded(f"LLM call gave up after {attempt + 1} attempts: {error}") from error
+        metrics.incr("llm.retries")
+        logger.warning(f"LLM call failed ({error}), retrying in {delay:.2f}s")
+        return delay
+
+    def _remaining(self, deadline_at):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"LLM call exceeded its {self.deadline}s deadline")
+        return remaining
+
+    def _record_failure(self, error):
+        metrics.incr(f"llm.errors.{type(error).__name__}")
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # The API answered (e.g. a 400), so it is up
+            self.breaker.record_success()
+
+    # === Sync ===
+
+    def _call(self, create, kwargs, deadline_at):
+        OpenAIError = _sdk().OpenAIError
+        attempt = 0
+        while True:
+            wait, reserved, trial = self._admit(kwargs)
+            reported = sent = False
+            try:
+                if time.monotonic() + wait >= deadline_at:
+                    raise LLMDeadlineExceeded("LLM rate limit wait exceeds the call deadline")
+                time.sleep(wait)
+                try:
+                    timeout = self._remaining(deadline_at)
+                    sent = True
+                    with metrics.timer("llm.call"):
+                        result = create(timeout=timeout, **kwargs)
+                    self.breaker.record_success()
+                    reported = True
+                    return result, reserved
+                except OpenAIError as e:
+                    self._refund(reserved)
+                    self._record_failure(e)
+                    reported = True
+                    delay = self._backoff(e, attempt, deadline_at)
+            finally:
+                if not sent:
+                    # Gave up (deadline, cancellation) before the request went out
+                    self._refund(reserved, request=True)
+                # Cancellation, deadlines and unexpected errors must not leave the trial slot taken
+                if trial and not reported:
+                    self.breaker.abandon_trial()
+            time.sleep(delay)
+            attempt += 1
+
+    def chat(self, deadline=None, **kwargs):
+        """chat.completions.create through the gateway."""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        with self._slots:
+            response, reserved = self._call(self.client.chat.completions.create, kwargs, deadline_at)
+        self._settle(reserved, response.usage)
+        return response
+
+    def chat_stream(self, deadline=None, **kwargs):
+        """
+        Streaming chat.completions.create. Failures while opening the stream are retried;
+        once chunks are flowing, errors propagate. The deadline still bounds the whole stream.
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        kwargs = {**kwargs, "stream": True, "stream_options": {"include_usage": True}}
+        with self._slots:
+            stream, reserved = self._call(self.client.chat.completions.create, kwargs, deadline_at)
+            usage = None
+            try:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    yield chunk
+                    self._remaining(deadline_at)
+            finally:
+                stream.close()
+        self._settle(reserved, usage)
+
+    # === Async ===
+
+    async def _acall(self, create, kwargs, deadline_at):
+        OpenAIError = _sdk().OpenAIError
+        attempt = 0
+        while True:
+            wait, reserved, trial = self._admit(kwargs)
+            reported = sent = False
+            try:
+                if time.monotonic() + wait >= deadline_at:
+                    raise LLMDeadlineExceeded("LLM rate limit wait exceeds the call deadline")
+                await asyncio.sleep(wait)
+                try:
+                    timeout = self._remaining(deadline_at)
+                    sent = True
+                    with metrics.timer("llm.call"):
+                        result = await create(timeout=timeout, **kwargs)
+                    self.breaker.record_success()
+                    reported = True
+                    return result, reserved
+                except OpenAIError as e:
+                    self._refund(reserved)
+                    self._record_failure(e)
+                    reported = True
+                    delay = self._backoff(e, attempt, deadline_at)
+            finally:
+                if not sent:
+                    # Gave up (deadline, cancellation) before the request went out
+                    self._refund(reserved, request=True)
+                # Cancellation, deadlines and unexpected errors must not leave the trial slot taken
+                if trial and not reported:
+                    self.breaker.abandon_trial()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def achat(self, deadline=None, **kwargs):
+        """Async chat()."""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        async with self._slots:
+            response, reserved = await self._acall(self.async_client.chat.completions.create, kwargs, deadline_at)
+        self._settle(reserved, response.usage)
+        return response
+
+    async def achat_stream(self, deadline=None, **kwargs):
+        """Async chat_stream()."""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        kwargs = {**kwargs, "stream": True, "stream_options": {"include_usage": True}}
+        async with self._slots:
+            stream, reserved = await self._acall(self.async_client.chat.completions.create, kwargs, deadline_at)
+            usage = None
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    yield chunk
+                    self._remaining(deadline_at)
+            finally:
+                await stream.close()
+        self._settle(reserved, usage)
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "in_flight": self._slots.in_use,
+            "consecutive_failures": self.breaker.consecutive,
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens, 1),
+        }
+
+
+llm = LLMGateway()
@@ -2,6 +2,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from App.routes import router
 from App.middleware import RateLimitMiddleware
+from App.ratelimit import parse_route_costs
+from App.executors import shutdown_executors
+from App.jobs import JOB_WORKERS, start_workers, stop_workers
+from App.registry import registry
 from App.utils import check_environment_variables
 from dotenv import load_dotenv
 import os
@@ -33,11 +37,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add rate limiting (10 requests per minute)
-app.add_middleware(RateLimitMiddleware, max_requests=10, window_seconds=60)
+# Add rate limiting (10 requests per minute by default; RATE_LIMIT_BACKEND=redis shares it across workers)
+app.add_middleware(
+    RateLimitMiddleware,
+    max_requests=int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "10")),
+    window_seconds=int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60")),
+    route_costs=parse_route_costs(os.getenv("RATE_LIMIT_ROUTE_COSTS")),
+    # Job polling and status routes have their own budget (see App.ratelimit.STATUS_ROUTES)
+    status_max_requests=int(os.getenv("RATE_LIMIT_STATUS_MAX_REQUESTS", "120")),
+)
 
 app.include_router(router)
 
+
+@app.on_event("startup")
+def start_job_workers():
+    if JOB_WORKERS:
+        start_workers(JOB_WORKERS)
+    else:
+        logger.info("No in-process job workers; run `python -m App.jobs` to process /jobs")
+
+@app.on_event("startup")
+def warm_up_models():
+    # MODEL_WARMUP=summarizer,tokenizer (or "all") loads models now instead of on the first request
+    registry.warm_up_from_env()
+
+@app.on_event("shutdown")
+def stop_executors():
+    stop_workers()
+    shutdown_executors()
+
 @app.get("/")
 def root():
     return {"message": "StudyMe API running 🚀"}
@@ -0,0 +1,217 @@
+"""
+Map-reduce explain and flashcards for documents beyond a single model call.
+
+Long documents are split with chunk_text, every chunk is explained / turned into flashcards
+concurrently (at most MAP_REDUCE_CONCURRENCY calls in flight per document), and the partial
+results are merged with duplicate bullets, note lines and cards removed. Latency then follows
+the number of parallel calls rather than the document's total token count. Documents that
+fit in one chunk go through the single-call functions exactly as before. Either way the
+text first goes through App.prefilter, so boilerplate and repeats are never paid for.
+
+Per-chunk results are memoized by explain()/flashcards(), so a document that shares pages
+with an earlier one only pays for the chunks that are new.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from App.flashcards import aiter_flashcards, flashcards, flashcards_async
+from App.jsonstream import replay
+from App.metrics import metrics
+from App.prefilter import prefilter_text
+from App.summarizer import aiter_explanation, chunk_text, explain, explain_async, iter_explanation
+
+logger = logging.getLogger(__name__)
+
+# Chunk size for the map step, in summarizer-tokenizer tokens (close enough to the LLM's)
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", "6000"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+
+
+def split_for_map(text):
+    """The map-step chunks for `text`, or None when it fits in a single call."""
+    # Every token covers at least one byte, so short texts skip tokenization entirely
+    if len(text.encode("utf-8")) <= MAP_CHUNK_TOKENS:
+        return None
+    chunks = chunk_text(text, chunk_size=MAP_CHUNK_TOKENS)
+    return chunks if len(chunks) > 1 else None
+
+
+def _survivors(stage, results):
+    """Drops failed chunks; the document only fails if every chunk did."""
+    failed = [r for r in results if isinstance(r, Exception)]
+    metrics.incr(f"mapreduce.{stage}.chunks", len(results))
+    if failed:
+        metrics.incr(f"mapreduce.{stage}.failed_chunks", len(failed))
+        logger.warning(f"{stage}: {len(failed)}/{len(results)} chunks failed, first error: {failed[0]}")
+        if len(failed) == len(results):
+            raise failed[0]
+    return [r for r in results if not isinstance(r, Exception)]
+
+
+def map_chunks(func, chunks, stage):
+    """Runs `func` over the chunks on up to MAP_REDUCE_CONCURRENCY threads, results in chunk order."""
+    def call(chunk):
+        try:
+            return func(chunk)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(MAP_REDUCE_CONCURRENCY, len(chunks)), thread_name_prefix="map") as pool:
+        with metrics.timer(f"mapreduce.{stage}.map"):
+            results = list(pool.map(call, chunks))
+    return _survivors(stage, results)
+
+
+async def amap_chunks(afunc, chunks, stage):
+    """Async map_chunks: at most MAP_REDUCE_CONCURRENCY coroutines awaiting the model at once."""
+    budget = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+
+    async def call(chunk):
+        async with budget:
+            return await afunc(chunk)
+
+    with metrics.timer(f"mapreduce.{stage}.map"):
+        results = await asyncio.gather(*(call(chunk) for chunk in chunks), return_exceptions=True)
+    return _survivors(stage, results)
+
+
+# === Reduce ===
+
+def _norm(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def _unique(items, key=_norm):
+    seen = set()
+    out = []
+    for item in items:
+        k = key(item)
+        if not k or k in seen:
+            continue
+        seen.add(k)
+        out.append(item)
+    return out
+
+
+def _merge_notes(notes):
+    # Chunks overlap in topic, so the same note line often comes back from several of them
+    if notes and all(isinstance(n, list) for n in notes):
+        return _unique(line for n in notes for line in n)
+
+    seen = set()
+    sections = []
+    for n in notes:
+        lines = []
+        for line in (n if isinstance(n, list) else str(n).splitlines()):
+            k = _norm(line)
+            if k and k in seen:
+                continue
+            seen.add(k)
+            lines.append(str(line))
+        section = "\n".join(lines).strip()
+        if section:
+            sections.append(section)
+    return "\n\n".join(sections)
+
+
+def merge_explanations(parts):
+    """Reduces per-chunk explanations into one, in document order. None if no chunk parsed."""
+    parts = [p for p in parts if isinstance(p, dict)]
+    if not parts:
+        return None
+    return {
+        "bullets": _unique(b for p in parts for b in p.get("bullets") or []),
+        "explanation": "\n\n".join(str(p["explanation"]) for p in parts if p.get("explanation")),
+        "Notes": _merge_notes([p["Notes"] for p in parts if p.get("Notes")]),
+    }
+
+
+def _question(card):
+    return _norm(card.get("Question", "")) if isinstance(card, dict) else _norm(card)
+
+
+def merge_flashcards(parts):
+    """Reduces per-chunk flashcards, dropping cards and MCQs that ask the same question."""
+    parts = [p for p in parts if isinstance(p, dict)]
+    return {
+        "Cards": _unique((c for p in parts for c in p.get("Cards") or []), key=_question),
+        "MCQ": _unique((q for p in parts for q in p.get("MCQ") or []), key=_question),
+    }
+
+
+# === Document-level entry points ===
+
+def prepare(text):
+    """(text for the LLM, map chunks or None): boilerplate and repeats removed, then split."""
+    text = prefilter_text(text)
+    return text, split_for_map(text)
+
+
+def explain_document(text):
+    """explain() for text of any length."""
+    text, chunks = prepare(text)
+    if chunks is None:
+        return explain(text)
+    return merge_explanations(map_chunks(explain, chunks, "explain"))
+
+
+async def explain_document_async(text):
+    text, chunks = await asyncio.to_thread(prepare, text)
+    if chunks is None:
+        return await explain_async(text)
+    return merge_explanations(await amap_chunks(explain_async, chunks, "explain"))
+
+
+def flashcards_document(text):
+    """flashcards() for text of any length."""
+    text, chunks = prepare(text)
+    if chunks is None:
+        return flashcards(text)
+    return merge_flashcards(map_chunks(flashcards, chunks, "flashcards"))
+
+
+async def flashcards_document_async(text):
+    text, chunks = await asyncio.to_thread(prepare, text)
+    if chunks is None:
+        return await flashcards_async(text)
+    return merge_flashcards(await amap_chunks(flashcards_async, chunks, "flashcards"))
+
+
+def _merged_events(result):
+    events = replay(result) if result else []
+    events.append(("result", None, result))
+    return events
+
+
+def iter_explanation_document(text):
+    """
+    iter_explanation() for text of any length. Long documents yield their events once the
+    reduce step is done, since merged bullets depend on every chunk.
+    """
+    text, chunks = prepare(text)
+    if chunks is None:
+        yield from iter_explanation(text)
+        return
+    yield from _merged_events(merge_explanations(map_chunks(explain, chunks, "explain")))
+
+
+async def aiter_explanation_document(text):
+    text, chunks = await asyncio.to_thread(prepare, text)
+    if chunks is None:
+        async for event in aiter_explanation(text):
+            yield event
+        return
+    for event in _merged_events(merge_explanations(await amap_chunks(explain_async, chunks, "explain"))):
+        yield event
+
+
+async def aiter_flashcards_document(text):
+    text, chunks = await asyncio.to_thread(prepare, text)
+    if chunks is None:
+        async for event in aiter_flashcards(text):
+            yield event
+        return
+    for event in _merged_events(merge_flashcards(await amap_chunks(flashcards_async, chunks, "flashcards"))):
+        yield event
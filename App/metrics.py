@@ -0,0 +1,90 @@
+"""
+In-process counters and timings, exposed through GET /metrics.
+
+Timings keep count/total/max plus a bounded window of recent samples for percentiles.
+Work done in the process pool records into the child's registry; App.executors drains
+it after each call and merges it back here, so the API process sees everything.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+SAMPLE_WINDOW = 1024
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._timings = {}  # name -> [count, total, max, recent samples]
+        self._gauges = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = [0, 0.0, 0.0, deque(maxlen=SAMPLE_WINDOW)]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            timings = {}
+            for name, (count, total, longest, samples) in self._timings.items():
+                ordered = sorted(samples)
+                timings[name] = {
+                    "count": count,
+                    "total": round(total, 4),
+                    "avg": round(total / count, 4) if count else 0.0,
+                    "max": round(longest, 4),
+                    "p50": round(ordered[len(ordered) // 2], 4) if ordered else 0.0,
+                    "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4) if ordered else 0.0,
+                }
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges), "timings": timings}
+
+    def drain(self):
+        """Returns the raw state recorded so far and resets it (used in pool workers)."""
+        with self._lock:
+            raw = {
+                "counters": dict(self._counters),
+                "timings": {name: [t[0], t[1], t[2], list(t[3])] for name, t in self._timings.items()},
+            }
+            self._counters.clear()
+            self._timings.clear()
+            return raw
+
+    def merge(self, raw):
+        """Adds state drained from another process."""
+        with self._lock:
+            for name, amount in raw.get("counters", {}).items():
+                self._counters[name] += amount
+            for name, (count, total, longest, samples) in raw.get("timings", {}).items():
+                timing = self._timings.get(name)
+                if timing is None:
+                    timing = self._timings[name] = [0, 0.0, 0.0, deque(maxlen=SAMPLE_WINDOW)]
+                timing[0] += count
+                timing[1] += total
+                timing[2] = max(timing[2], longest)
+                timing[3].extend(samples)
+
+
+metrics = Metrics()
@@ -1,36 +1,67 @@
 
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
-import time
-from collections import defaultdict
+from starlette.routing import Match
+import asyncio
 from fastapi.responses import JSONResponse
+from App.ratelimit import STATUS_ROUTES, create_limiter, parse_route_costs, retry_after_header, route_cost
+
+
+def route_template(request: Request):
+    """
+    The path template of the route that will serve `request` ("/jobs/{job_id}"), or the
+    raw path when nothing matches. Middleware runs before routing, so it looks the route up itself.
+    """
+    app = request.scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return request.url.path
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, max_requests: int = 10, window_seconds: int = 60):
+    """
+    Per-client rate limiting with GCRA (see App.ratelimit): O(1) per request, bounded memory,
+    and optionally shared across workers through Redis. `max_requests` is the budget per
+    `window_seconds`; expensive routes spend more of it according to `route_costs`, looked up
+    by route template. Polling and status routes (STATUS_ROUTES) draw on their own budget of
+    `status_max_requests` instead.
+    """
+    def __init__(self, app, max_requests: int = 10, window_seconds: int = 60, route_costs=None, limiter=None,
+                 status_max_requests: int = 120, status_limiter=None):
         super().__init__(app)
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.request_counts = defaultdict(list)
+        self.route_costs = route_costs if route_costs is not None else parse_route_costs(None)
+        self.limiter = limiter if limiter is not None else create_limiter(max_requests, window_seconds)
+        self.status_limiter = (
+            status_limiter if status_limiter is not None else create_limiter(status_max_requests, window_seconds)
+        )
         
     async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        # Clean old requests outside the time window
-        self.request_counts[client_ip] = [
-            timestamp for timestamp in self.request_counts[client_ip] 
-            if current_time - timestamp < self.window_seconds
-        ]
-        
+        client_ip = request.client.host if request.client else "unknown"
+        template = route_template(request)
+        cost = route_cost(self.route_costs, request.method, template)
+        if cost <= 0:
+            return await call_next(request)
+
+        limiter, key = self.limiter, client_ip
+        if f"{request.method} {template}" in STATUS_ROUTES:
+            limiter, key = self.status_limiter, f"status:{client_ip}"
+
+        if limiter.blocking:
+            allowed, retry_after = await asyncio.to_thread(limiter.check, key, cost)
+        else:
+            allowed, retry_after = limiter.check(key, cost)
+
         # Check if rate limit exceeded
-        if len(self.request_counts[client_ip]) >= self.max_requests:
+        if not allowed:
             return JSONResponse(
                 content={"error": "Rate limit exceeded. Please try again later."},
-                status_code=429
+                status_code=429,
+                headers={"Retry-After": retry_after_header(retry_after)},
             )
         
-        # Add current request timestamp
-        self.request_counts[client_ip].append(current_time)
-        
         # Process the request
         return await call_next(request)
@@ -0,0 +1,511 @@
+"""
+Summarization model server: one set of model copies shared by every API worker.
+
+    python -m App.model_server [--address /tmp/studyme-model.sock] [--processes 2] [--threads 4]
+
+The server runs a fixed number of inference processes, each loading the configured
+summarization backend once and limited to its own torch thread budget. API workers send
+chunks over a local multiprocessing.connection channel (unix socket or host:port) instead of
+loading DistilBART themselves; set SUMMARIZER_SERVER to the same address to switch them over.
+
+A dispatcher thread micro-batches chunks across all concurrent requests: it waits for an
+idle inference process, takes the oldest pending chunk plus up to MODEL_SERVER_MAX_BATCH - 1
+others of the closest length (waiting at most MODEL_SERVER_MAX_WAIT_MS for more to arrive),
+and sends that batch. The server and the API should share SUMMARIZER_BACKEND so cache
+entries are versioned for the backend that actually produced them.
+
+multiprocessing.connection pickles its messages, so a connection is only as safe as its
+authkey: set MODEL_SERVER_AUTHKEY on both sides, or leave it unset and the server writes a
+random key to MODEL_SERVER_AUTHKEY_FILE (mode 0600) for clients of the same user to read.
+The unix socket is created 0600, and TCP addresses other than loopback are refused unless
+MODEL_SERVER_ALLOW_REMOTE is set (which also requires an explicit MODEL_SERVER_AUTHKEY).
+"""
+import ipaddress
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, wait
+
+from App.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Address of a running model server; empty means every process loads its own model
+SUMMARIZER_SERVER = os.getenv("SUMMARIZER_SERVER", "")
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", SUMMARIZER_SERVER or "/tmp/studyme-model.sock")
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()
+MODEL_SERVER_AUTHKEY_FILE = os.getenv("MODEL_SERVER_AUTHKEY_FILE", "/tmp/studyme-model.key")
+MODEL_SERVER_ALLOW_REMOTE = os.getenv("MODEL_SERVER_ALLOW_REMOTE", "false").lower() in ("1", "true", "yes")
+MODEL_SERVER_PROCESSES = int(os.getenv("MODEL_SERVER_PROCESSES", "2"))
+# Torch threads per inference process; 0 splits the machine's cores evenly between them
+MODEL_SERVER_THREADS = int(os.getenv("MODEL_SERVER_THREADS", "0"))
+MODEL_SERVER_MAX_BATCH = int(os.getenv("MODEL_SERVER_MAX_BATCH", "8"))
+MODEL_SERVER_MAX_WAIT_MS = float(os.getenv("MODEL_SERVER_MAX_WAIT_MS", "10"))
+# How long a client waits for its chunks before giving up on the connection
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "300"))
+
+
+def parse_address(address):
+    """"host:port" becomes a TCP address; anything else is a unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def is_loopback(address):
+    if isinstance(address, str):
+        return True  # unix socket
+    host = address[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def write_authkey(path=MODEL_SERVER_AUTHKEY_FILE):
+    """A fresh random key, written owner-only to `path` for local clients."""
+    key = secrets.token_hex(32)
+    if os.path.lexists(path):
+        os.remove(path)
+    # O_EXCL refuses to follow a symlink planted in place of the file
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    return key.encode()
+
+
+def read_authkey(path=MODEL_SERVER_AUTHKEY_FILE):
+    try:
+        info = os.stat(path)
+        with open(path) as f:
+            key = f.read().strip()
+    except OSError:
+        raise RuntimeError(
+            f"No model server key: set MODEL_SERVER_AUTHKEY or start the server so it writes {path}"
+        ) from None
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"Refusing model server key {path}: it must belong to this user with mode 0600")
+    return key.encode()
+
+
+# --- inference processes ---------------------------------------------------
+
+def inference_main(conn, threads):
+    """Entry point of one inference process: load the model, then summarize batches until told to stop."""
+    threads = str(threads)
+    # Must be set before torch / ONNX Runtime are imported to take effect
+    os.environ["SUMMARIZER_THREADS"] = threads
+    os.environ["OMP_NUM_THREADS"] = threads
+    from App.summarizer import SUMMARY_MODEL
+    from App.summary_backends import create_summarization_backend
+
+    backend = create_summarization_backend(SUMMARY_MODEL)
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        batch_id, texts, max_length, min_length = message
+        try:
+            conn.send(("result", batch_id, True, backend.summarize(texts, max_length=max_length, min_length=min_length)))
+        except Exception as e:
+            conn.send(("result", batch_id, False, str(e)))
+
+
+class InferenceProcess:
+    def __init__(self, index, threads):
+        self.index = index
+        self.threads = threads
+        self.ready = False
+        self.batch = None  # (batch_id, items, started) while it is working
+        self.generation = 0  # bumped on restart so stale idle entries are ignored
+        self.start()
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=inference_main, args=(child_conn, self.threads),
+            name=f"model-worker-{self.index}", daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.batch = None
+        self.generation += 1
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class PendingChunk:
+    __slots__ = ("text", "words", "future", "enqueued")
+
+    def __init__(self, text):
+        self.text = text
+        self.words = len(text.split())
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class ModelServer:
+    def __init__(self, processes=MODEL_SERVER_PROCESSES, threads=MODEL_SERVER_THREADS,
+                 max_batch=MODEL_SERVER_MAX_BATCH, max_wait_ms=MODEL_SERVER_MAX_WAIT_MS):
+        from App.summarizer import summary_lengths  # only the server needs the summarizer settings
+
+        self.summary_lengths = summary_lengths
+        self.threads = threads or max(1, (os.cpu_count() or 1) // processes)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.idle = queue.Queue()
+        # worker.batch and restarts are touched by both the dispatch and the result thread
+        self._lock = threading.Lock()
+        self.workers = [InferenceProcess(i, self.threads) for i in range(processes)]
+        self._next_batch = 0
+        self._stopping = threading.Event()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until every inference process has loaded its model; drops those that died trying."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        loading = list(self.workers)
+        while loading:
+            handles = {}
+            for worker in loading:
+                handles[worker.conn] = handles[worker.process.sentinel] = worker
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready = wait(list(handles), timeout=remaining)
+            if not ready:
+                raise TimeoutError("Inference processes did not finish loading in time")
+            for worker in {handles[obj] for obj in ready}:
+                loading.remove(worker)
+                try:
+                    worker.conn.recv()
+                except (EOFError, OSError):
+                    logger.error(f"Inference process {worker.index} exited while loading the model")
+                    continue
+                self._mark_ready(worker)
+        self.workers = [w for w in self.workers if w.ready]
+        if not self.workers:
+            raise RuntimeError("No inference process could load the summarization model")
+
+    def _mark_ready(self, worker):
+        worker.ready = True
+        self.idle.put((worker, worker.generation))
+        logger.info(f"Inference process {worker.index} ready ({self.threads} threads)")
+
+    def start(self):
+        threading.Thread(target=self._dispatch_loop, name="model-dispatch", daemon=True).start()
+        threading.Thread(target=self._result_loop, name="model-results", daemon=True).start()
+
+    def submit(self, chunks):
+        items = [PendingChunk(text) for text in chunks]
+        for item in items:
+            self.pending.put(item)
+        metrics.gauge("model_server.pending", self.pending.qsize())
+        return [item.future for item in items]
+
+    # Micro-batching: runs only when a process is idle, so chunks pile up while all are busy
+
+    def _dispatch_loop(self):
+        backlog = []
+        while not self._stopping.is_set():
+            entry = self.idle.get()
+            if entry is None:
+                return
+            worker, generation = entry
+            if generation != worker.generation:
+                continue  # the process was restarted since; it re-registers once loaded
+            if not backlog:
+                backlog.append(self.pending.get())
+            deadline = time.perf_counter() + self.max_wait
+            while len(backlog) < self.max_batch:
+                try:
+                    backlog.append(self.pending.get(timeout=max(0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            while True:  # whatever else is already waiting competes for the closest-length slots
+                try:
+                    backlog.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch, backlog = self._take_batch(backlog)
+            self._send(worker, generation, batch)
+
+    def _take_batch(self, backlog):
+        """
+        The oldest chunk plus its nearest neighbours in length, so padding stays small. Only chunks
+        with the anchor's summary lengths qualify, so a short chunk never caps the others' summaries.
+        """
+        anchor = backlog[0]
+        lengths = self.summary_lengths(anchor.words)
+        rest = sorted(
+            (item for item in backlog[1:] if self.summary_lengths(item.words) == lengths),
+            key=lambda item: abs(item.words - anchor.words),
+        )
+        batch = [anchor] + rest[:self.max_batch - 1]
+        chosen = set(map(id, batch))
+        return batch, [item for item in backlog if id(item) not in chosen]
+
+    def _send(self, worker, generation, batch):
+        with self._lock:
+            if generation != worker.generation:
+                # Restarted while the batch was being gathered; the chunks go to the next idle process
+                for item in batch:
+                    self.pending.put(item)
+                return
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not batch:
+                self.idle.put((worker, generation))
+                return
+            self._next_batch += 1
+            batch_id = self._next_batch
+            now = time.perf_counter()
+            worker.batch = (batch_id, batch, now)
+            conn = worker.conn
+        max_length, min_length = self.summary_lengths(batch[0].words)
+        for item in batch:
+            metrics.observe("model_server.queue_wait", now - item.enqueued)
+        metrics.observe("model_server.batch_size", len(batch))
+        try:
+            conn.send((batch_id, [item.text for item in batch], max_length, min_length))
+        except OSError:
+            pass  # the result loop notices the dead process and fails the batch
+
+    def _result_loop(self):
+        while not self._stopping.is_set():
+            handles = {}
+            for worker in self.workers:
+                handles[worker.conn] = handles[worker.process.sentinel] = worker
+            for obj in wait(list(handles), timeout=1):
+                worker = handles[obj]
+                if obj is not worker.conn:
+                    self._restart(worker)
+                    continue
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    continue  # handled through the sentinel
+                if message[0] == "ready":
+                    self._mark_ready(worker)
+                else:
+                    _, batch_id, ok, payload = message
+                    self._finish(worker, ok, payload)
+                    self.idle.put((worker, worker.generation))
+
+    def _finish(self, worker, ok, payload):
+        with self._lock:
+            entry, worker.batch = worker.batch, None
+        if entry is not None:
+            self._complete(entry, ok, payload)
+
+    def _complete(self, entry, ok, payload):
+        batch_id, batch, started = entry
+        metrics.observe("model_server.inference", time.perf_counter() - started)
+        for i, item in enumerate(batch):
+            if ok:
+                item.future.set_result(payload[i])
+            else:
+                item.future.set_exception(RuntimeError(payload))
+        if not ok:
+            metrics.incr("model_server.batch_errors")
+
+    def _restart(self, worker):
+        if self._stopping.is_set():
+            return
+        worker.process.join(timeout=1)  # reap it so the exit code is known
+        logger.error(f"Inference process {worker.index} died (exit code {worker.process.exitcode}); restarting")
+        metrics.incr("model_server.restarts")
+        # Taking the batch and bumping the generation together means _send can neither hand a
+        # batch to the dead process nor have one wiped by start() before it is failed
+        with self._lock:
+            entry = worker.batch
+            # The new process sends "ready" once loaded and the result loop puts it back in rotation
+            worker.start()
+        if entry is not None:
+            self._complete(entry, False, "inference process died")
+
+    # Client connections
+
+    def serve(self, address=MODEL_SERVER_ADDRESS, authkey=MODEL_SERVER_AUTHKEY, allow_remote=MODEL_SERVER_ALLOW_REMOTE):
+        address = parse_address(address)
+        if not is_loopback(address):
+            if not allow_remote:
+                raise ValueError(f"Refusing to listen on non-loopback {address}; set MODEL_SERVER_ALLOW_REMOTE to allow it")
+            if not authkey:
+                raise ValueError("A remote model server needs an explicit MODEL_SERVER_AUTHKEY")
+        if not authkey:
+            authkey = write_authkey()
+            logger.info(f"Model server key written to {MODEL_SERVER_AUTHKEY_FILE}")
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)  # stale socket from a previous run
+        # Owner-only from the moment the socket file exists
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(address, authkey=authkey)
+        finally:
+            os.umask(umask)
+        with listener:
+            logger.info(f"Model server listening on {address} with {len(self.workers)} processes")
+            while not self._stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    logger.warning(f"Rejected model server connection: {str(e)}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                command = message[0]
+                if command == "summarize":
+                    futures = self.submit(message[1])
+                    deadline = time.monotonic() + MODEL_SERVER_TIMEOUT
+                    try:
+                        reply = ("ok", [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures])
+                    except TimeoutError:
+                        reply = ("error", f"Summaries not ready within {MODEL_SERVER_TIMEOUT:.0f}s")
+                    except Exception as e:
+                        reply = ("error", str(e))
+                    if reply[0] == "error":
+                        for future in futures:
+                            future.cancel()  # chunks still queued are skipped by _send
+                elif command == "ping":
+                    reply = ("ok", len(self.workers))
+                elif command == "stats":
+                    reply = ("ok", self.stats())
+                else:
+                    reply = ("error", f"Unknown command: {command}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def stats(self):
+        return {
+            "processes": len(self.workers),
+            "threads_per_process": self.threads,
+            "busy": sum(1 for w in self.workers if w.batch is not None),
+            "pending": self.pending.qsize(),
+            "metrics": metrics.snapshot(),
+        }
+
+    def stop(self):
+        self._stopping.set()
+        self.idle.put(None)
+        for worker in self.workers:
+            worker.stop()
+
+
+# --- client ----------------------------------------------------------------
+
+class ModelServerClient:
+    """
+    Used in place of a local backend when SUMMARIZER_SERVER is set. Connections are not
+    thread-safe, so each call borrows one from a small pool. Without MODEL_SERVER_AUTHKEY
+    the key is re-read from the server's key file on every new connection.
+    """
+
+    def __init__(self, address=SUMMARIZER_SERVER, authkey=MODEL_SERVER_AUTHKEY, timeout=MODEL_SERVER_TIMEOUT):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.call("ping")  # fail at load time, not on the first request
+
+    def _request(self, conn, message):
+        conn.send(message)
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"Model server did not answer within {self.timeout:.0f}s")
+        status, payload = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Model server error: {payload}")
+        return payload
+
+    def call(self, *message):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is not None:
+            try:
+                result = self._request(conn, message)
+            except (EOFError, OSError):
+                # The pooled connection went stale (e.g. the server restarted); retry on a fresh one
+                conn.close()
+                conn = None
+            except Exception:
+                conn.close()
+                raise
+            else:
+                self._release(conn)
+                return result
+
+        conn = Client(self.address, authkey=self.authkey or read_authkey())
+        try:
+            result = self._request(conn, message)
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        return result
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def summarize_chunks(self, chunks):
+        """Summaries for `chunks` in order; the server does the batching and length selection."""
+        if not chunks:
+            return []
+        with metrics.timer("model_server.client_latency"):
+            return self.call("summarize", list(chunks))
+
+    def stats(self):
+        return self.call("stats")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Shared summarization model server")
+    parser.add_argument("--address", default=MODEL_SERVER_ADDRESS)
+    parser.add_argument("--processes", type=int, default=MODEL_SERVER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=MODEL_SERVER_THREADS)
+    parser.add_argument("--max-batch", type=int, default=MODEL_SERVER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MODEL_SERVER_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    server = ModelServer(args.processes, args.threads, args.max_batch, args.max_wait_ms)
+    server.wait_ready()
+    server.start()
+    try:
+        server.serve(args.address)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
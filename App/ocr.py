@@ -0,0 +1,104 @@
+"""
+Windowed, parallel OCR for scanned PDFs.
+
+Pages are rendered a few at a time (first_page/last_page) straight to a temporary
+directory, so a long scan never sits in memory as one list of PIL images. Windows are
+OCR'd across the fan-out process pool (App.executors) and results stream back one page at
+a time, in page order.
+"""
+import os
+import tempfile
+import time
+from collections import deque
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+from App.executors import FANOUT_WORKERS, get_fanout_pool
+
+pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH", "tesseract")
+
+OCR_WINDOW_PAGES = int(os.getenv("OCR_WINDOW_PAGES", "4"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+
+def page_count(path, poppler_path=None):
+    return int(pdfinfo_from_path(path, poppler_path=poppler_path)["Pages"])
+
+
+def make_windows(pages, window=OCR_WINDOW_PAGES):
+    """Groups sorted 1-based page numbers into runs of consecutive pages, at most `window` long."""
+    windows = []
+    for page in sorted(set(pages)):
+        if windows and page == windows[-1][-1] + 1 and len(windows[-1]) < window:
+            windows[-1].append(page)
+        else:
+            windows.append([page])
+    return windows
+
+
+def ocr_window(path, first_page, last_page, dpi=OCR_DPI, poppler_path=None):
+    """
+    Renders one window of pages to disk and OCRs them one image at a time.
+    Returns [(text, seconds)] per page; render time is split evenly across the window.
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = convert_from_path(
+            path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            output_folder=tmp_dir,
+            paths_only=True,
+            fmt="png",
+            poppler_path=poppler_path,
+        )
+        render_share = (time.perf_counter() - start) / max(1, len(image_paths))
+        results = []
+        for image_path in image_paths:
+            page_start = time.perf_counter()
+            with Image.open(image_path) as image:
+                text = pytesseract.image_to_string(image)
+            results.append((text, render_share + time.perf_counter() - page_start))
+    return results
+
+
+def iter_ocr_pages(path, pages=None, poppler_path=None, window=OCR_WINDOW_PAGES, workers=OCR_WORKERS, dpi=OCR_DPI):
+    """
+    Yields (page_number, text, seconds) in page order for `pages` (1-based; defaults to all pages).
+    At most 2 * workers windows are rendered or queued at once, which bounds memory and disk use.
+    """
+    if pages is None:
+        pages = range(1, page_count(path, poppler_path) + 1)
+    windows = make_windows(pages, window)
+    if not windows:
+        return
+
+    workers = max(1, min(workers, FANOUT_WORKERS, len(windows)))
+    pool = get_fanout_pool()
+    pending = deque()
+    remaining = iter(windows)
+
+    def submit_next():
+        batch = next(remaining, None)
+        if batch is not None:
+            future = pool.submit(ocr_window, path, batch[0], batch[-1], dpi, poppler_path)
+            pending.append((batch, future))
+
+    for _ in range(workers * 2):
+        submit_next()
+
+    try:
+        while pending:
+            batch, future = pending.popleft()
+            results = future.result()
+            submit_next()
+            for page, (text, seconds) in zip(batch, results):
+                yield page, text, seconds
+    finally:
+        # The pool outlives this call: drop queued windows if the caller stopped early or one failed
+        for _, future in pending:
+            future.cancel()
@@ -1,56 +1,132 @@
-from App.reader import extract_pdf, extract_doc, extract_ppt
-from App.summarizer import summarize_large_text, explain
+from App.dedup import EXTRACTORS, extract_document
+from App.summarizer import summarize_large_text, SUMMARY_MODEL, EXPLAIN_MODEL
 from App.search import search_using_bullets
-from App.flashcards import flashcards  # ✅ This was the missing one earlier
+from App.flashcards import FLASHCARDS_MODEL  # ✅ This was the missing one earlier
+from App.mapreduce import flashcards_document, iter_explanation_document
 from App.cache import cache_summary
+from App.prefilter import PREFILTER_SIGNATURE, prefilter_stats
+from App.scheduler import Stage, StageSkipped, run_stages
+from App.singleflight import flight_key, single_flight
 import logging
+import os
+from concurrent.futures import Future
 #from cache import cache_summary
 
 logging.basicConfig(level=logging.INFO)
 
+# Per-stage timeouts in seconds; a stage that overruns is reported as failed
+STAGE_TIMEOUTS = {
+    "summary": float(os.getenv("STAGE_TIMEOUT_SUMMARY", "600")),
+    "explanation": float(os.getenv("STAGE_TIMEOUT_EXPLANATION", "180")),
+    "flashcards": float(os.getenv("STAGE_TIMEOUT_FLASHCARDS", "180")),
+    "search": float(os.getenv("STAGE_TIMEOUT_SEARCH", "60")),
+}
+
+
+def run_search(explanation):
+    """Search stage: looks up the bullets from the explanation, if there are any."""
+    if explanation is not None and isinstance(explanation, dict) and "bullets" in explanation:
+        return search_using_bullets(explanation)
+    logging.warning("⚠️ No valid bullet points available for web search or explantion is empty .")
+    return {}
+
+
+def explain_streaming(text, bullets_ready):
+    """
+    Explanation stage. The completion is streamed and parsed as it arrives, and
+    `bullets_ready` is resolved the moment the "bullets" field closes so search
+    can start while the model is still writing the explanation and notes.
+    """
+    explanation = None
+    try:
+        for kind, key, value in iter_explanation_document(text):
+            if kind == "field" and key == "bullets" and not bullets_ready.done():
+                bullets_ready.set_result({"bullets": value})
+            elif kind == "result":
+                explanation = value
+    except Exception as e:
+        if not bullets_ready.done():
+            bullets_ready.set_exception(e)
+        raise
+    if not bullets_ready.done():
+        bullets_ready.set_result(explanation)
+    return explanation
+
+
 def process_file(file_path, file_type, generate_flashcards=False):
     """Orchestrates full processing pipeline from file extraction to AI processing."""
 
     logging.info(f"📂 Processing file: {file_path} (Type: {file_type})")
-    # Step 1: Extract text based on file type
-    if file_type == "pdf":
-        text = extract_pdf(file_path)
-    elif file_type == "docx":
-        text = extract_doc(file_path)
-    elif file_type == "pptx":
-        text = extract_ppt(file_path)
-    else:
+    # Step 1: Extract text based on file type (skipped for bytes we have extracted before)
+    if file_type not in EXTRACTORS:
         logging.error("Unsupported file type!")
         raise ValueError("Unsupported file type!")
+    document = extract_document(file_path, file_type)
+    text = document.text
     
     # Validate if text extraction was successful
     if not text.strip():
         logging.error("❌ Failed to extract text from document.")
         return {"error": "❌ Failed to extract text from document."}
 
+    # Everything that changes the result is part of the cache key
+    cache_options = {
+        "generate_flashcards": generate_flashcards,
+        "summary_model": SUMMARY_MODEL,
+        "explain_model": EXPLAIN_MODEL,
+        "flashcards_model": FLASHCARDS_MODEL if generate_flashcards else None,
+        "prefilter": PREFILTER_SIGNATURE,
+    }
+
     #Step 2: Summarize & Explain
-    cached_summary = cache_summary(text)
+    cached_summary = cache_summary(text, **cache_options)
     if cached_summary:
         logging.info(" Using cached summary.")
         return cached_summary  # Use cached version if available
 
-    try:
-        logging.info("Generating simple information......")
-        summary = summarize_large_text(text)
+    # Identical documents already being processed (here or in another worker) are awaited, not redone
+    key = flight_key("process-file", text, **cache_options)
+    return single_flight.run(key, run_pipeline, document, generate_flashcards, cache_options)
+
+
+def run_pipeline(document, generate_flashcards, cache_options):
+    """Steps 3-4 of process_file: runs the stage graph and caches the assembled result."""
+    text = document.text
+    # Another worker may have finished this document while we waited for its lock
+    cached_summary = cache_summary(text, **cache_options)
+    if cached_summary:
+        logging.info(" Using cached summary.")
+        return cached_summary
+
+    # Step 3: Summarize, explain and make flashcards concurrently; search waits only on bullets,
+    # which arrive mid-stream, not on the whole explanation
+    bullets_ready = Future()
+    stages = [
+        Stage("summary", lambda: summarize_large_text(document), timeout=STAGE_TIMEOUTS["summary"]),
+        Stage("explanation", lambda: explain_streaming(text, bullets_ready), timeout=STAGE_TIMEOUTS["explanation"]),
+        # Submitted only once bullets_ready resolves, so it never parks a pool thread waiting on it
+        Stage("search", run_search, timeout=STAGE_TIMEOUTS["search"], ready=bullets_ready, ready_by="explanation"),
+    ]
+    if generate_flashcards:
+        stages.append(Stage("flashcards", lambda: flashcards_document(text), timeout=STAGE_TIMEOUTS["flashcards"]))
+
+    logging.info("Running summary, explanation & flashcard stages......")
+    report = run_stages(stages)
+
+    summary_run = report["summary"]
+    if summary_run.ok:
+        summary = summary_run.value
         if summary is None:
             summary = "Summary is not avalable"
-
-    except Exception as e:
-        logging.error(f"❌ Summarization failed: {str(e)}")
+    else:
+        logging.error(f"❌ Summarization failed: {str(summary_run.error)}")
         summary = "❌ Failed to generate summary."
 
-
-    try: 
-        logging.info("Generating explanation & Notes ......")
-        explanation = explain(text)
-    
-    except Exception as e:
-        logging.error(f"❌ Explantion failed: {str(e)}")
+    explanation_run = report["explanation"]
+    if explanation_run.ok:
+        explanation = explanation_run.value
+    else:
+        logging.error(f"❌ Explantion failed: {str(explanation_run.error)}")
         explanation = "❌ Failed to generate explanation."
 
     #Extract notes separately
@@ -59,28 +135,22 @@ def process_file(file_path, file_type, generate_flashcards=False):
     else:
         Notes = "Notes not available"
 
-        
-
-    # Step 3: Perform Web Search
-    search_results = {}
-    if explanation is not None and isinstance(explanation, dict) and "bullets" in explanation:
-        try:
-            search_results = search_using_bullets(explanation)
-        except Exception as e:
-            logging.error(f"Web search failed: {str(e)}")
-            search_results = {"error": str(e)}
+    search_run = report["search"]
+    if search_run.ok:
+        search_results = search_run.value
+    elif isinstance(search_run.error, StageSkipped) or not explanation_run.ok:
+        search_results = {}
     else:
-        logging.warning("⚠️ No valid bullet points available for web search or explantion is empty .")
+        logging.error(f"Web search failed: {str(search_run.error)}")
+        search_results = {"error": str(search_run.error)}
 
     flashcards_data = {"Cards": [], "MCQ": []}
     if generate_flashcards:
-        try:
-            logging.info("Geneating Flashcards")
-            flashcards_data = flashcards(text)
-        except Exception as e:
-            logging.error(f"Flashcard generation failed: {str(e)}")
-
-
+        flashcards_run = report["flashcards"]
+        if flashcards_run.ok:
+            flashcards_data = flashcards_run.value
+        else:
+            logging.error(f"Flashcard generation failed: {str(flashcards_run.error)}")
 
     # Step 4: Store in cache
     final_result = {
@@ -93,8 +163,13 @@ def process_file(file_path, file_type, generate_flashcards=False):
     if generate_flashcards:
         final_result["flashcards"] = flashcards_data
 
+    # Tokens kept away from the LLM stages for this document
+    reduction = prefilter_stats(text)
+    if reduction is not None:
+        final_result["text_reduction"] = reduction
+
     #Save to cache    
-    cache_summary(text, final_result)
+    cache_summary(text, final_result, **cache_options)
 
     logging.info("Processing Complete")
 
@@ -0,0 +1,407 @@
+"""
+Text reduction before the LLM stages (explain, flashcards).
+
+Extracted text carries a lot that costs tokens without informing the model: page numbers,
+running headers and slide footers repeated on every page, the "📝 Speaker Notes" labels
+from extract_ppt, lines pasted twice and near-identical paragraphs (e.g. a slide repeated
+as a build-up). reduce_text removes those in order:
+
+  1. boilerplate lines ("Page 3", "3 of 12", notes labels, copyright lines)
+  2. running headers/footers: short lines at the top or bottom of PREFILTER_REPEAT_MIN+
+     paragraphs, ignoring page/slide numbers, and bare page numbers: lines that are just
+     a number, at paragraph edges, running 3, 4, 5... (a "1924" in the text stays)
+  3. exact duplicate lines after the first
+  4. near-duplicate paragraphs: word-shingle MinHash with LSH banding
+  5. optionally, extractive sentence selection (TF-IDF or TextRank) down to
+     PREFILTER_BUDGET_TOKENS, keeping the chosen sentences in document order
+
+Token counts use tiktoken when it is installed and ~4 characters per token otherwise.
+Per-document savings are logged and recorded under prefilter.* in /metrics.
+"""
+import functools
+import hashlib
+import heapq
+import logging
+import math
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict
+
+from App.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Short lines opening or closing this many paragraphs are headers/footers, dropped everywhere
+PREFILTER_REPEAT_MIN = int(os.getenv("PREFILTER_REPEAT_MIN", "3"))
+PREFILTER_REPEAT_MAX_WORDS = int(os.getenv("PREFILTER_REPEAT_MAX_WORDS", "12"))
+# Estimated Jaccard similarity above which a paragraph counts as a repeat of an earlier one
+PREFILTER_NEAR_DUP = float(os.getenv("PREFILTER_NEAR_DUP", "0.8"))
+# Token budget for extractive sentence selection; 0 keeps every sentence that survives dedup
+PREFILTER_BUDGET_TOKENS = int(os.getenv("PREFILTER_BUDGET_TOKENS", "0"))
+PREFILTER_RANKER = os.getenv("PREFILTER_RANKER", "textrank").strip().lower()  # textrank or tfidf
+# TextRank compares every pair of sentences; longer documents are ranked by TF-IDF instead
+TEXTRANK_MAX_SENTENCES = int(os.getenv("PREFILTER_TEXTRANK_MAX_SENTENCES", "1500"))
+TEXTRANK_NEIGHBOURS = 20
+
+PREFILTER_VERSION = "v2"
+# Part of the cache key of anything computed from prefiltered text
+PREFILTER_SIGNATURE = (
+    f"{PREFILTER_VERSION}:budget={PREFILTER_BUDGET_TOKENS}:{PREFILTER_RANKER}" if PREFILTER_ENABLED else "off"
+)
+
+BOILERPLATE_PATTERNS = [
+    # Only numbers marked as page numbers; a bare "1924" may be content (see _page_numbers)
+    re.compile(r"^(?:(?:page|slide|p\.)\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?|\d{1,4}\s+of\s+\d{1,4}|[-–—]\s*\d{1,4}\s*[-–—])$", re.IGNORECASE),
+    re.compile(r"^(?:📝\s*)?speaker notes:?$", re.IGNORECASE),
+    re.compile(r"^(?:©|\(c\)|copyright\b)(?:\W*\w+){0,14}\W*$", re.IGNORECASE),
+]
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 similarity almost always share a band
+_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+_MASKS = [random.Random(seed).getrandbits(64) for seed in range(MINHASH_PERMUTATIONS)]
+
+BARE_NUMBER_RE = re.compile(r"^(\d{1,4})(?:\s*/\s*\d{1,4})?$")
+WORD_RE = re.compile(r"\w+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"“(\[]?[A-Z0-9])")
+
+
+# === Token counting ===
+
+_encoding = None
+
+
+def count_llm_tokens(text):
+    """Tokens as the LLM bills them (tiktoken if available, else an estimate)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+# === Line-level cleanup ===
+
+def _norm(line):
+    return " ".join(line.split()).casefold()
+
+
+PAGE_REF_PATTERNS = [
+    re.compile(r"\b(?:page|slide|p\.)\s*\d+(?:\s*(?:of|/)\s*\d+)?\b", re.IGNORECASE),
+    # a bare number set off by a separator: "Biology 101 | 7", "3 – Intro"
+    re.compile(r"(?:^|(?<=[|•·–—-]))\s*\d+(?:\s*/\s*\d+)?(?=\s*(?:[|•·–—-]|$))"),
+]
+
+
+def _shape(line):
+    # "Biology 101 | Page 3" and "Biology 101 | Page 4" are the same footer
+    for pattern in PAGE_REF_PATTERNS:
+        line = pattern.sub(" ", line)
+    return _norm(line)
+
+
+def is_boilerplate(line):
+    stripped = line.strip()
+    return any(pattern.match(stripped) for pattern in BOILERPLATE_PATTERNS)
+
+
+def _running_lines(paragraphs):
+    """
+    Shapes of headers/footers: lines at the top or bottom of at least PREFILTER_REPEAT_MIN
+    paragraphs (pages, slides). Single words are left alone, since some PDFs extract one
+    word per line.
+    """
+    edges = Counter()
+    for paragraph in paragraphs:
+        shapes = {_shape(line) for line in paragraph[:2] + paragraph[-2:]}
+        edges.update(s for s in shapes if 2 <= len(s.split()) <= PREFILTER_REPEAT_MAX_WORDS)
+    return {s for s, count in edges.items() if count >= PREFILTER_REPEAT_MIN}
+
+
+def _edges(paragraph):
+    return range(len(paragraph)) if len(paragraph) <= 4 else (0, 1, len(paragraph) - 2, len(paragraph) - 1)
+
+
+def _page_numbers(paragraphs):
+    """
+    Bare numbers that number the pages: ones opening or closing a paragraph that form a run
+    of PREFILTER_REPEAT_MIN+ consecutive values (3, 4, 5...). A lone "1924" or "88" at the
+    edge of a paragraph is content and stays.
+    """
+    values = set()
+    for paragraph in paragraphs:
+        for i in _edges(paragraph):
+            match = BARE_NUMBER_RE.match(paragraph[i].strip())
+            if match:
+                values.add(int(match.group(1)))
+    numbers = set()
+    for value in values:
+        if value - 1 in values:
+            continue
+        end = value
+        while end in values:
+            end += 1
+        if end - value >= PREFILTER_REPEAT_MIN:
+            numbers.update(range(value, end))
+    return numbers
+
+
+def clean_lines(paragraphs, stats):
+    """Drops boilerplate, running header/footer lines and exact duplicate lines."""
+    kept_lines = []
+    for paragraph in paragraphs:
+        lines = [line for line in paragraph if not is_boilerplate(line)]
+        stats["boilerplate_lines"] += len(paragraph) - len(lines)
+        kept_lines.append(lines)
+
+    running = _running_lines(kept_lines)
+    page_numbers = _page_numbers(kept_lines)
+    seen = set()
+    cleaned = []
+    for paragraph in kept_lines:
+        edges = set(_edges(paragraph)) if page_numbers else ()
+        kept = []
+        for i, line in enumerate(paragraph):
+            number = BARE_NUMBER_RE.match(line.strip()) if i in edges else None
+            if number and int(number.group(1)) in page_numbers:
+                stats["boilerplate_lines"] += 1
+                continue
+            if _shape(line) in running:
+                stats["repeated_lines"] += 1
+                continue
+            key = _norm(line)
+            # Very short lines ("Yes", "Example:") repeat legitimately
+            if key in seen and len(key.split()) >= 4:
+                stats["duplicate_lines"] += 1
+                continue
+            seen.add(key)
+            kept.append(line)
+        if kept:
+            cleaned.append(kept)
+    return cleaned
+
+
+# === Near-duplicate paragraphs ===
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = WORD_RE.findall(text.casefold())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set):
+    """MinHash signature; each permutation is the 64-bit shingle hash XORed with a fixed mask."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingle_set]
+    return [min(map(mask.__xor__, hashes)) for mask in _MASKS]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def drop_near_duplicates(paragraphs, threshold=PREFILTER_NEAR_DUP, stats=None):
+    """Keeps the first of every group of near-identical paragraphs (each a list of lines)."""
+    buckets = defaultdict(list)  # (band, band hash) -> indices of kept paragraphs
+    signatures = {}
+    kept = []
+    for paragraph in paragraphs:
+        shingle_set = shingles(" ".join(paragraph))
+        if len(shingle_set) < 5:  # too short to judge; exact duplicates are already gone
+            kept.append(paragraph)
+            continue
+        signature = minhash(shingle_set)
+        bands = [(band, hash(tuple(signature[band * _ROWS:(band + 1) * _ROWS]))) for band in range(LSH_BANDS)]
+        candidates = {index for key in bands for index in buckets.get(key, ())}
+        if any(similarity(signature, signatures[index]) >= threshold for index in candidates):
+            if stats is not None:
+                stats["near_duplicate_paragraphs"] += 1
+            continue
+        index = len(kept)
+        signatures[index] = signature
+        for key in bands:
+            buckets[key].append(index)
+        kept.append(paragraph)
+    return kept
+
+
+# === Extractive selection ===
+
+def split_sentences(paragraphs):
+    """[(paragraph index, line index, sentence)] in document order."""
+    units = []
+    for p, paragraph in enumerate(paragraphs):
+        for l, line in enumerate(paragraph):
+            for sentence in SENTENCE_RE.split(line.strip()):
+                if sentence:
+                    units.append((p, l, sentence))
+    return units
+
+
+def tfidf_vectors(sentences):
+    terms = [Counter(WORD_RE.findall(s.casefold())) for s in sentences]
+    df = Counter(term for counts in terms for term in counts)
+    n = len(sentences)
+    idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+    vectors = []
+    for counts in terms:
+        vector = {term: tf * idf[term] for term, tf in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        vectors.append({term: v / norm for term, v in vector.items()})
+    return terms, idf, vectors
+
+
+def tfidf_scores(sentences):
+    """Mean TF-IDF weight of each sentence's words: favours dense, specific sentences."""
+    terms, idf, _ = tfidf_vectors(sentences)
+    return [
+        sum(tf * idf[t] for t, tf in counts.items()) / sum(counts.values()) if counts else 0.0
+        for counts in terms
+    ]
+
+
+def textrank_scores(sentences, damping=0.85, iterations=30):
+    """PageRank over the TF-IDF cosine similarity graph of the sentences."""
+    _, _, vectors = tfidf_vectors(sentences)
+    postings = defaultdict(list)
+    for i, vector in enumerate(vectors):
+        for term, weight in vector.items():
+            postings[term].append((i, weight))
+
+    edges = [defaultdict(float) for _ in sentences]
+    for entries in postings.values():
+        if len(entries) > len(sentences) // 2:
+            continue  # near-stopword: links everything to everything and costs O(n^2)
+        for a in range(len(entries)):
+            i, wi = entries[a]
+            for j, wj in entries[a + 1:]:
+                edges[i][j] += wi * wj
+                edges[j][i] += wi * wj
+
+    # Keeping each sentence's strongest links keeps the iterations linear in the sentence count
+    edges = [dict(heapq.nlargest(TEXTRANK_NEIGHBOURS, neighbours.items(), key=lambda item: item[1])) for neighbours in edges]
+    totals = [sum(neighbours.values()) for neighbours in edges]
+    n = len(sentences)
+    scores = [1.0 / n] * n
+    for _ in range(iterations):
+        incoming = [0.0] * n
+        for i, neighbours in enumerate(edges):
+            if totals[i]:
+                share = scores[i] / totals[i]
+                for j, weight in neighbours.items():
+                    incoming[j] += share * weight
+        scores = [(1 - damping) / n + damping * value for value in incoming]
+    return scores
+
+
+def select_sentences(paragraphs, budget_tokens, ranker=PREFILTER_RANKER, stats=None):
+    """Keeps the highest-ranked sentences that fit in the budget, in their original order."""
+    units = split_sentences(paragraphs)
+    if not units:
+        return paragraphs
+    sentences = [sentence for _, _, sentence in units]
+    if ranker == "textrank" and len(sentences) <= TEXTRANK_MAX_SENTENCES:
+        scores = textrank_scores(sentences)
+    else:
+        scores = tfidf_scores(sentences)
+
+    chosen = set()
+    used = 0
+    for i in sorted(range(len(units)), key=lambda i: scores[i], reverse=True):
+        cost = count_llm_tokens(sentences[i]) + 1
+        if used + cost > budget_tokens:
+            continue  # a shorter, lower-ranked sentence may still fit
+        chosen.add(i)
+        used += cost
+    if stats is not None:
+        stats["dropped_sentences"] = len(units) - len(chosen)
+
+    lines = defaultdict(list)
+    for i in sorted(chosen):
+        p, l, sentence = units[i]
+        lines[(p, l)].append(sentence)
+    selected = []
+    for p, paragraph in enumerate(paragraphs):
+        kept = [" ".join(lines[(p, l)]) for l in range(len(paragraph)) if (p, l) in lines]
+        if kept:
+            selected.append(kept)
+    return selected
+
+
+# === Entry points ===
+
+def split_paragraphs(text):
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", text):
+        lines = [line.rstrip() for line in block.splitlines() if line.strip()]
+        if lines:
+            paragraphs.append(lines)
+    return paragraphs
+
+
+def reduce_text(text, budget_tokens=PREFILTER_BUDGET_TOKENS, ranker=PREFILTER_RANKER):
+    """Returns (reduced text, stats). Falls back to the original text if nothing would be left."""
+    start = time.perf_counter()
+    stats = Counter(boilerplate_lines=0, repeated_lines=0, duplicate_lines=0,
+                    near_duplicate_paragraphs=0, dropped_sentences=0)
+    paragraphs = clean_lines(split_paragraphs(text), stats)
+    paragraphs = drop_near_duplicates(paragraphs, stats=stats)
+
+    reduced = "\n\n".join("\n".join(paragraph) for paragraph in paragraphs)
+    if budget_tokens and count_llm_tokens(reduced) > budget_tokens:
+        paragraphs = select_sentences(paragraphs, budget_tokens, ranker, stats)
+        reduced = "\n\n".join("\n".join(paragraph) for paragraph in paragraphs)
+    if not reduced.strip():
+        reduced = text
+
+    tokens_before = count_llm_tokens(text)
+    tokens_after = count_llm_tokens(reduced)
+    stats.update(
+        tokens_before=tokens_before,
+        tokens_after=tokens_after,
+        tokens_saved=tokens_before - tokens_after,
+    )
+    result = dict(stats)
+    result["saved_ratio"] = round(result["tokens_saved"] / tokens_before, 4) if tokens_before else 0.0
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return reduced, result
+
+
+@functools.lru_cache(maxsize=32)
+def _prefilter(text):
+    # explain and flashcards both prefilter the same document, often concurrently
+    reduced, stats = reduce_text(text)
+    metrics.incr("prefilter.documents")
+    metrics.incr("prefilter.tokens_before", stats["tokens_before"])
+    metrics.incr("prefilter.tokens_after", stats["tokens_after"])
+    metrics.incr("prefilter.tokens_saved", stats["tokens_saved"])
+    metrics.observe("prefilter.time", stats["seconds"])
+    logger.info(
+        f"Prefilter: {stats['tokens_before']} -> {stats['tokens_after']} tokens "
+        f"({stats['saved_ratio']:.0%} saved) in {stats['seconds']:.2f}s"
+    )
+    return reduced, stats
+
+
+def prefilter_text(text):
+    """The text to send to the LLM stages (unchanged when PREFILTER_ENABLED is off)."""
+    if not PREFILTER_ENABLED or not text:
+        return text
+    return _prefilter(text)[0]
+
+
+def prefilter_stats(text):
+    """Token savings for a document, or None when prefiltering is off."""
+    if not PREFILTER_ENABLED or not text:
+        return None
+    return _prefilter(text)[1]
@@ -0,0 +1,176 @@
+"""
+GCRA (generic cell rate algorithm) rate limiting.
+
+Each client key stores a single number, its theoretical arrival time (TAT), so a check
+is O(1) and memory is one float per active client no matter the window or the limit.
+A request of cost c pushes the TAT forward by c emission intervals and is allowed while
+the TAT stays within one window of now, which permits bursts of up to `limit` units.
+
+The in-process limiter keeps at most RATE_LIMIT_MAX_KEYS clients in LRU order and drops
+keys as soon as they are idle (TAT in the past means a fresh key behaves the same). The
+Redis limiter runs the same arithmetic in a Lua script so every worker shares one budget.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Heavier endpoints use up more of a client's budget; any other route costs 1. Keys are
+# route templates ("/jobs/{job_id}", not the requested path), optionally "METHOD /template"
+DEFAULT_ROUTE_COSTS = {
+    "/process-document": 5,
+    "/process-document/stream": 5,
+    "POST /jobs": 5,
+    "/summarize": 3,
+    "/explain": 3,
+    "/flashcards": 3,
+    "/parse-pdf": 2,
+}
+
+# Cheap read-only routes clients poll (job status, health, stats). They are limited in a
+# separate, larger "status" budget so polling a job never uses up the budget for new work.
+STATUS_ROUTES = {
+    "GET /jobs/{job_id}",
+    "GET /jobs/{job_id}/result",
+    "GET /",
+    "GET /ready",
+    "GET /metrics",
+    "GET /cache/stats",
+    "GET /dedup/stats",
+    "GET /llm/stats",
+}
+
+
+def parse_route_costs(spec):
+    """Parses "/path=cost,GET /other=cost" (e.g. from RATE_LIMIT_ROUTE_COSTS) on top of the defaults."""
+    costs = dict(DEFAULT_ROUTE_COSTS)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            route, cost = item.split("=", 1)
+            costs[" ".join(route.split())] = float(cost)
+    return costs
+
+
+def route_cost(costs, method, template):
+    """Cost of a request: a "METHOD /template" entry wins over a "/template" one."""
+    cost = costs.get(f"{method} {template}")
+    return costs.get(template, 1) if cost is None else cost
+
+
+class GCRALimiter:
+    """In-process GCRA with bounded, self-evicting state."""
+
+    blocking = False
+
+    def __init__(self, limit, window_seconds, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.interval = self.window / limit  # emission interval: time one unit "occupies"
+        self.max_keys = max_keys
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def check(self, key, cost=1, now=None):
+        """Returns (allowed, retry_after_seconds) and records the request if allowed."""
+        now = time.monotonic() if now is None else now
+        cost = min(cost, self.limit)  # a single request can always fit in an idle budget
+        with self._lock:
+            tat = self._tats.get(key, now)
+            new_tat = max(tat, now) + cost * self.interval
+            if new_tat - now > self.window:
+                return False, new_tat - now - self.window
+
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            self._evict(now)
+            return True, 0.0
+
+    def _evict(self, now):
+        # LRU order: the oldest entries are checked first, and idle ones cost nothing to drop
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now and len(self._tats) <= self.max_keys:
+                break
+            del self._tats[key]
+            self.evicted += 1
+
+    def __len__(self):
+        return len(self._tats)
+
+    def stats(self):
+        return {"backend": "memory", "keys": len(self._tats), "max_keys": self.max_keys, "evicted": self.evicted}
+
+
+# KEYS[1] = client key; ARGV = interval_ms, window_ms, cost. Uses Redis' clock so workers agree.
+GCRA_LUA = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new_tat = math.ceil(tat + cost * interval)
+if new_tat - now > window then
+  return {0, new_tat - now - window}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, 0}
+"""
+
+
+class RedisGCRALimiter:
+    """GCRA shared by every worker through Redis; keys expire when they go idle."""
+
+    blocking = True  # network round trip; the middleware runs it off the event loop
+
+    def __init__(self, limit, window_seconds, url="redis://localhost:6379/0", prefix="studyme:ratelimit:", client=None):
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.interval = self.window / limit
+        self.prefix = prefix
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self._script = client.register_script(GCRA_LUA)
+        self.errors = 0
+
+    def check(self, key, cost=1, now=None):
+        cost = min(cost, self.limit)
+        try:
+            allowed, retry_ms = self._script(
+                keys=[f"{self.prefix}{key}"],
+                args=[self.interval * 1000, self.window * 1000, cost],
+            )
+        except Exception as e:
+            # Fail open: an unavailable limiter must not take the API down with it
+            self.errors += 1
+            logger.warning(f"Redis rate limiter unavailable, allowing request: {str(e)}")
+            return True, 0.0
+        return bool(allowed), float(retry_ms) / 1000
+
+    def stats(self):
+        return {"backend": "redis", "errors": self.errors}
+
+
+def create_limiter(limit, window_seconds, backend=None):
+    """Builds the limiter selected by RATE_LIMIT_BACKEND (memory or redis)."""
+    backend = (backend or os.getenv("RATE_LIMIT_BACKEND", "memory")).strip().lower()
+    if backend == "memory":
+        return GCRALimiter(limit, window_seconds)
+    if backend == "redis":
+        url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        return RedisGCRALimiter(limit, window_seconds, url=url)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
@@ -1,84 +1,256 @@
 from PyPDF2 import PdfReader
 from PIL import Image
-from pdf2image import convert_from_path
+import mmap
 import os
 import tempfile
+import time
+from contextlib import contextmanager
 from pptx import Presentation
 import pytesseract
 import docx
+from docx.table import Table as DocxTable
+from App.executors import FANOUT_WORKERS, get_fanout_pool
+from App.ocr import iter_ocr_pages
+from App.metrics import metrics
+from App.document import NOTES, TEXT, Block, Document, Page, table_block
 # Set Tesseract executable path
 pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH", "tesseract")
 # Set Poppler path for PDF to image conversion
 poppler_path = os.getenv("POPPLER_PATH", "poppler")
 
 
-def extract_doc(file):
+def _docx_table(table):
+    return table_block([cell.text.strip() for cell in row.cells] for row in table.rows)
+
+
+def iter_docx_pages(file):
+    """A DOCX has no reliable page breaks, so it is one section of paragraph and table blocks."""
     doc = docx.Document(file)
-    text = []
-    for paragraph in doc.paragraphs:
-        if paragraph.text.strip():  # Ignore empty paragraphs
-                text.append(paragraph.text)
+    if hasattr(doc, "iter_inner_content"):
+        # python-docx >= 1.1: paragraphs and tables in the order they appear
+        blocks = [
+            _docx_table(item) if isinstance(item, DocxTable) else Block(TEXT, item.text.strip())
+            for item in doc.iter_inner_content()
+        ]
+    else:
+        blocks = [Block(TEXT, paragraph.text.strip()) for paragraph in doc.paragraphs]
+        blocks += [_docx_table(table) for table in doc.tables]
+    yield Page(1, "section", blocks)
 
-     # Extract text from tables
-    for table in doc.tables:
-        table_data = []
-        for row in table.rows:
-            row_data = [cell.text.strip() for cell in row.cells if cell.text.strip()]
-            if row_data:
-                table_data.append(" | ".join(row_data))
 
-        if table_data:
-            text.append("\n".join(table_data))
+def docx_document(file):
+    return Document.from_pages("docx", iter_docx_pages(file))
 
-    return "\n\n".join(text).strip()
 
+def extract_doc(file):
+    return docx_document(file).text
 
-def extract_pdf(file):
-    """Extracts text from a PDF, handles multi-page PDFs, and falls back to OCR if needed."""
-    reader = PdfReader(file)
-    text = []
+
+# A page with less text than this is treated as image-only and OCR'd
+MIN_PAGE_TEXT_CHARS = int(os.getenv("MIN_PAGE_TEXT_CHARS", "20"))
+# Pages that carry images and less text than this (e.g. a scanned figure with a caption) are OCR'd too
+MIN_IMAGE_PAGE_TEXT_CHARS = int(os.getenv("MIN_IMAGE_PAGE_TEXT_CHARS", "200"))
+PDF_TEXT_WORKERS = int(os.getenv("PDF_TEXT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages, process start-up costs more than parallel text extraction saves
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+
+@contextmanager
+def open_pdf(file):
+    """
+    PdfReader over a read-only memory map of `file`. Given a path, PyPDF2 would copy the
+    whole file into a BytesIO; the map lets pages be read straight from the page cache.
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        yield PdfReader(file)
+        return
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield PdfReader(mapped)
+
+
+def _page_has_images(page):
+    try:
+        xobjects = page["/Resources"].get_object().get("/XObject")
+        if xobjects is None:
+            return False
+        return any(xobj.get_object().get("/Subtype") == "/Image" for xobj in xobjects.get_object().values())
+    except Exception:
+        return False
+
+
+def _extract_page_range(file, start, stop):
+    """Extracts the text layer of pages [start, stop). Returns [(index, text, has_images, seconds)]."""
+    results = []
+    with open_pdf(file) as reader:
+        for index in range(start, stop):
+            page_start = time.perf_counter()
+            page = reader.pages[index]
+            page_text = page.extract_text() or ""
+            results.append((index, page_text, _page_has_images(page), time.perf_counter() - page_start))
+    return results
+
+
+def _extract_text_layer(file, num_pages):
+    """Reads every page's text layer, splitting large PDFs across the fan-out pool."""
+    workers = min(PDF_TEXT_WORKERS, FANOUT_WORKERS, max(1, num_pages // 8))
+    if num_pages < PARALLEL_MIN_PAGES or workers < 2:
+        return _extract_page_range(file, 0, num_pages)
+
+    step = -(-num_pages // workers)  # ceiling division
+    pool = get_fanout_pool()
+    futures = [pool.submit(_extract_page_range, file, start, min(start + step, num_pages))
+               for start in range(0, num_pages, step)]
+    try:
+        return [row for future in futures for row in future.result()]
+    finally:
+        for future in futures:
+            future.cancel()  # no-op unless another range failed first
+
+
+def needs_ocr(page_text, has_images):
+    """The per-page plan: True when the text layer is missing or too thin to trust."""
+    chars = len(page_text.strip())
+    return chars < MIN_PAGE_TEXT_CHARS or (has_images and chars < MIN_IMAGE_PAGE_TEXT_CHARS)
+
+
+def iter_extracted_pdf_pages(file):
+    """
+    Extracts every page, choosing the text layer or OCR page by page; only the planned pages
+    are rendered. Yields (page_number, text, method) in page order, method "text", "ocr" or
+    "empty": text-layer pages go out at once, OCR'd pages as soon as their window is done.
+    """
+    with open_pdf(file) as reader:
+        num_pages = len(reader.pages)
+
+    with metrics.timer("extract.pdf.text_layer"):
+        layer = _extract_text_layer(file, num_pages)
+
+    pages = {}
+    ocr_plan = []
+    for index, page_text, has_images, seconds in layer:
+        metrics.observe("extract.page.text", seconds)
+        if needs_ocr(page_text, has_images):
+            ocr_plan.append(index + 1)
+        pages[index + 1] = (page_text, "text")
+
+    ocr = None
+    if ocr_plan:
+        print(f"OCR planned for {len(ocr_plan)} of {num_pages} pages")
+        ocr = iter_ocr_pages(file, pages=ocr_plan, poppler_path=poppler_path)
+    planned = set(ocr_plan)
+    has_text = any(page_text.strip() for page_text, _ in pages.values())
+    ocr_seconds = 0.0
+
+    try:
+        for page_number in range(1, num_pages + 1):
+            if ocr is not None and page_number in planned:
+                started = time.perf_counter()
+                try:
+                    # iter_ocr_pages yields in page order, so this is page_number
+                    _, ocr_text, seconds = next(ocr)
+                except Exception as e:
+                    # Without OCR there is nothing to return for a fully scanned PDF
+                    if not has_text:
+                        raise
+                    print(f"OCR failed, keeping the text layer only: {str(e)}")
+                    metrics.incr("extract.ocr_failures")
+                    ocr.close()
+                    ocr = None
+                else:
+                    metrics.observe("extract.page.ocr", seconds)
+                    # Keep the text layer if OCR found less than it did (e.g. a blank page)
+                    if len(ocr_text.strip()) >= len(pages[page_number][0].strip()):
+                        pages[page_number] = (ocr_text, "ocr")
+                        has_text = has_text or bool(ocr_text.strip())
+                ocr_seconds += time.perf_counter() - started
+
+            page_text, method = pages.pop(page_number)
+            if not page_text.strip():
+                method = "empty"
+            metrics.incr(f"extract.pages.{method}")
+            yield page_number, page_text, method
+    finally:
+        if ocr is not None:
+            ocr.close()
+        if ocr_plan:
+            metrics.observe("extract.pdf.ocr", ocr_seconds)
+
+
+def extract_pdf_pages(file):
+    """Returns [(page_number, text, method)] for every page (see iter_extracted_pdf_pages)."""
+    return list(iter_extracted_pdf_pages(file))
+
+
+def iter_pdf_pages(file):
+    """
+    Yields a Page per PDF page as it is extracted (empty ones included, so numbers line up).
+    Page text is kept as extracted; only the whitespace at the very start and end of the
+    document is trimmed, as extract_pdf always did. That needs the last non-empty page held
+    back until the next one (or the end) shows up.
+    """
+    held = []  # the last non-empty page plus any empty pages after it
+    first = True
+    for page_number, page_text, method in iter_extracted_pdf_pages(file):
+        if method == "empty":
+            held.append((page_number, "", method))
+            continue
+        if first:
+            page_text = page_text.lstrip()
+            first = False
+        for number, text, held_method in held:
+            yield Page(number, "page", [Block(TEXT, text)], held_method)
+        held = [(page_number, page_text, method)]
+
+    for i, (number, text, method) in enumerate(held):
+        yield Page(number, "page", [Block(TEXT, text.rstrip() if i == 0 else text)], method)
+
+
+ENCRYPTED_PDF_MESSAGE = "❌ This PDF is encrypted and cannot be processed."
+
+
+def pdf_document(file):
+    with open_pdf(file) as reader:
+        encrypted = reader.is_encrypted
 
     # Check if the PDF is encrypted
-    if reader.is_encrypted:
+    if encrypted:
         print("❌ PDF is encrypted, skipping extraction.")
-        return "❌ This PDF is encrypted and cannot be processed."
+        return Document.from_pages("pdf", [Page(1, "page", [Block(TEXT, ENCRYPTED_PDF_MESSAGE)], "encrypted")])
 
+    with metrics.timer("extract.pdf"):
+        return Document.from_pages("pdf", iter_pdf_pages(file))
 
-    # Extract text from all pages
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text and page_text.strip():
-            text.append(page_text)
-    
-    # If no text was extracted, fallback to OCR
-    if not text:
-        print("No selectable text found. Falling back to OCR...")
-        images = convert_from_path(file, poppler_path=poppler_path)
-        ocr_text = " ".join([pytesseract.image_to_string(img) for img in images])
-        text.append(ocr_text) # Append OCR text instead of overwriting 
 
-    return "\n\n".join(text).strip()
+def extract_pdf(file):
+    """Extracts text from a PDF, handles multi-page PDFs, and OCRs only the pages without a usable text layer."""
+    return pdf_document(file).text
 
-def extract_ppt(file):
-    #Extract text from a powerpoint file (PPT/PPTX)
-    pres = Presentation(file)
-    text = []
 
-    for slide in pres.slides:
-        slide_text = []
+def _pptx_blocks(slide):
+    blocks = []
+    for shape in slide.shapes:
+        if getattr(shape, "has_table", False):
+            blocks.append(table_block([cell.text.strip() for cell in row.cells] for row in shape.table.rows))
+        elif hasattr(shape, "text") and shape.text.strip():
+            blocks.append(Block(TEXT, shape.text.strip()))
 
-        for shape in slide.shapes :
-            if hasattr(shape, "text") and shape.text.strip():
-                slide_text.append(shape.text.strip())
+    # Extract Notes (if available)
+    if slide.has_notes_slide and slide.notes_slide.notes_text_frame:
+        blocks.append(Block(NOTES, slide.notes_slide.notes_text_frame.text.strip()))
+    return blocks
 
-        # Extract Notes (if available)
-        if slide.has_notes_slide and slide.notes_slide.notes_text_frame:
-            notes_text = slide.notes_slide.notes_text_frame.text.strip()
-            if notes_text:
-                slide_text.append(f"\n📝 Speaker Notes:\n{notes_text}")
 
-        if slide_text:
-            text.append("\n".join(slide_text))
+def iter_pptx_pages(file):
+    """Yields a Page per slide as the presentation is walked."""
+    pres = Presentation(file)
+    for number, slide in enumerate(pres.slides, start=1):
+        yield Page(number, "slide", _pptx_blocks(slide))
+
+
+def pptx_document(file):
+    return Document.from_pages("pptx", iter_pptx_pages(file))
 
-    return "\n\n".join(text)
 
+def extract_ppt(file):
+    #Extract text from a powerpoint file (PPT/PPTX)
+    return pptx_document(file).text
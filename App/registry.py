@@ -0,0 +1,124 @@
+"""
+Registry of heavyweight resources (models, tokenizers) loaded on first use.
+
+Nothing is loaded at import time: the first caller of get() loads the resource under a
+per-resource lock while concurrent callers wait for it, and later calls are a dict lookup.
+MODEL_WARMUP names resources to load at app startup (in the background unless
+MODEL_WARMUP_BLOCKING is set), and GET /ready reports 503 until those are loaded.
+"""
+import logging
+import os
+import threading
+import time
+
+from App.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated resource names to load at startup, or "all"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "")
+MODEL_WARMUP_BLOCKING = os.getenv("MODEL_WARMUP_BLOCKING", "false").lower() in ("1", "true", "yes")
+
+
+class Resource:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.value = None
+        self.loaded = False
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                start = time.perf_counter()
+                logger.info(f"Loading {self.name}...")
+                try:
+                    self.value = self.loader()
+                except Exception as e:
+                    # Not cached: the next caller retries, e.g. after a transient download failure
+                    self.error = str(e)
+                    metrics.incr(f"registry.{self.name}.load_errors")
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.error = None
+                self.loaded = True
+                metrics.observe(f"registry.{self.name}.load", self.load_seconds)
+                logger.info(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+        return self.value
+
+    def status(self):
+        if self.loaded:
+            state = "loaded"
+        elif self.lock.locked():
+            state = "loading"
+        else:
+            state = "failed" if self.error else "unloaded"
+        return {
+            "state": state,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._resources = {}
+        self._required = set()
+
+    def register(self, name, loader):
+        self._resources[name] = Resource(name, loader)
+        return self._resources[name]
+
+    def resource(self, name):
+        """Decorator form of register: the decorated function becomes the loader."""
+        def decorator(loader):
+            self.register(name, loader)
+            return loader
+        return decorator
+
+    def get(self, name):
+        return self._resources[name].get()
+
+    def warm_up(self, names=None):
+        """Loads the named resources (all if None); the app is not ready until they are."""
+        names = list(self._resources) if names is None else names
+        self._required.update(names)
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Warm-up of {name} failed: {str(e)}")
+
+    def warm_up_from_env(self, spec=MODEL_WARMUP, blocking=MODEL_WARMUP_BLOCKING):
+        spec = spec.strip()
+        if not spec or spec == "none":
+            return
+        names = None if spec == "all" else [n.strip() for n in spec.split(",") if n.strip()]
+        unknown = [n for n in names or [] if n not in self._resources]
+        if unknown:
+            logger.warning(f"MODEL_WARMUP names unknown resources: {', '.join(unknown)}")
+            names = [n for n in names if n in self._resources]
+        if blocking:
+            self.warm_up(names)
+        else:
+            # Mark them required now so /ready reflects the pending warm-up
+            self._required.update(list(self._resources) if names is None else names)
+            threading.Thread(target=self.warm_up, args=(names,), name="warm-up", daemon=True).start()
+
+    def ready(self):
+        return all(self._resources[name].loaded for name in self._required)
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "required": sorted(self._required),
+            "resources": {name: r.status() for name, r in self._resources.items()},
+        }
+
+
+registry = Registry()
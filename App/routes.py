@@ -1,77 +1,51 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from App.validation import TextPayload, SummaryModePayload
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from App.validation import TextPayload, SummaryModePayload, ProcessStreamPayload
 from App.search import search_using_bullets
 from App.errors import handle_exceptions
-from App.cache import cache_summary
-from App.reader import extract_pdf, extract_doc, extract_ppt
-from App.summarizer import  summarize_large_text, explain
-from App.flashcards import flashcards
+from App.cache import cache_summary, document_cache
+from App.summarizer import  summarize_large_text
+from App.mapreduce import explain_document_async, flashcards_document_async
+from App.executors import run_cpu, run_io
+from App.metrics import metrics
+from App.llm import llm
+from App.registry import registry
+from App.ingest import ingest_upload
+from App.dedup import extract_upload, dedup_stats
+from App.streaming import stream_document
+from App.singleflight import flight_key, single_flight
+from App.jobs import DONE, FAILED, get_job_store, job_view, store_upload
+from App.pipelines import EXTRACTORS
+import json
 import logging
-
 import os
-import tempfile
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def validate_file_size(file: UploadFile, max_size_mb: int = 40):
-    """Validate that the file doesn't exceed max size"""
-    max_size = max_size_mb * 1024 * 1024  # Convert to bytes
-    file_size = 0
-    file.file.seek(0, 2)  # Move to end of file
-    file_size = file.file.tell()  # Get file position (size)
-    file.file.seek(0)  # Reset file position to start
-    
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"File too large. Maximum size is {max_size_mb}MB."
-        )
-    return file
-
 # === File Parsing Endpoints ===
+# Uploads are streamed to disk, hashed and size-checked chunk by chunk (see App.ingest);
+# byte-identical re-uploads reuse the earlier extraction (see App.dedup)
 
 @router.post("/parse-pdf")
 @handle_exceptions(500)
 async def parse_pdf(file: UploadFile = File(...)):
-    file = validate_file_size(file)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
-    try:
-        text = extract_pdf(tmp_path)
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    async with ingest_upload(file, ".pdf") as upload:
+        text = await extract_upload(upload, "pdf")
     return {"text": text}
 
 @router.post("/parse-docx")
 @handle_exceptions(500)
 async def parse_docx(file: UploadFile = File(...)):
-    file = validate_file_size(file)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
-    try:
-        text = extract_doc(tmp_path)
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    async with ingest_upload(file, ".docx") as upload:
+        text = await extract_upload(upload, "docx")
     return {"text": text}
     
 @router.post("/parse-pptx")
 @handle_exceptions(500)
 async def parse_pptx(file: UploadFile = File(...)):
-    file = validate_file_size(file)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
-    try:
-        text = extract_ppt(tmp_path)
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    async with ingest_upload(file, ".pptx") as upload:
+        text = await extract_upload(upload, "pptx")
     return {"text": text}
 
 # === Text Processing Endpoints ===
@@ -79,14 +53,14 @@ async def parse_pptx(file: UploadFile = File(...)):
 @router.post("/summarize")
 @handle_exceptions(500)
 async def summarize(payload: TextPayload):
-    summary = summarize_large_text(payload.text)
+    summary = await run_cpu(summarize_large_text, payload.text)
     return {"summary": summary}
 
 
 @router.post("/explain")
 @handle_exceptions(500)
 async def explain_text(payload: TextPayload):
-    explanation = explain(payload.text)
+    explanation = await explain_document_async(payload.text)
     if explanation is None:
         raise HTTPException(status_code=500, detail="Failed to generate explanation")
     return explanation
@@ -94,9 +68,38 @@ async def explain_text(payload: TextPayload):
 @router.post("/flashcards")
 @handle_exceptions(500)
 async def generate_flashcards(payload: TextPayload):
-    fc_data = flashcards(payload.text)
+    fc_data = await flashcards_document_async(payload.text)
     return fc_data
 
+async def _process_document(text, mode):
+    # Initialize optional outputs
+    explanation_data = {}
+    search_results = {}
+    fc_data = {}
+    summary = ""
+
+    if mode == "brief":
+        # Generate summary
+        summary = await run_cpu(summarize_large_text, text)
+
+    if mode == "detailed":
+
+        # Generate explanation with bullets
+        explanation_data = await explain_document_async(text)
+
+        # Generate search results from bullets
+        if explanation_data and "bullets" in explanation_data:
+            search_results = await run_io(search_using_bullets, explanation_data)
+
+    
+    # Return all data
+    return {
+    **({"summary": summary} if summary else {}),
+    **({"explanation": explanation_data} if explanation_data else {}),
+    **({"search_results": search_results} if search_results else {}),
+    **({"flashcards": fc_data} if fc_data else {})
+    }
+
 @router.post("/process-document")
 @handle_exceptions(500)
 async def process_document(payload: SummaryModePayload):
@@ -105,37 +108,111 @@ async def process_document(payload: SummaryModePayload):
         # Get the text and mode from the payload
         text = payload.text
         mode = payload.mode.strip().lower()
-        
-
-        # Initialize optional outputs
-        explanation_data = {}
-        search_results = {}
-        fc_data = {}
-        summary = ""
-
-        if mode == "brief":
-            # Generate summary
-            summary = summarize_large_text(text)
-
-        if mode == "detailed":
-        
-            # Generate explanation with bullets
-            explanation_data = explain(text)
-        
-            # Generate search results from bullets
-            if explanation_data and "bullets" in explanation_data:
-                search_results = search_using_bullets(explanation_data)
-        
-        
-        # Return all data
-        return {
-        **({"summary": summary} if summary else {}),
-        **({"explanation": explanation_data} if explanation_data else {}),
-        **({"search_results": search_results} if search_results else {}),
-        **({"flashcards": fc_data} if fc_data else {})
-        }
+
+        # Concurrent requests for the same document and mode share one computation (see App.singleflight)
+        key = flight_key("process-document", text, mode=mode)
+        return await single_flight.arun(key, lambda: _process_document(text, mode))
     except Exception as e:
         logger.error(f"Error in process_document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
 
+@router.post("/process-document/stream")
+async def process_document_stream(
+    payload: ProcessStreamPayload,
+    request: Request,
+    format: str = Query(default=None, pattern="^(sse|ndjson)$"),
+):
+    """
+    Streamed document processing: each stage result is sent as soon as it is ready. `brief`
+    and `detailed` run the same stages as /process-document; `standard` runs both of them
+    (summary, explanation and search), whereas /process-document returns nothing for it.
+    """
+    if format is None:
+        format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+
+    events = stream_document(
+        payload.text,
+        mode=payload.mode.strip().lower(),
+        generate_flashcards=payload.generate_flashcards,
+        fmt=format,
+    )
+    # Disable proxy buffering so events reach the client as they are produced
+    return StreamingResponse(events, media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# === Background Jobs ===
+# Full processing of large documents runs on job workers (see App.jobs); clients poll for the result
+
+@router.post("/jobs", status_code=202)
+@handle_exceptions(500)
+async def submit_job(
+    file: UploadFile = File(...),
+    generate_flashcards: bool = Query(default=False),
+    priority: int = Query(default=0, ge=-10, le=10),
+):
+    """Queue a document for full processing; returns the job id to poll"""
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    file_type = suffix.lstrip(".")
+    if file_type not in EXTRACTORS:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Use pdf, docx or pptx.")
+
+    async with ingest_upload(file, suffix) as upload:
+        path = await run_io(store_upload, upload.path, suffix)
+    job_id = await run_io(get_job_store().submit, path, file_type, generate_flashcards, priority, file.filename)
+    return {"id": job_id, "status": "queued"}
+
+async def _get_job(job_id):
+    job = await run_io(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return job_view(await _get_job(job_id))
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] == DONE:
+        return json.loads(job["result"])
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"] or "Job failed")
+    raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job: queued jobs stop at once, running ones have their result discarded"""
+    await _get_job(job_id)
+    await run_io(get_job_store().cancel, job_id)
+    return job_view(await _get_job(job_id))
+
+# === Monitoring Endpoints ===
+
+@router.get("/ready")
+async def ready():
+    """503 until the models named in MODEL_WARMUP are loaded; lists every lazily loaded resource"""
+    status = registry.status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters for the memory and disk cache tiers"""
+    return document_cache.stats()
+
+@router.get("/dedup/stats")
+async def upload_dedup_stats():
+    """How often re-uploads skipped extraction, and the extraction time that saved"""
+    return dedup_stats()
+
+@router.get("/llm/stats")
+async def llm_stats():
+    """Circuit breaker state and rate limit headroom of the shared LLM gateway"""
+    return llm.stats()
+
+@router.get("/metrics")
+async def get_metrics():
+    """Counters and timings: extraction methods and per-page times, stage timings, etc."""
+    return metrics.snapshot()
+
 main = router
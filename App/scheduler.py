@@ -0,0 +1,204 @@
+"""
+Runs pipeline stages as a dependency graph on a shared thread pool.
+
+Independent stages run concurrently, a stage starts as soon as its dependencies
+finish (and, if it has one, its `ready` future resolves), and each stage can carry
+its own timeout. The run report records per-stage
+timings and the critical path, i.e. the chain of stages that decided wall-clock time.
+"""
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from App.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_WORKERS", "16")),
+    thread_name_prefix="stage",
+)
+
+
+class StageTimeout(Exception):
+    """Raised in place of a stage result when the stage exceeds its timeout."""
+
+
+class StageSkipped(Exception):
+    """Raised in place of a stage result when one of its dependencies failed."""
+
+
+class Stage:
+    """
+    A named unit of work. `func` is called with the results of `deps`, in order. A stage
+    can also wait on `ready`, a Future that stage `ready_by` resolves partway through its
+    run; its result is passed after the deps' results. The stage is only submitted once
+    `ready` resolves, so waiting never holds a pool thread, and its timeout starts then.
+    """
+
+    def __init__(self, name, func, deps=(), timeout=None, ready=None, ready_by=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.ready = ready
+        self.ready_by = ready_by
+
+    @property
+    def upstream(self):
+        """Stages this one waits on: its deps, plus the stage that resolves `ready`."""
+        return self.deps + ((self.ready_by,) if self.ready_by else ())
+
+
+class StageRun:
+    """Outcome of a single stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class StageRunReport:
+    """Results plus timing instrumentation for one scheduler run."""
+
+    def __init__(self, runs, stages, started, finished):
+        self.runs = runs
+        self.stages = stages
+        self.started = started
+        self.finished = finished
+
+    def __getitem__(self, name):
+        return self.runs[name]
+
+    @property
+    def wall_time(self):
+        return self.finished - self.started
+
+    def critical_path(self):
+        """Walks back from the last stage to finish through the dependency that finished last."""
+        finished = [run for run in self.runs.values() if run.finished is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda run: run.finished)]
+        while True:
+            deps = [self.runs[d] for d in self.stages[path[-1].name].upstream if self.runs[d].finished is not None]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda run: run.finished))
+        return [run.name for run in reversed(path)]
+
+    def timings(self):
+        return {
+            "wall_time": round(self.wall_time, 3),
+            "stages": {
+                name: {
+                    "duration": round(run.duration, 3),
+                    "start_offset": round(run.started - self.started, 3) if run.started else None,
+                    "status": "ok" if run.ok else type(run.error).__name__,
+                }
+                for name, run in self.runs.items()
+            },
+            "critical_path": self.critical_path(),
+        }
+
+
+def run_stages(stages):
+    """Runs the stage graph to completion and returns a StageRunReport."""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.upstream:
+            if dep not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+        if stage.ready is not None and stage.ready_by is None:
+            raise ValueError(f"Stage {stage.name} has a ready future but no ready_by stage")
+
+    runs = {stage.name: StageRun(stage.name) for stage in stages}
+    pending = dict(by_name)
+    running = {}  # future -> (stage, deadline)
+    started = time.perf_counter()
+
+    def resolve(run, value=None, error=None):
+        run.value, run.error = value, error
+        run.finished = time.perf_counter()
+
+    def timed_call(stage, run, args):
+        run.started = time.perf_counter()
+        return stage.func(*args)
+
+    while pending or running:
+        # Launch every stage whose dependencies are resolved
+        for name, stage in list(pending.items()):
+            dep_runs = [runs[d] for d in stage.deps]
+            if any(r.finished is None for r in dep_runs):
+                continue
+            failed = [r.name for r in dep_runs if not r.ok]
+            if failed:
+                del pending[name]
+                resolve(runs[name], error=StageSkipped(f"dependencies failed: {', '.join(failed)}"))
+                continue
+            args = [r.value for r in dep_runs]
+            if stage.ready is not None:
+                if not stage.ready.done():
+                    if runs[stage.ready_by].finished is None:
+                        continue  # woken up below when the future resolves
+                    del pending[name]
+                    resolve(runs[name], error=StageSkipped(f"{stage.ready_by} finished without signalling {name}"))
+                    continue
+                if stage.ready.exception() is not None:
+                    del pending[name]
+                    resolve(runs[name], error=StageSkipped(f"{stage.ready_by} failed: {stage.ready.exception()}"))
+                    continue
+                args.append(stage.ready.result())
+            del pending[name]
+            future = _executor.submit(timed_call, stage, runs[name], args)
+            deadline = time.perf_counter() + stage.timeout if stage.timeout else None
+            running[future] = (stage, deadline)
+
+        if not running:
+            continue
+
+        deadlines = [d for _, d in running.values() if d is not None]
+        wait_for = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+        signals = [stage.ready for stage in pending.values() if stage.ready is not None and not stage.ready.done()]
+        done, _ = wait(list(running) + signals, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future not in running:
+                continue  # a ready signal; its stage is launched at the top of the loop
+            stage, _ = running.pop(future)
+            try:
+                resolve(runs[stage.name], value=future.result())
+            except Exception as e:
+                resolve(runs[stage.name], error=e)
+
+        now = time.perf_counter()
+        for future, (stage, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                # The worker thread cannot be interrupted; its late result is discarded
+                running.pop(future)
+                future.cancel()
+                resolve(runs[stage.name], error=StageTimeout(f"{stage.name} exceeded {stage.timeout}s"))
+
+    report = StageRunReport(runs, by_name, started, time.perf_counter())
+    timings = report.timings()
+    metrics.observe("pipeline.wall_time", report.wall_time)
+    for name, run in runs.items():
+        if run.started is not None:
+            metrics.observe(f"stage.{name}", run.duration)
+        if not run.ok:
+            metrics.incr(f"stage.{name}.{type(run.error).__name__}")
+    logger.info(f"Stages finished in {timings['wall_time']}s, critical path: {' -> '.join(timings['critical_path'])}")
+    return report
@@ -1,43 +1,184 @@
-from pptx import Presentation
 from serpapi import GoogleSearch
 import json 
 import re
 from dotenv import load_dotenv
 import os 
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from App.cache import document_cache, stage_key
 load_dotenv()
 serpapi_key = os.getenv("SERPAPI_KEY")
 
 if not serpapi_key:
-    raise ValueError("❌ Error: SERPAPI_KEY is missing. Please set it in the .env file.")
+    # Only web search needs it; everything else keeps working (see check_environment_variables)
+    logging.warning("SERPAPI_KEY is missing; web search will be skipped.")
+
+SEARCH_VERSION = "serpapi-google:num5:v1"
+
+# Concurrent SerpAPI calls across all requests in this worker
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "5"))
+# How long a cached term result is reused, independent of the document cache TTL
+SEARCH_TERM_TTL = float(os.getenv("SEARCH_TERM_TTL_HOURS", "6")) * 3600
+# Requests per second allowed per SerpAPI key
+SEARCH_RATE_PER_SEC = float(os.getenv("SEARCH_RATE_PER_SEC", "5"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "15"))
+
+# Point the client at a local stand-in (e.g. for tests) instead of serpapi.com
+if os.getenv("SERPAPI_BASE_URL"):
+    GoogleSearch.BACKEND = os.getenv("SERPAPI_BASE_URL").rstrip("/")
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def normalize_term(term):
+    """Case- and whitespace-insensitive form of a search term, used for caching and coalescing."""
+    return " ".join(str(term).lower().split()).strip(" .,;:!?\"'")
+
+
+def fetch_term(query, api_key):
+    """Runs one SerpAPI query and keeps the title/link of each organic result."""
+    params = {
+        "q": query,
+        "api_key": api_key,
+        "num": 5  # Limit to top 5 search results per term
+    }
+    search = GoogleSearch(params)
+    search.timeout = SEARCH_TIMEOUT
+    results = search.get_dict().get("organic_results", [])
+
+    return [
+        {
+            "title": result.get("title", "No title"),
+             "link": result.get("link", result.get("redirect_link", "No link available"))
+        }
+           for result in results]
+
+
+class SearchExecutor:
+    """
+    Bounded-concurrency SerpAPI fan-out shared by every request in the worker.
+
+    Term results are cached in document_cache (so every worker on the same cache backend
+    shares them), each API key is rate limited, and identical in-flight queries share one call.
+    """
+
+    def __init__(self, max_workers=SEARCH_CONCURRENCY, ttl=SEARCH_TERM_TTL,
+                 rate_per_sec=SEARCH_RATE_PER_SEC, fetch=fetch_term):
+        self.ttl = ttl
+        self.rate_per_sec = rate_per_sec
+        self.fetch = fetch
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._inflight = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "fetches": 0, "coalesced": 0, "errors": 0}
+
+    def _term_key(self, normalized):
+        return stage_key("search-term", SEARCH_VERSION, normalized)
+
+    def _limiter(self, api_key):
+        with self._lock:
+            if api_key not in self._limiters:
+                self._limiters[api_key] = TokenBucket(self.rate_per_sec)
+            return self._limiters[api_key]
+
+    def _fetch_and_store(self, normalized, api_key):
+        self._limiter(api_key).acquire()
+        results = self.fetch(normalized, api_key)
+        document_cache.set_key(self._term_key(normalized), {"fetched": time.time(), "results": results})
+        return results
+
+    def _submit(self, normalized, api_key):
+        """Starts a fetch, or joins the one already running for the same term."""
+        with self._lock:
+            future = self._inflight.get(normalized)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+            future = self._pool.submit(self._fetch_and_store, normalized, api_key)
+            self._inflight[normalized] = future
+            self.stats["fetches"] += 1
+
+        def forget(_):
+            with self._lock:
+                if self._inflight.get(normalized) is future:
+                    del self._inflight[normalized]
+
+        future.add_done_callback(forget)
+        return future
+
+    def search_terms(self, terms, api_key):
+        """Returns {term: results} for every term; a term whose lookup fails maps to []."""
+        normalized = {term: normalize_term(term) for term in terms}
+        unique = {norm for norm in normalized.values() if norm}
+
+        keys = {norm: self._term_key(norm) for norm in unique}
+        cached = document_cache.get_many_keys(keys.values())
+
+        now = time.time()
+        found, futures = {}, {}
+        for norm in unique:
+            entry = cached.get(keys[norm])
+            if entry and now - entry.get("fetched", 0) <= self.ttl:
+                found[norm] = entry["results"]
+            else:
+                futures[norm] = self._submit(norm, api_key)
+
+        with self._lock:
+            self.stats["cache_hits"] += len(found)
+
+        for norm, future in futures.items():
+            try:
+                found[norm] = future.result()
+            except Exception as e:
+                logging.error(f"Web search failed for {norm!r}: {str(e)}")
+                with self._lock:
+                    self.stats["errors"] += 1
+                found[norm] = []
+
+        return {term: found.get(norm, []) for term, norm in normalized.items()}
+
+
+search_executor = SearchExecutor()
+
 
 def search_using_bullets(parsed_response):
 
     """
     Takes the parsed OpenAI response, extracts the 'bullets' list,
     and performs a web search for each term using SerpAPI.
+    Terms are looked up concurrently and cached individually (see SearchExecutor).
     """
     if not parsed_response or not isinstance(parsed_response, dict) or "bullets" not in parsed_response:
         return {"error": "No valid bullets extracted from OpenAI response."}
 
     bullets = list(set(parsed_response["bullets"]))  # Extract key terms
-    search_results = {}
 
     serpapi_key = os.getenv("SERPAPI_KEY")  # Ensure API key is set
+    if not serpapi_key:
+        return {"error": "❌ SERPAPI_KEY is missing. Please set it in the .env file."}
 
-    for term in bullets:
-        params = {
-            "q": term,
-            "api_key": serpapi_key,
-            "num": 5  # Limit to top 5 search results per term
-        }
-        search = GoogleSearch(params)
-        results = search.get_dict().get("organic_results", [])
-
-        search_results[term] = [
-            {
-                "title": result.get("title", "No title"),
-                 "link": result.get("link", result.get("redirect_link", "No link available"))
-            }
-               for result in results] # Store search results per key term
-
-    return search_results
\ No newline at end of file
+    return search_executor.search_terms(bullets, serpapi_key)
@@ -0,0 +1,164 @@
+"""
+Single-flight execution for identical in-flight work.
+
+When many requests ask for the same document at once, only one computes it:
+  - within a worker, later callers await the first caller's task / future;
+  - across workers, the computing worker holds a lock in the shared cache backend, and
+    other workers wait for it to be released and then run, hitting the stage caches the
+    leader just filled instead of calling the models again.
+
+If the lock cannot be had within SINGLEFLIGHT_WAIT_SECONDS (e.g. a stuck holder), the
+caller computes anyway rather than failing.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+
+from App.cache import document_cache, make_cache_key
+from App.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Longest a computation may hold the cross-worker lock before others may take over
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "900"))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "900"))
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.25"))
+
+
+def flight_key(scope, text, **options):
+    """Key identifying one computation: the document hash plus everything that changes the result."""
+    return make_cache_key(text, {"flight": scope, **options})
+
+
+def _lock_name(key):
+    return f"flight-{key}"
+
+
+def _try_lock(key, token):
+    try:
+        return document_cache.acquire_lock(_lock_name(key), token, SINGLEFLIGHT_LOCK_TTL)
+    except Exception as e:
+        # A backend without locks (or a down Redis) only loses cross-worker coalescing
+        logger.warning(f"Single-flight lock unavailable: {str(e)}")
+        return True
+
+
+def _unlock(key, token):
+    try:
+        document_cache.release_lock(_lock_name(key), token)
+    except Exception as e:
+        logger.warning(f"Single-flight unlock failed: {str(e)}")
+
+
+@contextmanager
+def worker_lock(key):
+    """Holds the cross-worker lock for `key`, waiting while another worker holds it."""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT_SECONDS
+    waited = False
+    while not _try_lock(key, token):
+        if time.monotonic() >= deadline:
+            logger.warning(f"Single-flight wait for {key[:12]} timed out; computing anyway")
+            token = None
+            break
+        waited = True
+        time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+    if waited:
+        metrics.incr("singleflight.waited_on_worker")
+    try:
+        yield
+    finally:
+        if token:
+            _unlock(key, token)
+
+
+@asynccontextmanager
+async def async_worker_lock(key):
+    """worker_lock for coroutines; backend calls run off the event loop."""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT_SECONDS
+    waited = False
+    while not await asyncio.to_thread(_try_lock, key, token):
+        if time.monotonic() >= deadline:
+            logger.warning(f"Single-flight wait for {key[:12]} timed out; computing anyway")
+            token = None
+            break
+        waited = True
+        await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
+    if waited:
+        metrics.incr("singleflight.waited_on_worker")
+    try:
+        yield
+    finally:
+        if token:
+            await asyncio.to_thread(_unlock, key, token)
+
+
+class SingleFlight:
+    """In-flight registry for one worker; `run` (threads) and `arun` (coroutines) share nothing but the backend lock."""
+
+    def __init__(self):
+        self._futures = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) once per key at a time; concurrent callers get the same result."""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+
+        if not leader:
+            metrics.incr("singleflight.coalesced")
+            return future.result()
+
+        try:
+            with worker_lock(key):
+                result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    async def arun(self, key, factory):
+        """
+        Awaits factory() once per key at a time. The computation runs as its own task, so
+        the caller that started it disconnecting does not cancel it for everyone else.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lead(key, factory))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            metrics.incr("singleflight.coalesced")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the outcome as seen even if every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    async def _lead(self, key, factory):
+        async with async_worker_lock(key):
+            return await factory()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._futures) + len(self._tasks)
+
+
+single_flight = SingleFlight()
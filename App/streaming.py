@@ -0,0 +1,155 @@
+"""
+Incremental document processing for /process-document/stream.
+
+Stages run concurrently and each result is emitted the moment it is ready, as
+Server-Sent Events or NDJSON, instead of one response after the slowest stage.
+"""
+import asyncio
+import json
+import time
+
+from App.cache import document_cache, stage_key
+from App.executors import run_cpu, run_io
+from App.mapreduce import aiter_explanation_document, aiter_flashcards_document
+from App.metrics import metrics
+from App.search import search_using_bullets
+from App.summarizer import SUMMARY_VERSION, chunk_text, make_batches, summarize_chunks
+
+# Events that carry actual results, as opposed to bookkeeping like text_stats
+RESULT_EVENTS = {
+    "summary_chunk", "summary", "bullet", "explanation", "notes", "search_results",
+    "flashcard", "mcq", "flashcards",
+}
+
+# Per-item events emitted while a completion is still streaming
+FLASHCARD_ITEM_EVENTS = {"Cards": "flashcard", "MCQ": "mcq"}
+
+
+def encode_event(name, data, fmt):
+    if fmt == "sse":
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": name, "data": data}) + "\n"
+
+
+async def _summary_stage(text, emit):
+    key = stage_key("summary", SUMMARY_VERSION, text)
+    cached = await asyncio.to_thread(document_cache.get_key, key)
+    if cached is not None:
+        await emit("summary", {"summary": cached, "cached": True})
+        return
+
+    chunks = await run_cpu(chunk_text, text)
+    summaries = [None] * len(chunks)
+    for batch in make_batches(chunks):
+        batch_summaries = await run_cpu(summarize_chunks, [chunks[i] for i in batch])
+        for index, summary in zip(batch, batch_summaries):
+            summaries[index] = summary
+            await emit("summary_chunk", {"index": index, "total": len(chunks), "summary": summary})
+
+    summary = " ".join(summaries).strip()
+    await asyncio.to_thread(document_cache.set_key, key, summary)
+    await emit("summary", {"summary": summary, "cached": False})
+
+
+async def _search(bullets, emit):
+    await emit("search_results", await run_io(search_using_bullets, {"bullets": bullets}))
+
+
+async def _explanation_stage(text, emit, with_search):
+    # Bullets close first in the streamed JSON, so search starts while the model is still writing
+    search_task = None
+    explanation = None
+    notes_sent = False
+    try:
+        async for kind, key, value in aiter_explanation_document(text):
+            if kind == "item" and key == "bullets":
+                await emit("bullet", {"bullet": value})
+            elif kind == "field" and key == "bullets" and with_search and value and search_task is None:
+                search_task = asyncio.create_task(_search(value, emit))
+            elif kind == "field" and key == "Notes":
+                notes_sent = True
+                await emit("notes", {"notes": value})
+            elif kind == "result":
+                explanation = value
+
+        if not isinstance(explanation, dict):
+            await emit("error", {"stage": "explanation", "detail": "Failed to generate explanation"})
+            return
+        await emit("explanation", explanation)
+        if not notes_sent:
+            await emit("notes", {"notes": explanation.get("Notes", "Notes not available")})
+
+        if search_task is not None:
+            await search_task
+    finally:
+        if search_task is not None and not search_task.done():
+            search_task.cancel()
+
+
+async def _flashcards_stage(text, emit):
+    async for kind, key, value in aiter_flashcards_document(text):
+        if kind == "item" and key in FLASHCARD_ITEM_EVENTS:
+            await emit(FLASHCARD_ITEM_EVENTS[key], value)
+        elif kind == "result":
+            await emit("flashcards", value)
+
+
+async def stream_document(text, mode="standard", generate_flashcards=False, fmt="ndjson"):
+    """
+    Yields encoded events as stages finish. `brief` runs the summary only and `detailed` the
+    explanation, notes and search, as /process-document does for those modes; `standard`
+    runs both (/process-document has no stages for it). Flashcards are opt-in.
+    """
+    started = time.perf_counter()
+    queue = asyncio.Queue()
+    first_byte = first_result = None
+
+    async def emit(name, data):
+        await queue.put((name, data))
+
+    async def guarded(stage, coro):
+        try:
+            await coro
+        except Exception as e:
+            await emit("error", {"stage": stage, "detail": str(e)})
+
+    stages = []
+    if mode in ("brief", "standard"):
+        stages.append(("summary", _summary_stage(text, emit)))
+    if mode in ("detailed", "standard"):
+        stages.append(("explanation", _explanation_stage(text, emit, with_search=True)))
+    if generate_flashcards:
+        stages.append(("flashcards", _flashcards_stage(text, emit)))
+
+    await emit("text_stats", {"chars": len(text), "words": len(text.split()), "stages": [s for s, _ in stages]})
+    tasks = [asyncio.create_task(guarded(stage, coro)) for stage, coro in stages]
+    done_marker = asyncio.gather(*tasks)
+    done_marker.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            name, data = item
+
+            elapsed = time.perf_counter() - started
+            if first_byte is None:
+                first_byte = elapsed
+                metrics.observe("stream.time_to_first_byte", elapsed)
+            if first_result is None and name in RESULT_EVENTS:
+                first_result = elapsed
+                metrics.observe("stream.time_to_first_result", elapsed)
+
+            yield encode_event(name, data, fmt)
+
+        total = time.perf_counter() - started
+        metrics.observe("stream.total", total)
+        yield encode_event("done", {
+            "total_seconds": round(total, 3),
+            "time_to_first_result": round(first_result, 3) if first_result is not None else None,
+        }, fmt)
+    finally:
+        # Client went away (or we finished): stop any stage still running
+        for task in tasks:
+            task.cancel()
@@ -1,62 +1,103 @@
 from dotenv import load_dotenv
-from transformers import pipeline
-from openai import OpenAI
+import asyncio
 import json 
 import re
 import textwrap
 import os
-summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6",framework= "pt")
+from App.chunking import DEFAULT_CHUNK_TOKENS, iter_chunks
+from App.cache import document_cache, memoize_stage, stage_key
+from App.llm import llm
+from App.registry import registry
+from App.document import Document
+from App.summary_backends import SUMMARIZER_BACKEND, create_summarization_backend
+from App.model_server import SUMMARIZER_SERVER, ModelServerClient
+from App.jsonstream import aiter_completion_events, iter_completion_events, replay
+SUMMARY_MODEL = "sshleifer/distilbart-cnn-12-6"
+EXPLAIN_MODEL = "gpt-4o"
+# Bump when the chunking/generation settings or the explain prompt change. Non-default
+# backends (int8, ONNX) produce slightly different text, so they get their own cache entries.
+SUMMARY_VERSION = f"{SUMMARY_MODEL}:v2" if SUMMARIZER_BACKEND == "transformers" else f"{SUMMARY_MODEL}:{SUMMARIZER_BACKEND}:v2"
+EXPLAIN_VERSION = f"{EXPLAIN_MODEL}:prompt-v1"
+
+@registry.resource("summarizer")
+def load_summarizer():
+    if SUMMARIZER_SERVER:
+        # The model lives in App.model_server; this process only holds a connection to it
+        return ModelServerClient(SUMMARIZER_SERVER)
+    # transformers/torch alone take seconds to import; backends only import them when built
+    return create_summarization_backend(SUMMARY_MODEL)
+
+
+def get_summarizer():
+    """The configured summarization backend (see App.summary_backends), loaded on first use."""
+    return registry.get("summarizer")
+
 
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
 
-def chunk_text(text, chunk_size=1024):
-    """Splits text into smaller chunks with max tokens of 1024 (or less)."""
-    if isinstance(text, list):
-        text = "\n\n".join(text)
+def chunk_text(text, chunk_size=DEFAULT_CHUNK_TOKENS, overlap=0):
+    """Splits text (or a list of page texts) into chunks of at most `chunk_size` model tokens."""
+    return list(iter_chunks(text, chunk_size=chunk_size, overlap=overlap))
+
+
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+
+
+def summary_lengths(input_length):
+    """Returns (max_length, min_length) for a chunk of `input_length` words."""
+    max_len = max(50, min(300, int(input_length * 0.5)))
+    min_len = max(25, int(max_len * 0.5))
+    return max_len, min_len
+
 
-    words = text.split()  # Split text into words
-    chunks = []
-    current_chunck = []
+def make_batches(chunks, batch_size=SUMMARY_BATCH_SIZE):
+    """
+    Groups chunk indices into batches of similar length so padding stays small. A batch only
+    holds chunks with the same summary_lengths, so a short chunk never caps the others' summaries.
+    """
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i].split()), reverse=True)
+    buckets = {}
+    for i in order:
+        buckets.setdefault(summary_lengths(len(chunks[i].split())), []).append(i)
+    return [bucket[i:i + batch_size] for bucket in buckets.values() for i in range(0, len(bucket), batch_size)]
 
-    for word in words:
-        current_chunck.append(word)
 
-        if len(" ".join(current_chunck)) >= chunk_size:
-            chunks.append(" ".join(current_chunck))
-            current_chunck = []
+def summarize_chunks(chunks, batch_size=SUMMARY_BATCH_SIZE, summarizer=None):
+    """Summarizes chunks with padded batch inference and returns the summaries in input order."""
+    summaries = [None] * len(chunks)
+    summarizer = summarizer or get_summarizer()
+    if isinstance(summarizer, ModelServerClient):
+        # The server batches across every concurrent request itself
+        return summarizer.summarize_chunks(chunks)
 
-    if current_chunck:
-        chunks.append(" ".join(current_chunck))
+    for batch in make_batches(chunks, batch_size):
+        batch_text = [chunks[i] for i in batch]
 
-    return chunks
+        # Every chunk in a batch shares its summary lengths (see make_batches)
+        max_len, min_len = summary_lengths(len(batch_text[0].split()))
 
+        outputs = summarizer.summarize(batch_text, max_length=max_len, min_length=min_len)
+        for index, summary in zip(batch, outputs):
+            summaries[index] = summary
 
-def summarize_large_text(text):
-    """Summarizes large text by breaking it into chunks and summarizing each separately."""
-    text_chunks = chunk_text(text, chunk_size=1024)  # Break text into chunks
-    summarized_text = []
+    return summaries
 
-    for chunk in text_chunks:
-        input_length = len(chunk.split())
 
-        max_len = max(50, min(300, int(input_length * 0.5)))
-        min_len = max(25, int(max_len * 0.5))
+def _source_text(source):
+    return source.text if isinstance(source, Document) else source
 
-        summary = summarizer(chunk, max_length=max_len , min_length=min_len, do_sample=False)
-        summarized_text.append(summary[0]['summary_text'])
+
+@memoize_stage("summary", SUMMARY_VERSION, key_func=_source_text)
+def summarize_large_text(source):
+    """Summarizes large text (or an extracted Document) by breaking it into chunks and summarizing them in batches."""
+    # A Document is chunked page by page instead of re-splitting its whole flat text
+    text_chunks = chunk_text(source.page_texts() if isinstance(source, Document) else source)
+    summarized_text = summarize_chunks(text_chunks)
 
     return " ".join(summarized_text).strip()
 
 
-def explain(text):
-    response = client .chat.completions.create(
-        model= "gpt-4o",
-        messages=[
-            {
-              "role":"developer",
-              "content":"""
+EXPLAIN_PROMPT = """
                 I want you to process this text in two ways and return the output in JSON format with two keys: 
                 'bullets' and 'explanation'. 
 
@@ -81,15 +122,24 @@ def explain(text):
                     "Notes" : "Fulle detailed notes  here. "
                 }}
                 """
-            },
-            {
-                "role":"user",
-                "content": text
-            }
-        ]
-    )
-    print("calling Gpt in summarizer")
-    answer = response.choices[0].message.content.strip()
+
+
+def explain_messages(text):
+    return [
+        {
+          "role":"developer",
+          "content": EXPLAIN_PROMPT
+        },
+        {
+            "role":"user",
+            "content": text
+        }
+    ]
+
+
+def parse_explanation(answer):
+    """Parses the model's JSON answer, tolerating Markdown fences. Returns None if it is not JSON."""
+    answer = answer.strip()
     try:
 
         # Attempt to parse as JSON
@@ -100,3 +150,67 @@ def explain(text):
         print("Error: OpenAI did not return valid JSON. Full response:")
         print(answer)
         return None
+
+
+@memoize_stage("explain", EXPLAIN_VERSION)
+def explain(text):
+    response = llm.chat(
+        model= EXPLAIN_MODEL,
+        messages=explain_messages(text)
+    )
+    print("calling Gpt in summarizer")
+    return parse_explanation(response.choices[0].message.content)
+
+
+@memoize_stage("explain", EXPLAIN_VERSION)
+async def explain_async(text):
+    """Same as explain, using the async client so the event loop is never blocked."""
+    response = await llm.achat(
+        model= EXPLAIN_MODEL,
+        messages=explain_messages(text)
+    )
+    return parse_explanation(response.choices[0].message.content)
+
+
+def iter_explanation(text):
+    """
+    Streams the explanation, yielding (kind, key, value) events as soon as each part closes:
+    ("item", "bullets", term) per bullet, ("field", key, value) per finished field, and
+    finally ("result", None, parsed) with what explain() would return. Shares explain's cache.
+    """
+    key = stage_key("explain", EXPLAIN_VERSION, text)
+    cached = document_cache.get_key(key)
+    if cached is not None:
+        yield from replay(cached)
+        yield "result", None, cached
+        return
+
+    parts = []
+    stream = llm.chat_stream(model=EXPLAIN_MODEL, messages=explain_messages(text))
+    yield from iter_completion_events(stream, parts)
+
+    parsed_response = parse_explanation("".join(parts))
+    if parsed_response:
+        document_cache.set_key(key, parsed_response)
+    yield "result", None, parsed_response
+
+
+async def aiter_explanation(text):
+    """Async version of iter_explanation."""
+    key = stage_key("explain", EXPLAIN_VERSION, text)
+    cached = await asyncio.to_thread(document_cache.get_key, key)
+    if cached is not None:
+        for event in replay(cached):
+            yield event
+        yield "result", None, cached
+        return
+
+    parts = []
+    stream = llm.achat_stream(model=EXPLAIN_MODEL, messages=explain_messages(text))
+    async for event in aiter_completion_events(stream, parts):
+        yield event
+
+    parsed_response = parse_explanation("".join(parts))
+    if parsed_response:
+        await asyncio.to_thread(document_cache.set_key, key, parsed_response)
+    yield "result", None, parsed_response
@@ -0,0 +1,119 @@
+"""
+Pluggable summarization backends for CPU inference.
+
+SUMMARIZER_BACKEND selects one:
+  - "transformers": the PyTorch DistilBART pipeline (default)
+  - "quantized":    the same model with its Linear layers dynamically quantized to int8
+  - "onnx":         the model exported to ONNX and run by ONNX Runtime (needs `optimum[onnxruntime]`)
+
+All of them take a batch of chunks and return one summary per chunk, so summarize_chunks
+and the benchmarks don't care which one is loaded. Use benchmarks/bench_summarizer_backends.py
+to compare quality and speed before switching a deployment.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZER_BACKEND = os.getenv("SUMMARIZER_BACKEND", "transformers").strip().lower()
+# Where the ONNX export is kept so it only happens once per machine
+SUMMARIZER_ONNX_DIR = os.getenv("SUMMARIZER_ONNX_DIR", "./cache/onnx")
+# Intra-op threads for torch / ONNX Runtime; 0 keeps the library default
+SUMMARIZER_THREADS = int(os.getenv("SUMMARIZER_THREADS", "0"))
+
+
+class SummarizationBackend:
+    """Base class: subclasses build a transformers-compatible summarization pipeline."""
+
+    name = "base"
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.pipe = self.build()
+
+    def build(self):
+        raise NotImplementedError
+
+    def summarize(self, texts, max_length, min_length):
+        outputs = self.pipe(
+            texts,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            truncation=True,
+            batch_size=len(texts),
+        )
+        return [output["summary_text"] for output in outputs]
+
+
+class TransformersBackend(SummarizationBackend):
+    name = "transformers"
+
+    def build(self):
+        from transformers import pipeline
+        _set_torch_threads()
+        return pipeline("summarization", model=self.model_name, framework="pt")
+
+
+class QuantizedBackend(SummarizationBackend):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized on the fly."""
+
+    name = "quantized"
+
+    def build(self):
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+
+        _set_torch_threads()
+        model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+        model.eval()
+        quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return pipeline("summarization", model=quantized, tokenizer=tokenizer, framework="pt")
+
+
+class ONNXBackend(SummarizationBackend):
+    name = "onnx"
+
+    def build(self):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise ImportError("SUMMARIZER_BACKEND=onnx needs `pip install optimum[onnxruntime]`") from e
+        from transformers import AutoTokenizer, pipeline
+
+        export_dir = os.path.join(SUMMARIZER_ONNX_DIR, self.model_name.replace("/", "--"))
+        session_options = None
+        if SUMMARIZER_THREADS:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = SUMMARIZER_THREADS
+
+        if os.path.isdir(export_dir):
+            model = ORTModelForSeq2SeqLM.from_pretrained(export_dir, session_options=session_options)
+        else:
+            logger.info(f"Exporting {self.model_name} to ONNX in {export_dir} (one-time)")
+            model = ORTModelForSeq2SeqLM.from_pretrained(self.model_name, export=True, session_options=session_options)
+            model.save_pretrained(export_dir)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TransformersBackend, QuantizedBackend, ONNXBackend)
+}
+
+
+def _set_torch_threads():
+    if SUMMARIZER_THREADS:
+        import torch
+        torch.set_num_threads(SUMMARIZER_THREADS)
+
+
+def create_summarization_backend(model_name, name=None):
+    """Builds the backend selected by SUMMARIZER_BACKEND (or `name`)."""
+    name = (name or SUMMARIZER_BACKEND).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown SUMMARIZER_BACKEND: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_name)
@@ -13,3 +13,6 @@ class TextPayload(BaseModel):
 
 class SummaryModePayload(TextPayload):
     mode: Optional[str] = Field(default="standard", pattern="^(brief|standard|detailed)$")
+
+class ProcessStreamPayload(SummaryModePayload):
+    generate_flashcards: bool = False
@@ -0,0 +1,93 @@
+"""
+Load test: concurrent uploads plus a stream of lightweight pings against a running server.
+
+Blocking handlers show up as ping latency climbing with every upload in flight; with the
+work moved off the event loop, pings stay flat while uploads proceed. Run once against a
+server on the old commit and once on the new one to compare.
+
+    RATE_LIMIT_MAX_REQUESTS=100000 uvicorn App.main:app --port 8000
+    python -m benchmarks.bench_concurrency --url http://localhost:8000 --file TestDocs/Agriculture.pdf
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def upload(client, endpoint, path, latencies, errors):
+    with open(path, "rb") as f:
+        content = f.read()
+    start = time.perf_counter()
+    try:
+        response = await client.post(endpoint, files={"file": (os.path.basename(path), content)})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    except httpx.HTTPError:
+        errors.append(1)
+
+
+async def ping(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get("/")
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    endpoint = args.endpoint or {".pdf": "/parse-pdf", ".docx": "/parse-docx", ".pptx": "/parse-pptx"}[
+        os.path.splitext(args.file)[1].lower()
+    ]
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        upload_latencies, ping_latencies, errors = [], [], []
+        stop = asyncio.Event()
+        pinger = asyncio.create_task(ping(client, stop, ping_latencies))
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited():
+            async with semaphore:
+                await upload(client, endpoint, args.file, upload_latencies, errors)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await pinger
+
+    print(f"{args.requests} uploads to {endpoint} at concurrency {args.concurrency} in {elapsed:.2f}s")
+    print(f"throughput: {len(upload_latencies) / elapsed:.2f} req/s, errors: {len(errors)}")
+    if upload_latencies:
+        print(f"upload latency p50={statistics.median(upload_latencies):.3f}s p95={percentile(upload_latencies, 95):.3f}s")
+    if ping_latencies:
+        print(f"ping latency   p50={statistics.median(ping_latencies) * 1000:.1f}ms "
+              f"p95={percentile(ping_latencies, 95) * 1000:.1f}ms max={max(ping_latencies) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--file", default="TestDocs/Agriculture.pdf")
+    parser.add_argument("--endpoint", default=None, help="Defaults to the parse endpoint for the file type")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
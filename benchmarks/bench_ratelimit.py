@@ -0,0 +1,69 @@
+"""
+Per-request overhead and memory of the rate limiter: the old list-of-timestamps
+middleware logic against the GCRA limiter, for a growing number of distinct clients.
+
+Run from the repository root:
+    python -m benchmarks.bench_ratelimit [--requests 200000] [--limit 100] [--window 60]
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from App.ratelimit import GCRALimiter
+
+
+class ListLimiter:
+    """The previous RateLimitMiddleware algorithm, minus the HTTP plumbing."""
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window = window_seconds
+        self.request_counts = defaultdict(list)
+
+    def check(self, key, cost=1, now=None):
+        now = time.time() if now is None else now
+        self.request_counts[key] = [t for t in self.request_counts[key] if now - t < self.window]
+        if len(self.request_counts[key]) >= self.limit:
+            return False, 0.0
+        self.request_counts[key].append(now)
+        return True, 0.0
+
+    def __len__(self):
+        return len(self.request_counts)
+
+
+def run(limiter, keys, clock_step):
+    """Replays `keys` against the limiter on a simulated clock; returns ns/request."""
+    now = 0.0
+    start = time.perf_counter_ns()
+    for key in keys:
+        limiter.check(key, 1, now)
+        now += clock_step
+    return (time.perf_counter_ns() - start) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=100, help="Requests allowed per window")
+    parser.add_argument("--window", type=float, default=60)
+    parser.add_argument("--max-keys", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Simulated traffic spans three windows so idle clients exist and can be evicted
+    clock_step = 3 * args.window / args.requests
+    print(f"{'clients':>8} {'list ns/req':>12} {'gcra ns/req':>12} {'list keys':>10} {'gcra keys':>10}")
+    for clients in (1, 100, 10000, 100000):
+        rng = random.Random(clients)
+        keys = [f"10.0.{rng.randrange(clients)}" for _ in range(args.requests)]
+
+        legacy = ListLimiter(args.limit, args.window)
+        gcra = GCRALimiter(args.limit, args.window, max_keys=args.max_keys)
+        legacy_ns = run(legacy, keys, clock_step)
+        gcra_ns = run(gcra, keys, clock_step)
+        print(f"{clients:>8} {legacy_ns:>12.0f} {gcra_ns:>12.0f} {len(legacy):>10} {len(gcra):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cold-start cost: import time and peak RSS of the app's entry modules, each measured in a
+fresh interpreter, plus time from process start until the app answers /ready.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeat 5] [--importtime]
+
+Set MODEL_WARMUP / MODEL_WARMUP_BLOCKING in the environment to include model loading.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+MODULES = ["App.reader", "App.cache", "App.summarizer", "App.routes", "App.main"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+__import__({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+STARTUP_PROBE = """
+import json, resource, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from App.main import app
+with TestClient(app) as client:
+    status = client.get("/ready").status_code
+    elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "status": status}))
+"""
+
+
+def run_probe(code, env):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(code, repeat, env):
+    runs = [run_probe(code, env) for _ in range(repeat)]
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "rss_mb": statistics.median(r["rss_mb"] for r in runs),
+        "status": runs[-1].get("status"),
+    }
+
+
+def top_imports(module, env, count=10):
+    """Slowest imports (cumulative) according to python -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=env)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)), match.group(4)))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports of App.main")
+    args = parser.parse_args()
+
+    env = dict(os.environ, JOB_WORKERS=os.getenv("JOB_WORKERS", "0"))
+
+    print(f"{'module':<16} {'import s':>9} {'rss MB':>8}")
+    for module in MODULES:
+        result = measure(PROBE.format(module=module), args.repeat, env)
+        print(f"{module:<16} {result['seconds']:>9.3f} {result['rss_mb']:>8.1f}")
+
+    result = measure(STARTUP_PROBE, args.repeat, env)
+    print(f"{'startup→/ready':<16} {result['seconds']:>9.3f} {result['rss_mb']:>8.1f}  (HTTP {result['status']})")
+
+    if args.importtime:
+        print("\nSlowest imports under App.main (cumulative):")
+        for micros, name in top_imports("App.main", env):
+            print(f"  {micros / 1e6:>7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
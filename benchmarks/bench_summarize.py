@@ -0,0 +1,65 @@
+"""
+Compares the per-chunk summarization loop against batched inference.
+
+Run from the repository root:
+    python -m benchmarks.bench_summarize [--docs TestDocs] [--limit 64] [--batch-size 8]
+"""
+import argparse
+import glob
+import os
+import time
+
+from App.reader import extract_pdf
+from App.summarizer import chunk_text, get_summarizer, summarize_chunks, summary_lengths
+
+
+def summarize_loop(chunks):
+    """The original one-forward-pass-per-chunk loop."""
+    summaries = []
+    summarizer = get_summarizer()
+    for chunk in chunks:
+        max_len, min_len = summary_lengths(len(chunk.split()))
+        summaries.extend(summarizer.summarize([chunk], max_length=max_len, min_length=min_len))
+    return summaries
+
+
+def load_chunks(docs_dir, limit):
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(docs_dir, "*.pdf"))):
+        text = extract_pdf(path)
+        doc_chunks = chunk_text(text)
+        print(f"{os.path.basename(path)}: {len(doc_chunks)} chunks")
+        chunks.extend(doc_chunks)
+    return chunks[:limit] if limit else chunks
+
+
+def timed(label, func, chunks):
+    start = time.perf_counter()
+    func(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(chunks)} chunks in {elapsed:.2f}s -> {len(chunks) / elapsed:.2f} chunks/sec")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", default="TestDocs")
+    parser.add_argument("--limit", type=int, default=64, help="Max chunks to summarize (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs, args.limit)
+    if not chunks:
+        print("No chunks to summarize.")
+        return
+
+    # Warm up so model loading and first-call overhead are not measured
+    get_summarizer().summarize(chunks[:1], max_length=50, min_length=25)
+
+    loop_time = timed("loop", summarize_loop, chunks)
+    batch_time = timed("batched", lambda c: summarize_chunks(c, batch_size=args.batch_size), chunks)
+    print(f"speedup: {loop_time / batch_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
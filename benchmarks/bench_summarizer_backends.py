@@ -0,0 +1,119 @@
+"""
+Quality and speed of each summarization backend on a fixed corpus.
+
+There are no reference summaries for TestDocs, so quality is ROUGE-1/2/L F1 of each
+backend's output against the plain transformers backend: it shows how far int8 or ONNX
+drift from the model the app was tuned on, not absolute summary quality.
+
+Run from the repository root:
+    python -m benchmarks.bench_summarizer_backends [--docs TestDocs] [--limit 32] [--backends transformers,quantized,onnx]
+"""
+import argparse
+import re
+import time
+
+from App.summarizer import SUMMARY_MODEL, summarize_chunks
+from App.summary_backends import BACKENDS, create_summarization_backend
+from benchmarks.bench_summarize import load_chunks
+
+
+def tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def ngrams(words, n):
+    counts = {}
+    for i in range(len(words) - n + 1):
+        gram = tuple(words[i:i + n])
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def f1(overlap, candidate_total, reference_total):
+    if not overlap or not candidate_total or not reference_total:
+        return 0.0
+    precision = overlap / candidate_total
+    recall = overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_n(candidate, reference, n):
+    cand, ref = ngrams(tokens(candidate), n), ngrams(tokens(reference), n)
+    overlap = sum(min(count, ref.get(gram, 0)) for gram, count in cand.items())
+    return f1(overlap, sum(cand.values()), sum(ref.values()))
+
+
+def rouge_l(candidate, reference):
+    cand, ref = tokens(candidate), tokens(reference)
+    # Longest common subsequence, one row at a time
+    previous = [0] * (len(ref) + 1)
+    for word in cand:
+        current = [0]
+        for j, ref_word in enumerate(ref):
+            current.append(previous[j] + 1 if word == ref_word else max(previous[j + 1], current[j]))
+        previous = current
+    return f1(previous[-1], len(cand), len(ref))
+
+
+def mean_scores(candidates, references):
+    count = len(references)
+    return {
+        "rouge1": sum(rouge_n(c, r, 1) for c, r in zip(candidates, references)) / count,
+        "rouge2": sum(rouge_n(c, r, 2) for c, r in zip(candidates, references)) / count,
+        "rougeL": sum(rouge_l(c, r) for c, r in zip(candidates, references)) / count,
+    }
+
+
+def run_backend(name, chunks, batch_size):
+    start = time.perf_counter()
+    try:
+        backend = create_summarization_backend(SUMMARY_MODEL, name)
+    except Exception as e:
+        print(f"{name:<13} skipped: {str(e)}")
+        return None
+    load_time = time.perf_counter() - start
+
+    backend.summarize(chunks[:1], max_length=50, min_length=25)  # first-call overhead
+    start = time.perf_counter()
+    summaries = summarize_chunks(chunks, batch_size=batch_size, summarizer=backend)
+    elapsed = time.perf_counter() - start
+    return {"summaries": summaries, "load": load_time, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", default="TestDocs")
+    parser.add_argument("--limit", type=int, default=32, help="Max chunks to summarize (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs, args.limit)
+    if not chunks:
+        print("No chunks to summarize.")
+        return
+
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    if "transformers" not in names:
+        names.insert(0, "transformers")  # the reference for the ROUGE scores
+
+    results = {name: run_backend(name, chunks, args.batch_size) for name in names}
+    reference = results["transformers"]
+    if reference is None:
+        print("The transformers backend is needed as the ROUGE reference.")
+        return
+
+    print(f"\n{'backend':<13} {'load s':>7} {'chunks/s':>9} {'speedup':>8} {'R-1':>6} {'R-2':>6} {'R-L':>6}")
+    for name, result in results.items():
+        if result is None:
+            continue
+        scores = mean_scores(result["summaries"], reference["summaries"])
+        print(
+            f"{name:<13} {result['load']:>7.1f} {len(chunks) / result['seconds']:>9.2f}"
+            f" {reference['seconds'] / result['seconds']:>7.2f}x"
+            f" {scores['rouge1']:>6.3f} {scores['rouge2']:>6.3f} {scores['rougeL']:>6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+# Keep the module-level caches and job database out of the working tree
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="studyme-tests-"))
+
+from tests.openai_stub import OpenAIStub  # noqa: E402
+
+
+@pytest.fixture
+def openai_stub():
+    stub = OpenAIStub()
+    yield stub
+    stub.close()
@@ -0,0 +1,113 @@
+"""
+A local OpenAI-compatible server for tests: POST /v1/chat/completions answers from a script.
+
+    stub.script(500, (429, 0.5), "slow:2", "ok")
+
+Each entry is used by one request, in order; once the script runs out every request succeeds.
+An int is an error status, (status, seconds) adds a Retry-After header, "slow:N" answers
+after N seconds. Every request's arrival time is kept in `stub.calls`.
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = '{"bullets": ["a", "b"], "explanation": "x", "Notes": "n"}'
+USAGE = {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+
+
+class OpenAIStub:
+    def __init__(self):
+        self._script = deque()
+        self._lock = threading.Lock()
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                step = stub._begin()
+                try:
+                    stub._respond(self, body, step)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout or cancellation)
+                finally:
+                    stub._end()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def script(self, *steps):
+        with self._lock:
+            self._script.extend(steps)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _begin(self):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return self._script.popleft() if self._script else "ok"
+
+    def _end(self):
+        with self._lock:
+            self.active -= 1
+
+    def _respond(self, handler, body, step):
+        if isinstance(step, str) and step.startswith("slow:"):
+            time.sleep(float(step.split(":", 1)[1]))
+            step = "ok"
+        if step != "ok":
+            status, retry_after = step if isinstance(step, tuple) else (step, None)
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+            return _send_json(handler, status, {"error": {"message": "scripted failure", "type": "stub"}}, headers)
+        if body.get("stream"):
+            return _send_stream(handler)
+        return _send_json(handler, 200, {
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": USAGE,
+        })
+
+
+def _send_json(handler, status, payload, headers=None):
+    data = json.dumps(payload).encode()
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(data)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(data)
+
+
+def _send_stream(handler):
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Transfer-Encoding", "chunked")
+    handler.end_headers()
+
+    def event(obj):
+        line = ("data: " + (obj if isinstance(obj, str) else json.dumps(obj)) + "\n\n").encode()
+        handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        handler.wfile.flush()
+
+    chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub"}
+    for i in range(0, len(ANSWER), 8):
+        event({**chunk, "choices": [{"index": 0, "delta": {"content": ANSWER[i:i + 8]}, "finish_reason": None}]})
+    event({**chunk, "choices": [], "usage": USAGE})
+    event("[DONE]")
+    handler.wfile.write(b"0\r\n\r\n")
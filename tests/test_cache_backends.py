@@ -0,0 +1,99 @@
+import time
+
+import fakeredis
+import pytest
+
+from App.cache_backends import RedisBackend
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def backend(server):
+    return RedisBackend(client=fakeredis.FakeRedis(server=server), ttl_hours=1)
+
+
+def test_set_then_get(backend):
+    assert backend.get("a") is None
+    assert backend.set("a", '{"x": 1}')
+    payload, created = backend.get("a")
+    assert payload == '{"x": 1}'
+    assert created == pytest.approx(time.time(), abs=2)
+    assert backend.stats() == {"backend": "redis", "hits": 1, "misses": 1, "errors": 0}
+
+
+def test_keys_are_prefixed(backend, server):
+    backend.set("a", "1")
+    assert fakeredis.FakeRedis(server=server).get("studyme:cache:a") == b"1"
+
+
+def test_get_many_returns_only_present_keys(backend):
+    backend.set("a", "1")
+    backend.set("c", "3")
+    found = backend.get_many(["a", "b", "c"])
+    assert {key: payload for key, (payload, _) in found.items()} == {"a": "1", "c": "3"}
+    assert backend.get_many([]) == {}
+
+
+def test_entries_get_the_configured_ttl(backend):
+    backend.set("a", "1")
+    assert 3590 <= backend.client.ttl("studyme:cache:a") <= 3600
+
+
+def test_created_is_derived_from_the_remaining_ttl(backend):
+    backend.set("a", "1")
+    backend.client.expire("studyme:cache:a", 3600 - 600)  # as if written ten minutes ago
+    _, created = backend.get("a")
+    assert created == pytest.approx(time.time() - 600, abs=2)
+
+
+def test_entries_expire(backend):
+    backend.ttl_seconds = 1
+    backend.set("a", "1")
+    time.sleep(1.1)
+    assert backend.get("a") is None
+
+
+def test_delete(backend):
+    backend.set("a", "1")
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_lock_is_exclusive_and_released_by_its_holder_only(backend):
+    assert backend.acquire_lock("job", "token-1", 10)
+    assert not backend.acquire_lock("job", "token-2", 10)
+    backend.release_lock("job", "token-2")  # not the holder: no effect
+    assert not backend.acquire_lock("job", "token-2", 10)
+    backend.release_lock("job", "token-1")
+    assert backend.acquire_lock("job", "token-2", 10)
+
+
+def test_lock_expires(backend):
+    assert backend.acquire_lock("job", "token-1", 0.2)
+    time.sleep(0.3)
+    assert backend.acquire_lock("job", "token-2", 10)
+
+
+def test_unreachable_redis_reads_as_a_miss(backend, server):
+    backend.set("a", "1")
+    server.connected = False
+    assert backend.get("a") is None
+    assert backend.get_many(["a", "b"]) == {}
+    assert not backend.set("b", "2")
+    backend.delete("a")
+    stats = backend.stats()
+    assert stats["misses"] == 3
+    assert stats["errors"] == 4
+
+    server.connected = True
+    assert backend.get("a")[0] == "1"
+
+
+def test_fakeredis_url():
+    backend = RedisBackend("fakeredis://")
+    backend.set("a", "1")
+    assert backend.get("a")[0] == "1"
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import App.jobs as jobs
+from App.jobs import CANCELLED, DONE, FAILED, RUNNING, JobStore, JobWorker
+from App.metrics import metrics
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF")
+    return str(path)
+
+
+def run_claimed(store, monkeypatch, outcome):
+    worker = JobWorker(store, name="test-worker")
+    job = store.claim(worker.name)
+
+    def process_file(*args):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome(job["id"]) if callable(outcome) else outcome
+
+    monkeypatch.setattr(jobs, "process_file", process_file)
+    worker.run_job(job)
+    return store.get(job["id"])
+
+
+def test_job_runs_to_done(store, upload, monkeypatch):
+    store.submit(upload, "pdf")
+    row = run_claimed(store, monkeypatch, {"summary": "ok"})
+    assert row["status"] == DONE
+    assert row["error"] is None
+
+
+def test_failed_job_keeps_its_error(store, upload, monkeypatch):
+    store.submit(upload, "pdf")
+    row = run_claimed(store, monkeypatch, RuntimeError("parser crashed"))
+    assert row["status"] == FAILED
+    assert row["error"] == "parser crashed"
+
+
+def test_cancelled_job_gets_no_error_or_result(store, upload, monkeypatch):
+    store.submit(upload, "pdf")
+
+    def cancelled_then_failed(job_id):
+        assert store.cancel(job_id) == RUNNING  # only flagged while it runs
+        raise RuntimeError("interrupted")
+
+    row = run_claimed(store, monkeypatch, cancelled_then_failed)
+    assert row["status"] == CANCELLED
+    assert row["error"] is None
+    assert row["result"] is None
+
+
+def test_superseded_job_records_no_status_metric(store, upload, monkeypatch):
+    store.submit(upload, "pdf")
+
+    def requeued_meanwhile(job_id):
+        store.requeue_stale(max_age=-1)
+        return {"summary": "late"}
+
+    before = metrics.snapshot()["counters"]
+    row = run_claimed(store, monkeypatch, requeued_meanwhile)
+    counters = metrics.snapshot()["counters"]
+    assert row["status"] == "queued"
+    assert "jobs.None" not in counters
+    assert counters.get("jobs.superseded", 0) == before.get("jobs.superseded", 0) + 1
+    assert os.path.exists(upload)  # the worker that picks it up again still needs the file
+
+
+def age(store, job_id, **columns):
+    """Moves a job's timestamps into the past by the given number of seconds."""
+    with store._connect() as conn:
+        for column, seconds in columns.items():
+            conn.execute(f"UPDATE jobs SET {column} = {column} - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_long_job_with_a_fresh_heartbeat_is_not_requeued(store, upload):
+    job_id = store.submit(upload, "pdf")
+    store.claim("worker-a")
+    age(store, job_id, started=7200, heartbeat=7200)
+    assert store.heartbeat(job_id, "worker-a")
+    assert store.requeue_stale() == 0
+    assert store.get(job_id)["status"] == RUNNING
+
+
+def test_job_of_a_dead_worker_is_requeued_by_the_next_sweep(store, upload):
+    job_id = store.submit(upload, "pdf")
+    store.claim("worker-a")
+    age(store, job_id, heartbeat=jobs.JOB_STALE_SECONDS + 1)
+    JobWorker(store, name="worker-b").sweep()
+    row = store.get(job_id)
+    assert row["status"] == "queued"
+    assert row["worker"] is None
+
+
+def test_heartbeat_fails_once_the_job_moved_on(store, upload):
+    job_id = store.submit(upload, "pdf")
+    store.claim("worker-a")
+    assert not store.heartbeat(job_id, "worker-b")
+    store.requeue_stale(max_age=-1)
+    assert not store.heartbeat(job_id, "worker-a")
+
+
+def test_former_worker_cannot_finish_a_reclaimed_job(store, upload):
+    job_id = store.submit(upload, "pdf")
+    store.claim("worker-a")
+    store.requeue_stale(max_age=-1)
+    store.claim("worker-b")
+    assert store.finish(job_id, DONE, result={"summary": "late"}, worker="worker-a") is None
+    assert store.finish(job_id, DONE, result={"summary": "ok"}, worker="worker-b") == DONE
+    assert json.loads(store.get(job_id)["result"]) == {"summary": "ok"}
+
+
+def test_running_job_keeps_its_heartbeat_fresh(store, upload, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    store.submit(upload, "pdf")
+    beats = []
+
+    def slow_job(job_id):
+        first = store.get(job_id)["heartbeat"]
+        time.sleep(0.3)
+        beats.append(store.get(job_id)["heartbeat"] - first)
+        return {"summary": "ok"}
+
+    assert run_claimed(store, monkeypatch, slow_job)["status"] == DONE
+    assert beats[0] > 0.1
+
+
+def test_dead_job_being_cancelled_is_cancelled(store, upload):
+    job_id = store.submit(upload, "pdf")
+    store.claim("worker-a")
+    store.cancel(job_id)
+    age(store, job_id, heartbeat=jobs.JOB_STALE_SECONDS + 1)
+    assert store.requeue_stale() == 0
+    assert store.get(job_id)["status"] == CANCELLED
+    assert not os.path.exists(upload)
+
+
+def test_old_databases_get_the_heartbeat_column(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0,"
+            " file_path TEXT NOT NULL, file_type TEXT NOT NULL, filename TEXT,"
+            " generate_flashcards INTEGER NOT NULL DEFAULT 0,"
+            " submitted REAL NOT NULL, started REAL, finished REAL, worker TEXT,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT)"
+        )
+    store = JobStore(path)
+    store.submit(str(tmp_path / "upload.pdf"), "pdf")
+    assert store.claim("worker-a")["heartbeat"] is not None
@@ -0,0 +1,302 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+import App.llm as llm_module
+from App.llm import CircuitOpenError, LLMDeadlineExceeded, LLMGateway, RateBucket
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_BACKOFF_BASE", 0.01)
+
+
+def make_gateway(stub, **kwargs):
+    gateway = LLMGateway(base_url=stub.base_url, api_key="test-key", **kwargs)
+    gateway.breaker.failures = 100  # tests that exercise the breaker lower this themselves
+    return gateway
+
+
+def chat(gateway, **kwargs):
+    return gateway.chat(model="gpt-test", messages=MESSAGES, **kwargs)
+
+
+async def achat(gateway, **kwargs):
+    return await gateway.achat(model="gpt-test", messages=MESSAGES, **kwargs)
+
+
+def open_breaker(gateway, reset):
+    gateway.breaker.reset = reset
+    gateway.breaker.failures = 1
+    gateway.breaker.record_failure()
+    assert gateway.breaker.state == "open"
+
+
+# === Token buckets ===
+
+def test_rate_bucket_reserve_returns_wait():
+    bucket = RateBucket(60, capacity=2)  # one per second
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_rate_bucket_adjust_gives_tokens_back():
+    bucket = RateBucket(60, capacity=10)
+    bucket.reserve(10)
+    bucket.adjust(5)
+    assert bucket.tokens == pytest.approx(5, abs=0.1)
+
+
+def test_request_bucket_spaces_out_calls(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.requests = RateBucket(120, capacity=1)  # one call every 0.5s
+    for _ in range(3):
+        chat(gateway)
+    gaps = [b - a for a, b in zip(openai_stub.calls, openai_stub.calls[1:])]
+    assert all(gap >= 0.4 for gap in gaps), gaps
+
+
+def test_token_bucket_waits_for_tokens(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.tokens = RateBucket(6000, capacity=200)  # 100 tokens per second
+    gateway.tokens.reserve(200)
+    start = time.monotonic()
+    chat(gateway, max_tokens=30)
+    assert 0.25 <= time.monotonic() - start < 1.5
+
+
+def test_unused_token_reservation_is_given_back(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.tokens = RateBucket(6000, capacity=200)
+    chat(gateway, max_tokens=200)
+    start = time.monotonic()
+    # The first call used 30 tokens, not 200, so the second one does not wait
+    chat(gateway, max_tokens=100)
+    assert time.monotonic() - start < 0.2
+
+
+def test_rate_wait_longer_than_deadline_fails_fast(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.requests = RateBucket(6, capacity=1)  # one call every 10s
+    gateway.tokens = RateBucket(60, capacity=1000)
+    chat(gateway, max_tokens=200)
+    start = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        chat(gateway, deadline=1, max_tokens=200)
+    assert time.monotonic() - start < 0.5
+    assert len(openai_stub.calls) == 1
+    # The call that gave up hands back its request slot and its tokens
+    assert gateway.requests.tokens == pytest.approx(0, abs=0.1)
+    assert gateway.tokens.tokens == pytest.approx(1000 - 30, abs=2)
+
+
+def test_failed_attempts_give_their_tokens_back(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.tokens = RateBucket(60, capacity=1000)  # refills one token per second
+    openai_stub.script((429, 0), 500)
+    chat(gateway, max_tokens=200)
+    assert len(openai_stub.calls) == 3
+    # Only the successful attempt's 30 tokens are spent, not three 200-token reservations
+    assert gateway.tokens.tokens == pytest.approx(1000 - 30, abs=2)
+
+
+def test_async_failed_attempts_give_their_tokens_back(openai_stub):
+    gateway = make_gateway(openai_stub)
+    gateway.tokens = RateBucket(60, capacity=1000)
+    openai_stub.script(503, 502)
+    asyncio.run(achat(gateway, max_tokens=200))
+    assert gateway.tokens.tokens == pytest.approx(1000 - 30, abs=2)
+
+
+# === Retries and backoff ===
+
+def test_retries_5xx_then_succeeds(openai_stub):
+    openai_stub.script(500, 503)
+    response = chat(make_gateway(openai_stub))
+    assert response.choices[0].message.content
+    assert len(openai_stub.calls) == 3
+
+
+def test_429_honours_retry_after(openai_stub):
+    openai_stub.script((429, 0.5))
+    chat(make_gateway(openai_stub))
+    assert len(openai_stub.calls) == 2
+    assert openai_stub.calls[1] - openai_stub.calls[0] >= 0.45
+
+
+def test_client_errors_are_not_retried(openai_stub):
+    openai_stub.script(400)
+    with pytest.raises(openai.BadRequestError):
+        chat(make_gateway(openai_stub))
+    assert len(openai_stub.calls) == 1
+
+
+def test_gives_up_after_max_retries(openai_stub):
+    openai_stub.script(500, 500, 500, 500)
+    with pytest.raises(openai.InternalServerError):
+        chat(make_gateway(openai_stub, max_retries=2))
+    assert len(openai_stub.calls) == 3
+
+
+def test_backoff_that_would_pass_the_deadline_gives_up(openai_stub):
+    openai_stub.script((503, 5))
+    start = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        chat(make_gateway(openai_stub), deadline=1)
+    assert time.monotonic() - start < 0.5
+
+
+# === Deadlines ===
+
+def test_deadline_bounds_a_slow_response(openai_stub):
+    openai_stub.script("slow:3", "slow:3")
+    start = time.monotonic()
+    with pytest.raises((LLMDeadlineExceeded, openai.APITimeoutError)):
+        chat(make_gateway(openai_stub), deadline=0.5)
+    assert time.monotonic() - start < 1.5
+
+
+def test_async_deadline_bounds_a_slow_response(openai_stub):
+    openai_stub.script("slow:3", "slow:3")
+    start = time.monotonic()
+    with pytest.raises((LLMDeadlineExceeded, openai.APITimeoutError)):
+        asyncio.run(achat(make_gateway(openai_stub), deadline=0.5))
+    assert time.monotonic() - start < 1.5
+
+
+def test_stream_yields_chunks_and_settles_usage(openai_stub):
+    gateway = make_gateway(openai_stub)
+    chunks = list(gateway.chat_stream(model="gpt-test", messages=MESSAGES))
+    text = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+    assert text.startswith('{"bullets"')
+    assert gateway._slots.in_use == 0
+
+
+# === Circuit breaker ===
+
+def test_breaker_opens_rejects_then_half_open_trial_closes_it(openai_stub):
+    gateway = make_gateway(openai_stub, max_retries=0)
+    gateway.breaker.failures = 2
+    gateway.breaker.reset = 0.3
+    openai_stub.script(500, 500)
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            chat(gateway)
+    assert gateway.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        chat(gateway)
+    assert len(openai_stub.calls) == 2  # rejected without reaching the API
+
+    time.sleep(0.35)
+    assert gateway.breaker.state == "half-open"
+    chat(gateway)
+    assert gateway.breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker(openai_stub):
+    gateway = make_gateway(openai_stub, max_retries=0)
+    open_breaker(gateway, reset=0.2)
+    time.sleep(0.25)
+    openai_stub.script(502)
+    with pytest.raises(openai.InternalServerError):
+        chat(gateway)
+    assert gateway.breaker.state == "open"
+    assert not gateway.breaker.trial_running
+
+
+def test_only_one_trial_while_half_open(openai_stub):
+    gateway = make_gateway(openai_stub)
+    open_breaker(gateway, reset=0.1)
+    time.sleep(0.15)
+    openai_stub.script("slow:0.5")
+    trial = threading.Thread(target=chat, args=(gateway,))
+    trial.start()
+    time.sleep(0.2)
+    with pytest.raises(CircuitOpenError):
+        chat(gateway)
+    trial.join()
+    assert gateway.breaker.state == "closed"
+
+
+def test_cancelled_trial_does_not_wedge_the_breaker(openai_stub):
+    gateway = make_gateway(openai_stub)
+    open_breaker(gateway, reset=0.2)
+    time.sleep(0.25)
+    openai_stub.script("slow:2")
+
+    async def cancel_trial():
+        task = asyncio.create_task(achat(gateway))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert not gateway.breaker.trial_running
+    assert gateway.breaker.state == "open"  # counted as a failed trial
+
+    time.sleep(0.25)
+    chat(gateway)
+    assert gateway.breaker.state == "closed"
+
+
+def test_trial_past_its_deadline_does_not_wedge_the_breaker(openai_stub):
+    gateway = make_gateway(openai_stub)
+    open_breaker(gateway, reset=0.2)
+    time.sleep(0.25)
+    gateway.requests = RateBucket(6, capacity=1)
+    gateway.requests.reserve()  # the trial would have to wait ~10s for its request slot
+    with pytest.raises(LLMDeadlineExceeded):
+        chat(gateway, deadline=0.5)
+    assert not gateway.breaker.trial_running
+
+    gateway.requests = RateBucket(6000)
+    time.sleep(0.25)
+    chat(gateway)
+    assert gateway.breaker.state == "closed"
+
+
+# === Shared concurrency cap ===
+
+def test_threads_and_coroutines_share_one_concurrency_cap(openai_stub):
+    gateway = make_gateway(openai_stub, max_concurrency=2)
+    openai_stub.script(*["slow:0.2"] * 6)
+    threads = [threading.Thread(target=chat, args=(gateway,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+
+    async def coroutines():
+        await asyncio.gather(*(achat(gateway) for _ in range(3)))
+
+    asyncio.run(coroutines())
+    for thread in threads:
+        thread.join()
+    assert len(openai_stub.calls) == 6
+    assert openai_stub.peak <= 2
+    assert gateway._slots.in_use == 0
+
+
+def test_cancelled_waiter_gives_its_slot_back(openai_stub):
+    gateway = make_gateway(openai_stub, max_concurrency=1)
+    openai_stub.script("slow:0.3")
+
+    async def scenario():
+        holder = asyncio.create_task(achat(gateway))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(achat(gateway))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await holder
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await achat(gateway)  # would hang if the cancelled waiter had kept a slot
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert gateway._slots.in_use == 0
@@ -0,0 +1,53 @@
+from App.prefilter import is_boilerplate, reduce_text
+
+
+def lines_of(text):
+    return [line for line in text.splitlines() if line.strip()]
+
+
+def test_marked_page_numbers_are_boilerplate():
+    for line in ("Page 3", "page 3 of 12", "Slide 7", "p. 12", "3 of 12", "- 4 -", "📝 Speaker Notes:"):
+        assert is_boilerplate(line), line
+
+
+def test_bare_numbers_are_not_boilerplate_on_their_own():
+    for line in ("1924", "2021", "88", "2026", "3/4"):
+        assert not is_boilerplate(line), line
+
+
+def test_numeric_content_lines_survive():
+    text = "\n\n".join([
+        "The treaty was signed in\n1924\nafter years of talks.",
+        "Enrolment peaked in\n2021",
+        "Average score\n88",
+        "Projected completion:\n2026\nsubject to funding.",
+    ])
+    reduced, stats = reduce_text(text)
+    kept = lines_of(reduced)
+    for number in ("1924", "2021", "88", "2026"):
+        assert number in kept
+    assert stats["boilerplate_lines"] == 0
+
+
+def test_bare_page_numbers_at_page_edges_are_dropped():
+    topics = ["light reactions", "the Calvin cycle", "chlorophyll", "stomata", "C4 plants"]
+    pages = [f"{n}\nNotes on {topic}.\n{1900 + 7 * n}" for n, topic in enumerate(topics, 1)]
+    reduced, stats = reduce_text("\n\n".join(pages))
+    kept = lines_of(reduced)
+    for n in range(1, 6):
+        assert str(n) not in kept
+    assert stats["boilerplate_lines"] == 5
+    for n in range(1, 6):
+        assert str(1900 + 7 * n) in kept  # at a page edge, but not a run of page numbers
+
+
+def test_numbers_in_the_middle_of_a_page_survive_page_numbering():
+    pages = [
+        f"Chapter heading {n}\nThe count was\n{40 + n}\nby the end of the study in week {n}.\nFooter text {n}\n{n}"
+        for n in range(1, 5)
+    ]
+    reduced, _ = reduce_text("\n\n".join(pages))
+    kept = lines_of(reduced)
+    for n in range(1, 5):
+        assert str(40 + n) in kept
+        assert str(n) not in kept
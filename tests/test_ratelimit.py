@@ -0,0 +1,81 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from App.middleware import RateLimitMiddleware
+from App.ratelimit import GCRALimiter, parse_route_costs, route_cost
+
+
+def make_client(max_requests=10, status_max_requests=120, route_costs=None):
+    app = FastAPI()
+
+    @app.post("/jobs")
+    def submit():
+        return {"job_id": "abc"}
+
+    @app.get("/jobs/{job_id}")
+    def status(job_id: str):
+        return {"job_id": job_id, "status": "running"}
+
+    @app.get("/jobs/{job_id}/result")
+    def result(job_id: str):
+        return {"job_id": job_id}
+
+    @app.get("/flashcards")
+    def flashcards():
+        return {}
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        max_requests=max_requests,
+        window_seconds=60,
+        route_costs=route_costs,
+        limiter=GCRALimiter(max_requests, 60),
+        status_limiter=GCRALimiter(status_max_requests, 60),
+    )
+    return TestClient(app)
+
+
+def test_route_cost_prefers_method_specific_entries():
+    costs = {"/jobs": 2, "POST /jobs": 5}
+    assert route_cost(costs, "POST", "/jobs") == 5
+    assert route_cost(costs, "GET", "/jobs") == 2
+    assert route_cost(costs, "GET", "/other") == 1
+
+
+def test_parse_route_costs_accepts_methods():
+    costs = parse_route_costs("GET  /jobs/{job_id}=0.5, /explain=4")
+    assert costs["GET /jobs/{job_id}"] == 0.5
+    assert costs["/explain"] == 4
+    assert costs["POST /jobs"] == 5  # defaults are kept
+
+
+def test_polling_a_job_does_not_use_the_work_budget():
+    client = make_client(max_requests=10)
+    assert client.post("/jobs").status_code == 200
+    for _ in range(30):
+        assert client.get("/jobs/abc").status_code == 200
+        assert client.get("/jobs/abc/result").status_code == 200
+    assert client.post("/jobs").status_code == 200  # 5 + 5 of 10
+
+
+def test_submitting_a_job_costs_five():
+    client = make_client(max_requests=10)
+    assert client.post("/jobs").status_code == 200
+    assert client.post("/jobs").status_code == 200
+    response = client.post("/jobs")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_polling_has_its_own_limit():
+    client = make_client(status_max_requests=5)
+    for _ in range(5):
+        assert client.get("/jobs/abc").status_code == 200
+    assert client.get("/jobs/other").status_code == 429  # same template, same budget
+    assert client.get("/flashcards").status_code == 200
+
+
+def test_costs_match_the_template_not_the_raw_path():
+    client = make_client(max_requests=4, route_costs=parse_route_costs("GET /jobs/{job_id}=0"))
+    for job_id in range(20):
+        assert client.get(f"/jobs/{job_id}").status_code == 200  # cost 0: not limited at all
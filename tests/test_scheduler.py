@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+import App.scheduler as scheduler
+from App.scheduler import Stage, StageSkipped, run_stages
+
+
+@pytest.fixture
+def one_thread(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(scheduler, "_executor", pool)
+    yield pool
+    pool.shutdown()
+
+
+def producer(ready, value="bullets", after=0.1, error=None, before=0):
+    """A stage that resolves `ready` after `before` seconds, then keeps running for `after`."""
+    def run():
+        time.sleep(before)
+        if error is not None:
+            ready.set_exception(error)
+            raise error
+        if value is not None:
+            ready.set_result(value)
+        time.sleep(after)
+        return "explanation"
+    return run
+
+
+def test_ready_stage_waits_without_holding_a_pool_thread(one_thread):
+    ready = Future()
+
+    def consumer(bullets):
+        return f"searched {bullets}"
+
+    # With one pool thread, a consumer parked on `ready` would deadlock the producer
+    report = run_stages([
+        Stage("search", consumer, ready=ready, ready_by="explanation", timeout=5),
+        Stage("explanation", producer(ready), timeout=5),
+    ])
+    assert report["search"].value == "searched bullets"
+    assert report["explanation"].value == "explanation"
+    assert report["search"].started >= report["explanation"].started
+
+
+def test_ready_stage_starts_before_its_producer_finishes():
+    ready = Future()
+    report = run_stages([
+        Stage("explanation", producer(ready, after=0.3)),
+        Stage("search", lambda bullets: bullets, ready=ready, ready_by="explanation"),
+    ])
+    assert report["search"].finished < report["explanation"].finished
+    assert report.critical_path() == ["explanation"]
+
+
+def test_critical_path_follows_the_ready_signal():
+    ready = Future()
+
+    def slow_search(bullets):
+        time.sleep(0.3)
+        return bullets
+
+    report = run_stages([
+        Stage("explanation", producer(ready, after=0.05)),
+        Stage("search", slow_search, ready=ready, ready_by="explanation"),
+    ])
+    assert report.critical_path() == ["explanation", "search"]
+
+
+def test_ready_stage_is_skipped_when_its_producer_never_signals():
+    ready = Future()
+    report = run_stages([
+        Stage("explanation", producer(ready, value=None, after=0)),
+        Stage("search", lambda bullets: bullets, ready=ready, ready_by="explanation"),
+    ])
+    assert isinstance(report["search"].error, StageSkipped)
+
+
+def test_ready_stage_is_skipped_when_the_signal_fails():
+    ready = Future()
+    report = run_stages([
+        Stage("explanation", producer(ready, error=RuntimeError("model down"))),
+        Stage("search", lambda bullets: bullets, ready=ready, ready_by="explanation"),
+    ])
+    assert isinstance(report["explanation"].error, RuntimeError)
+    assert isinstance(report["search"].error, StageSkipped)
+
+
+def test_ready_timeout_starts_when_the_stage_is_submitted():
+    ready = Future()
+    report = run_stages([
+        Stage("explanation", producer(ready, before=0.3, after=0), timeout=5),
+        Stage("search", lambda bullets: bullets, ready=ready, ready_by="explanation", timeout=0.2),
+    ])
+    assert report["search"].ok
+
+
+def test_ready_needs_a_known_producer():
+    with pytest.raises(ValueError):
+        run_stages([Stage("search", lambda bullets: bullets, ready=Future())])
+    with pytest.raises(ValueError):
+        run_stages([Stage("search", lambda bullets: bullets, ready=Future(), ready_by="nope")])
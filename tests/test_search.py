@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import App.search as search
+from App.cache import SimpleCache
+from App.cache_backends import RedisBackend
+from App.search import SearchExecutor, TokenBucket, normalize_term
+
+
+class FakeGoogleSearch:
+    """Stands in for serpapi.GoogleSearch: records queries, optionally slow or failing."""
+
+    calls = []
+    delay = 0.0
+    lock = threading.Lock()
+    active = peak = 0
+
+    def __init__(self, params):
+        self.params = params
+        self.timeout = None
+
+    def get_dict(self):
+        cls = FakeGoogleSearch
+        with cls.lock:
+            cls.calls.append((self.params["q"], time.monotonic()))
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            if self.params["q"].startswith("slow"):
+                if self.timeout is not None and self.timeout < 1:
+                    time.sleep(self.timeout)
+                    raise requests.Timeout(f"Read timed out. (read timeout={self.timeout})")
+                time.sleep(1)
+            elif cls.delay:
+                time.sleep(cls.delay)
+            if self.params["q"].startswith("broken"):
+                raise requests.ConnectionError("connection refused")
+            return {"organic_results": [
+                {"title": f"About {self.params['q']}", "link": f"https://example.com/{self.params['q']}"},
+                {"title": "Redirect only", "redirect_link": "https://example.com/r"},
+            ]}
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def fake_serpapi(monkeypatch):
+    FakeGoogleSearch.calls = []
+    FakeGoogleSearch.delay = 0.0
+    FakeGoogleSearch.active = FakeGoogleSearch.peak = 0
+    monkeypatch.setattr(search, "GoogleSearch", FakeGoogleSearch)
+    # A fresh cache per test so term results never leak between them
+    monkeypatch.setattr(search, "document_cache", SimpleCache(RedisBackend("fakeredis://")))
+    return FakeGoogleSearch
+
+
+def queries():
+    return [query for query, _ in FakeGoogleSearch.calls]
+
+
+def test_normalize_term():
+    assert normalize_term("  Photosynthesis. ") == "photosynthesis"
+    assert normalize_term("Cell   Wall") == normalize_term("cell wall")
+
+
+def test_results_keep_title_and_link():
+    results = SearchExecutor(rate_per_sec=100).search_terms(["Mitosis"], "key")
+    assert results["Mitosis"] == [
+        {"title": "About mitosis", "link": "https://example.com/mitosis"},
+        {"title": "Redirect only", "link": "https://example.com/r"},
+    ]
+
+
+def test_each_term_is_cached_individually():
+    executor = SearchExecutor(rate_per_sec=100)
+    executor.search_terms(["mitosis", "meiosis"], "key")
+    results = executor.search_terms(["Mitosis", "osmosis"], "key")
+    assert sorted(queries()) == ["meiosis", "mitosis", "osmosis"]
+    assert results["Mitosis"][0]["title"] == "About mitosis"
+    assert executor.stats["cache_hits"] == 1
+    assert executor.stats["fetches"] == 3
+
+
+def test_cache_is_shared_between_executors():
+    SearchExecutor(rate_per_sec=100).search_terms(["mitosis"], "key")
+    SearchExecutor(rate_per_sec=100).search_terms(["mitosis"], "key")
+    assert queries() == ["mitosis"]
+
+
+def test_expired_term_results_are_fetched_again():
+    executor = SearchExecutor(rate_per_sec=100, ttl=0.2)
+    executor.search_terms(["mitosis"], "key")
+    time.sleep(0.3)
+    executor.search_terms(["mitosis"], "key")
+    assert queries() == ["mitosis", "mitosis"]
+
+
+def test_duplicate_terms_in_one_call_are_fetched_once():
+    results = SearchExecutor(rate_per_sec=100).search_terms(["Mitosis", "mitosis ", "MITOSIS."], "key")
+    assert queries() == ["mitosis"]
+    assert len(results) == 3
+
+
+def test_in_flight_terms_are_coalesced_across_requests(fake_serpapi):
+    fake_serpapi.delay = 0.3
+    executor = SearchExecutor(rate_per_sec=100)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(executor.search_terms(["mitosis"], "key")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert queries() == ["mitosis"]
+    assert executor.stats["coalesced"] == 3
+    assert all(r["mitosis"][0]["title"] == "About mitosis" for r in results)
+    assert executor._inflight == {}
+
+
+def test_concurrency_is_bounded(fake_serpapi):
+    fake_serpapi.delay = 0.1
+    executor = SearchExecutor(max_workers=2, rate_per_sec=100)
+    executor.search_terms([f"term {i}" for i in range(6)], "key")
+    assert len(queries()) == 6
+    assert fake_serpapi.peak == 2
+
+
+def test_token_bucket_paces_calls_per_key():
+    executor = SearchExecutor(rate_per_sec=5)  # burst of 5, then one every 0.2s
+    executor.search_terms([f"term {i}" for i in range(8)], "key")
+    times = sorted(t for _, t in FakeGoogleSearch.calls)
+    assert times[4] - times[0] < 0.1  # the burst goes out at once
+    for i in range(5, len(times)):
+        assert times[i] - times[i - 1] >= 0.18  # then one call per token
+
+
+def test_each_api_key_gets_its_own_bucket():
+    executor = SearchExecutor(rate_per_sec=2)
+    start = time.monotonic()
+    executor.search_terms(["a", "b"], "key-1")
+    executor.search_terms(["c", "d"], "key-2")
+    assert time.monotonic() - start < 0.3
+
+
+def test_token_bucket_blocks_until_a_token_is_free():
+    bucket = TokenBucket(10, burst=1)
+    bucket.acquire()
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+
+def test_timed_out_term_maps_to_empty_and_others_still_return(monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_TIMEOUT", 0.2)
+    executor = SearchExecutor(rate_per_sec=100)
+    start = time.monotonic()
+    results = executor.search_terms(["slow term", "mitosis"], "key")
+    assert time.monotonic() - start < 0.8
+    assert results["slow term"] == []
+    assert results["mitosis"][0]["title"] == "About mitosis"
+    assert executor.stats["errors"] == 1
+
+
+def test_failures_are_not_cached():
+    executor = SearchExecutor(rate_per_sec=100)
+    assert executor.search_terms(["broken link"], "key") == {"broken link": []}
+    executor.search_terms(["broken link"], "key")
+    assert queries() == ["broken link", "broken link"]
+    assert executor.stats["errors"] == 2
@@ -0,0 +1,33 @@
+from App.summarizer import make_batches, summarize_chunks, summary_lengths
+
+
+class RecordingSummarizer:
+    """Records the lengths each batch was generated with."""
+
+    def __init__(self):
+        self.batches = []
+
+    def summarize(self, texts, max_length, min_length):
+        self.batches.append((len(texts), max_length, min_length))
+        return [f"summary of {len(text.split())} words" for text in texts]
+
+
+def words(n):
+    return " ".join(["word"] * n)
+
+
+def test_short_tail_chunk_does_not_cap_full_chunks():
+    chunks = [words(750)] * 3 + [words(40)]
+    summarizer = RecordingSummarizer()
+    summaries = summarize_chunks(chunks, batch_size=8, summarizer=summarizer)
+    assert summaries == ["summary of 750 words"] * 3 + ["summary of 40 words"]
+    assert sorted(summarizer.batches) == [(1, 50, 25), (3, 300, 150)]
+
+
+def test_batches_share_summary_lengths_and_respect_batch_size():
+    chunks = [words(n) for n in (750, 700, 650, 600, 120, 110, 30, 800)]
+    batches = make_batches(chunks, batch_size=3)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(chunks)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len({summary_lengths(len(chunks[i].split())) for i in batch}) == 1